@@ -1,34 +1,55 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
 from app.models import User
 from app.config import settings
-
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.services.password_hasher import HasherBusy, hash_password, password_hasher
+from app.services.principal_cache import password_fingerprint, principal_cache
 
 # OAuth2 密码流
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
+def _truncate_password(password: str) -> str:
     # bcrypt 限制密码长度不能超过 72 字节
     # 如果密码超过 72 字节，截断它
     password_bytes = password.encode('utf-8')
     if len(password_bytes) > 72:
         password = password_bytes[:72].decode('utf-8', errors='ignore')
-    return pwd_context.hash(password)
+    return password
+
+
+def get_password_hash(password: str) -> str:
+    """生成密码哈希"""
+    return hash_password(_truncate_password(password))
+
+
+def _busy_exception(e: HasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在哈希池中验证密码，池满时抛出 429"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy as e:
+        raise _busy_exception(e)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在哈希池中生成密码哈希，池满时抛出 429"""
+    try:
+        return await password_hasher.hash(_truncate_password(password))
+    except HasherBusy as e:
+        raise _busy_exception(e)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -43,11 +64,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """获取当前登录用户"""
+def create_user_token(user: User) -> str:
+    """为用户签发 token，携带用户ID和密码指纹，认证时无需按用户名查库"""
+    return create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "pwd": password_fingerprint(user.password_hash),
+    })
+
+
+async def _load_user(user_id: str | None, username: str) -> Optional[User]:
+    """缓存未命中时查询数据库，返回与会话分离的 User"""
+    async with AsyncSessionLocal() as db:
+        if user_id is not None:
+            user = await db.get(User, user_id)
+        else:
+            # 旧版本签发的 token 没有 uid，只能按用户名查找
+            result = await db.execute(select(User).where(User.username == username))
+            user = result.scalar_one_or_none()
+        if user is not None:
+            db.expunge(user)
+        return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    """获取当前登录用户
+
+    用户信息优先从进程内缓存读取，命中时整个认证过程不访问数据库。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无效的认证凭据",
@@ -60,9 +104,20 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+
+    user_id = payload.get("uid")
+    user = principal_cache.get(user_id) if user_id is not None else None
     if user is None:
+        user = await _load_user(user_id, username)
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(user)
+
+    # 用户改名或修改密码后，之前签发的 token 不再有效
+    if user.username != username:
+        raise credentials_exception
+    fingerprint = payload.get("pwd")
+    if fingerprint is not None and fingerprint != password_fingerprint(user.password_hash):
         raise credentials_exception
     return user
 
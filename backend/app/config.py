@@ -9,15 +9,128 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_api_base: str | None = None
     openai_model: str = "gpt-3.5-turbo"
+
+    # AI流式调用配置（共享的异步HTTP连接池）
+    ai_max_connections: int = 100  # 连接池最大连接数
+    ai_max_keepalive_connections: int = 20  # 保持活跃的空闲连接数
+    ai_keepalive_expiry: float = 30.0  # 空闲连接保留时间（秒）
+    ai_connect_timeout: float = 10.0  # 建立连接超时（秒）
+    ai_read_timeout: float = 120.0  # 两次读取之间的超时（秒）
+    ai_max_concurrency: int = 200  # 同时进行的上游流式请求上限
+    ai_max_retries: int = 2
+
+    # AI 准入调度：同时进行的生成总数和每个用户的并发，超出的请求按用户加权轮询排队
+    ai_scheduler_max_active: int = 100
+    ai_scheduler_max_queue: int = 1000  # 全部用户排队请求的上限，超出返回 429
+    ai_user_max_active: int = 3
+    ai_user_max_queue: int = 10
+    ai_user_requests_per_minute: float = 30  # 每个用户的请求速率，0 表示不限
+    ai_user_tokens_per_hour: float = 200_000  # 每个用户每小时的 token 预算（按字节数估算），0 表示不限
+    ai_user_weights: dict[str, int] = {}  # 用户名 -> 轮询权重，未列出的用户为 1
+
+    # 长文档模式：超过阈值的文本切分后并发润色
+    ai_long_doc_threshold: int = 3000  # 触发长文档模式的字符数
+    ai_long_doc_chunk_chars: int = 1500  # 每个片段的目标字符数，需保证润色结果不超过 max_tokens
+    ai_long_doc_workers: int = 4  # 单个请求同时润色的片段数
+
+    # AI流式响应断线续传：客户端断开后上游调用再保留 grace 秒，期间带 Last-Event-ID 重连可以接着收；
+    # 调用结束后已生成的内容再保留 retain 秒。grace 为 0 时断开立即取消上游调用
+    ai_resume_grace_seconds: float = 5.0
+    ai_resume_retain_seconds: float = 60.0
+    ai_resume_max_buffers: int = 1000  # 保留的已结束调用数上限
+
+    # AI流式响应的 SSE 帧：时间窗口内到达的 token 合并成一个事件发送，第一个事件不等待；0 表示逐个发送
+    ai_sse_coalesce_ms: float = 30.0
+    ai_sse_max_frame_chars: int = 2048  # 累积到这么多字符时不等窗口结束立即发送
+    # 事件流压缩：按优先顺序列出允许的格式（如 gzip,deflate），按客户端 Accept-Encoding 选择，留空不压缩
+    ai_sse_compression: str = ""
+    ai_sse_compression_level: int = 6
+
+    # AI响应缓存配置
+    ai_cache_enabled: bool = True
+    ai_cache_backend: str = "memory"  # memory 或 sqlite
+    ai_cache_path: str = "./data/ai_cache.db"  # sqlite 后端的数据库文件
+    ai_cache_max_entries: int = 1000
+    ai_cache_ttl_seconds: int = 24 * 3600
     secret_key: str = "dev-secret-key-change-in-production"
     
     # JWT配置
     jwt_algorithm: str = "HS256"
     jwt_expire_hours: int = 24 * 7
+
+    # 密码哈希：bcrypt 在独立的有界池中执行，排队超过上限时登录/注册返回 429
+    auth_bcrypt_rounds: int = 12  # bcrypt 成本参数，每加 1 计算量翻倍
+    auth_hash_workers: int = 2
+    auth_hash_max_pending: int = 32  # 正在执行和排队的哈希任务上限
+    auth_hash_executor: str = "thread"  # thread 或 process
+
+    # 认证用户缓存：命中时认证不访问数据库，TTL 为其他进程中修改的最长生效延迟
+    auth_cache_max_entries: int = 10000  # 0 表示关闭缓存
+    auth_cache_ttl_seconds: float = 60.0
     
     # 数据库配置
     database_url: str = "sqlite:///./data/notes.db"  # 改为 data 目录
+
+    # SQLite 连接参数：WAL 模式下读写互不阻塞，写锁冲突时等待 busy_timeout 而不是直接报 database is locked
+    db_sqlite_journal_mode: str = "WAL"
+    db_sqlite_synchronous: str = "NORMAL"  # WAL 下 NORMAL 只在检查点时 fsync，断电最多丢失最近的事务
+    db_sqlite_busy_timeout_ms: int = 5000
+    db_sqlite_cache_size_kib: int = 64 * 1024  # 每个连接的页缓存大小
+    db_sqlite_mmap_size: int = 256 * 1024 * 1024  # 内存映射读取的字节数，0 表示关闭
+
+    # PostgreSQL 等服务端数据库的连接池
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0  # 等待空闲连接的超时（秒）
+    db_pool_recycle: int = 1800  # 连接最长使用时间（秒），避免被服务端或中间代理断开
+    db_pool_pre_ping: bool = True  # 取出连接时先检测是否可用
     
+    # WebSocket 编辑写回缓冲：编辑先在内存中合并，按时间或累积量批量写回数据库
+    ws_flush_interval: float = 1.0  # 秒
+    ws_flush_max_edits: int = 200  # 单条笔记累积的编辑次数
+    ws_flush_max_chars: int = 100_000  # 单条笔记累积修改的字符数
+
+    # 文件上传
+    upload_max_bytes: int = 20 * 1024 * 1024  # 单个文件大小上限
+
+    # 增量同步：删除记录的保留天数，游标早于已清理记录的客户端需要全量同步
+    sync_tombstone_retention_days: int = 30
+
+    # 批量操作接口（/api/notes/batch/*）单次请求的笔记数上限
+    notes_batch_max_items: int = 500
+
+    # 笔记批量导入 / 导出
+    notes_import_batch_size: int = 1000  # 每个事务插入的笔记数
+    notes_import_max_bytes: int = 512 * 1024 * 1024  # 导入文件大小上限
+    notes_import_max_note_bytes: int = 5 * 1024 * 1024  # 单条笔记（NDJSON 一行或一个 Markdown 文件）上限
+
+    # 图片衍生图（缩略图 / WebP），需要安装 Pillow
+    image_variants_enabled: bool = True
+    image_variant_workers: int = 2  # 生成衍生图的进程数
+    image_variant_quality: int = 80  # WebP 质量
+
+    # WebSocket 发送队列：积压超过上限或单次发送超时的慢客户端会被断开，由客户端重连后重新同步
+    ws_send_queue_size: int = 256
+    ws_send_timeout: float = 10.0  # 秒
+
+    # WebSocket 广播总线：memory 只在本进程内广播；多 worker / 多节点部署使用 redis
+    ws_backplane: str = "memory"
+    ws_backplane_url: str = "redis://localhost:6379/0"
+    ws_backplane_prefix: str = "ai-notebook:ws:"
+    ws_backplane_timeout: float = 2.0  # 秒，连接 Redis 和等待回复的超时
+    ws_backplane_queue_size: int = 10_000  # 等待发布的消息上限，Redis 不可用时超出的消息被丢弃
+
+    # 日志级别（DEBUG 时输出每个 AI 请求的明细）
+    log_level: str = "INFO"
+
+    # Prometheus 指标（GET /metrics），设置 metrics_token 后需要 Authorization: Bearer <token>
+    metrics_enabled: bool = True
+    metrics_token: str | None = None
+
+    # OpenTelemetry 链路追踪，需要安装 opentelemetry-api（导出还需要 opentelemetry-sdk 和 OTLP 导出器）
+    otel_enabled: bool = False
+    otel_service_name: str = "ai-notebook-backend"
+
     # CORS配置
     cors_origins: list[str] = ["http://localhost:3000", "http://localhost:5173"]
     
@@ -1,27 +1,163 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from typing import AsyncGenerator
+import logging
+import time
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.config import settings
 from app.models import Base
+from app.services import metrics
+from app.services.change_feed import init_change_feed
+from app.services.note_search import html_to_text, init_search_index
 
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+logger = logging.getLogger(__name__)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def to_async_url(url: str) -> str:
+    """把同步驱动的数据库URL换成对应的异步驱动"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:"):
+        return "postgresql+asyncpg:" + url[len("postgresql:"):]
+    if url.startswith("postgres:"):
+        return "postgresql+asyncpg:" + url[len("postgres:"):]
+    return url
+
+
+IS_SQLITE = settings.database_url.startswith("sqlite")
+
+
+def engine_options() -> dict:
+    """根据数据库类型生成 create_engine 的参数"""
+    if IS_SQLITE:
+        # SQLite 的连接参数在每次建立连接时通过 PRAGMA 设置，见 _on_connect
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+# 同步引擎只用于启动时建表、迁移等一次性操作
+engine = create_engine(settings.database_url, **engine_options())
+
+# 请求处理路径统一使用异步引擎，查询不会阻塞事件循环
+async_engine = create_async_engine(to_async_url(settings.database_url), **engine_options())
+# 提交后不过期对象，返回响应时不会再触发隐式查询
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+SQLITE_PRAGMAS = {
+    "journal_mode": settings.db_sqlite_journal_mode,
+    "synchronous": settings.db_sqlite_synchronous,
+    "busy_timeout": settings.db_sqlite_busy_timeout_ms,
+    "cache_size": -settings.db_sqlite_cache_size_kib,  # 负数表示以 KiB 为单位
+    "mmap_size": settings.db_sqlite_mmap_size,
+}
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if IS_SQLITE:
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        # 全文索引的触发器用它把笔记HTML转成纯文本
+        dbapi_connection.create_function("notes_plain_text", 1, html_to_text, deterministic=True)
+
+
+event.listen(engine, "connect", _on_connect)
+event.listen(async_engine.sync_engine, "connect", _on_connect)
+
+# 按语句类型统计耗时，其余归为 OTHER，避免标签数量失控
+QUERY_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info["query_started_at"].pop()
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else ""
+    if operation not in QUERY_OPERATIONS:
+        operation = "OTHER"
+    metrics.db_query_duration.labels(operation).observe(time.perf_counter() - started_at)
+
+
+def _on_query_error(context):
+    started = context.connection.info.get("query_started_at") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# 只统计请求处理路径上的异步引擎
+event.listen(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(async_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+event.listen(async_engine.sync_engine, "handle_error", _on_query_error)
+
+
+def pool_stats() -> dict:
+    """异步引擎连接池的使用情况（SQLite 等不计数的连接池只返回类型）"""
+    pool = async_engine.pool
+    info = {"pool": type(pool).__name__}
+    for name in ("size", "checkedout", "overflow", "checkedin"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            info[name] = method()
+    return info
+
+
+def _add_missing_columns():
+    """给已存在的表补上模型中新增的列（只支持带默认值或可为空的列）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                default = column.server_default.arg if column.server_default is not None else None
+                if isinstance(default, str):
+                    ddl += " NOT NULL DEFAULT '" + default.replace("'", "''") + "'"
+                conn.execute(text(ddl))
+
+
+def describe_database() -> dict:
+    """读取数据库连接实际生效的配置"""
+    info = {"url": engine.url.render_as_string(hide_password=True), "dialect": engine.dialect.name}
+    if IS_SQLITE:
+        with engine.connect() as conn:
+            for name in SQLITE_PRAGMAS:
+                info[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+    else:
+        info.update(engine_options())
+    return info
 
 
 def init_db():
     """初始化数据库表"""
     # 确保所有表都被创建（包括 users 表）
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all 不会给已存在的表补建新索引，这里逐个补上
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    init_search_index(engine)
+    init_change_feed(engine)
+    logger.info("数据库配置: %s", ", ".join(f"{key}={value}" for key, value in describe_database().items()))
 
 
-def get_db() -> Session:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """获取数据库会话"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    with metrics.Timer(metrics.db_session_duration):
+        async with AsyncSessionLocal() as db:
+            yield db
 
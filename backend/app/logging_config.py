@@ -0,0 +1,34 @@
+from logging.handlers import QueueHandler, QueueListener
+from app.config import settings
+import atexit
+import logging
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: QueueListener | None = None
+
+
+def setup_logging():
+    """日志统一经过队列写出
+
+    事件循环里的 logger 调用只把记录放进内存队列，格式化和写 stderr 在后台线程中进行，
+    终端或日志采集端写得慢时不会阻塞请求处理。重复调用不会重复安装。
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # 进程退出前把队列里剩余的日志写完
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.log_level.upper())
+    logger.addHandler(QueueHandler(log_queue))
+    # 不再交给根 logger，避免 uvicorn 配置的处理器在事件循环里同步写一遍
+    logger.propagate = False
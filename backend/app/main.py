@@ -1,17 +1,49 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.database import init_db
+from app.logging_config import setup_logging
+from app.database import async_engine, init_db, pool_stats
 from app.routes import notes, ai, auth
 from app.routes import upload
-from app.websocket.handlers import websocket_endpoint
-from fastapi.staticfiles import StaticFiles
-import os
+from app.websocket.handlers import manager, websocket_endpoint
+from app.services import metrics
+from app.services.ai_cache import response_cache
+from app.services.ai_service import ai_service
+from app.services.principal_cache import principal_cache
+from app.services.ai_scheduler import ai_scheduler
+from app.services.single_flight import single_flight
+from app.services.tracing import init_tracing
+from app.services.password_hasher import password_hasher
+from app.services.image_variants import image_variants
+from app.services.upload_store import UPLOAD_DIR
+from app.websocket.write_buffer import note_write_buffer
+from contextlib import asynccontextmanager
+import hmac
+
+# 日志先于其他初始化安装，启动过程的输出也经过队列
+setup_logging()
+init_tracing()
 
 # 初始化数据库
 init_db()
 
-app = FastAPI(title="AI笔记应用 API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await note_write_buffer.start()
+    await manager.start()
+    yield
+    await manager.stop()
+    # 关闭前把 WebSocket 编辑缓冲全部写回数据库
+    await note_write_buffer.stop()
+    await async_engine.dispose()
+    # 关闭AI服务共享的HTTP连接池
+    await ai_service.aclose()
+    password_hasher.shutdown()
+    await image_variants.shutdown()
+
+
+app = FastAPI(title="AI笔记应用 API", version="1.0.0", lifespan=lifespan)
 
 # CORS配置
 app.add_middleware(
@@ -20,8 +52,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端需要读取笔记列表的增量同步游标
+    expose_headers=[notes.CHANGE_CURSOR_HEADER],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # 注册路由
 app.include_router(auth.router, prefix="/api")
 app.include_router(notes.router, prefix="/api")
@@ -29,9 +66,7 @@ app.include_router(ai.router, prefix="/api")
 app.include_router(upload.router)
 
 # 静态文件（图片上传）
-static_dir = os.path.join(os.getcwd(), "data", "uploads")
-os.makedirs(static_dir, exist_ok=True)
-app.mount("/static/uploads", StaticFiles(directory=static_dir), name="uploads")
+app.mount("/static/uploads", upload.UploadStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # WebSocket路由
 @app.websocket("/ws")
@@ -50,3 +85,48 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+
+def _collect_websocket_notes():
+    """每条笔记在线连接数的分布；笔记 ID 数量不受控，不作为标签输出"""
+    per_note = manager.note_connections().values()
+    return [(
+        "ws_connections_per_note", "histogram", "打开了同一条笔记的 WebSocket 连接数",
+        metrics.histogram_samples("ws_connections_per_note", per_note, metrics.COUNT_BUCKETS),
+    )]
+
+
+metrics.registry.add_collector(metrics.stats_collector("ws", manager.stats, counters=["conflated"]))
+metrics.registry.add_collector(_collect_websocket_notes)
+metrics.registry.add_collector(metrics.stats_collector(
+    "ws_backplane", manager.backplane.stats, counters=["published", "received", "reconnects", "dropped"]
+))
+metrics.registry.add_collector(metrics.stats_collector(
+    "ws_write_buffer", note_write_buffer.stats,
+    counters=["flushes", "flushedNotes", "coalescedEdits", "conflicts"],
+))
+metrics.registry.add_collector(metrics.stats_collector(
+    "ai_cache", response_cache.stats,
+    counters=["hits", "misses", "stores", "evictions", "savedChars", "savedSeconds"],
+))
+metrics.registry.add_collector(metrics.stats_collector("ai_single_flight", single_flight.stats,
+                                                       counters=["started", "joined", "resumed", "abandoned"]))
+metrics.registry.add_collector(metrics.stats_collector("ai_scheduler", ai_scheduler.stats,
+                                                       counters=["admitted", "rejected"]))
+metrics.registry.add_collector(metrics.stats_collector("auth_cache", principal_cache.stats,
+                                                       counters=["hits", "misses", "invalidations"]))
+metrics.registry.add_collector(metrics.stats_collector("auth_hasher", password_hasher.stats,
+                                                       counters=["completed", "rejected"]))
+metrics.registry.add_collector(metrics.stats_collector("image_variants", image_variants.stats,
+                                                       counters=["generated", "failed"]))
+metrics.registry.add_collector(metrics.stats_collector("db_pool", pool_stats))
+
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics(request: Request):
+        """Prometheus 文本格式的指标"""
+        if settings.metrics_token:
+            expected = f"Bearer {settings.metrics_token}"
+            if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected.encode()):
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的指标访问令牌")
+        return Response(await metrics.registry.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
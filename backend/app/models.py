@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, String, DateTime, Text, ForeignKey, Index, Integer
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -16,6 +16,18 @@ def beijing_now():
     return datetime.now(BEIJING_TZ).replace(tzinfo=None)
 
 
+def format_datetime(dt) -> str:
+    # 确保时间以ISO格式返回，并标记为UTC时间（添加Z后缀）
+    # 这样前端可以正确识别为UTC时间，然后转换为北京时间
+    if dt is None:
+        return ""
+    # 如果datetime没有时区信息，假设它是UTC时间
+    if dt.tzinfo is None:
+        # 添加UTC时区标记
+        return dt.isoformat() + "Z"
+    return dt.isoformat()
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -37,6 +49,12 @@ class User(Base):
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        # 笔记列表按 (updated_at, id) 做游标分页，联合索引让每页查询只扫描一页的数据
+        Index("ix_notes_user_updated", "user_id", "updated_at", "id"),
+        # 增量同步按 change_seq 查询某个用户的变更
+        Index("ix_notes_user_change_seq", "user_id", "change_seq"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String, nullable=False, default="新笔记")
@@ -44,27 +62,45 @@ class Note(Base):
     user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    # 内容版本号，每次更新自动加1，用于增量更新的冲突检测
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # 全局递增的变更序号，每次写入时分配，见 services/change_feed.py
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     # 关系
     owner = relationship("User", back_populates="notes")
 
+    # 由ORM维护版本号：UPDATE 语句带上 WHERE version = 旧版本，并发修改时抛出 StaleDataError
+    __mapper_args__ = {"version_id_col": version}
+
     def to_dict(self) -> dict:
-        # 确保时间以ISO格式返回，并标记为UTC时间（添加Z后缀）
-        # 这样前端可以正确识别为UTC时间，然后转换为北京时间
-        def format_datetime(dt):
-            if dt is None:
-                return ""
-            # 如果datetime没有时区信息，假设它是UTC时间
-            if dt.tzinfo is None:
-                # 添加UTC时区标记
-                return dt.isoformat() + "Z"
-            return dt.isoformat()
-        
         return {
             "id": self.id,
             "title": self.title,
             "content": self.content,
             "createdAt": format_datetime(self.created_at),
-            "updatedAt": format_datetime(self.updated_at)
+            "updatedAt": format_datetime(self.updated_at),
+            "version": self.version
         }
 
+
+
+class NoteTombstone(Base):
+    """已删除笔记的记录，增量同步时告诉客户端删除本地副本"""
+    __tablename__ = "note_tombstones"
+    __table_args__ = (
+        Index("ix_note_tombstones_user_change_seq", "user_id", "change_seq"),
+    )
+
+    note_id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class SyncCounter(Base):
+    """全局计数器：change_seq 为最近分配的变更序号，tombstone_horizon 为已清理的删除记录的最大序号"""
+    __tablename__ = "sync_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
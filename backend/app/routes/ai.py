@@ -1,75 +1,215 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from app.services.ai_service import ai_service
+from app.services.ai_scheduler import SchedulerRejected, ai_scheduler, estimate_tokens
+from app.services.ai_service import MAX_TOKENS, ai_service
+from app.services.ai_cache import response_cache
+from app.services.single_flight import Flight, single_flight
+from app.services import metrics
+from app.services.sse import ENCODING_WBITS, encode_event_stream, negotiate_encoding
+from app.services.tracing import end_span, start_span
+from app.config import settings
 from app.database import get_db
 from app.models import User
 from app.auth import get_current_user
 import json
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
+# 允许的事件流压缩格式，按优先顺序，忽略不支持的格式
+SSE_ENCODINGS = [
+    name for name in (item.strip().lower() for item in settings.ai_sse_compression.split(","))
+    if name in ENCODING_WBITS
+]
+
 
 class AIProcessRequest(BaseModel):
     text: str
     note_id: str | None = None
 
 
-async def generate_stream(ai_service_instance, text: str, note_id: str | None):
-    """生成流式响应"""
+def parse_event_id(event_id: str | None) -> tuple[str, int] | None:
+    """解析 SSE 事件 id（<flight id>-<chunk 序号>），格式不对时返回 None"""
+    flight_id, _, index = (event_id or "").strip().rpartition("-")
+    if not flight_id or not index.isdigit():
+        return None
+    return flight_id, int(index)
+
+
+def reserve_tokens(text: str) -> int:
+    """准入时预扣的 token：输入加上输出的上限（长文档按片段数计），结束后按实际用量结算"""
+    parts = max(1, math.ceil(len(text) / settings.ai_long_doc_chunk_chars)) if len(text) > settings.ai_long_doc_threshold else 1
+    return estimate_tokens(text) + MAX_TOKENS * parts
+
+
+def resume_flight(key: str, last_event_id: str | None) -> tuple[Flight | None, int]:
+    """按 Last-Event-ID 找回之前的调用，返回调用和下一个要发送的 chunk 序号；找不到时返回 (None, 0)"""
+    resume_from = parse_event_id(last_event_id)
+    if resume_from is None:
+        return None, 0
+    flight = single_flight.resume(resume_from[0], key)
+    metrics.ai_stream_resumes.labels("resumed" if flight else "expired").inc()
+    return (flight, resume_from[1] + 1) if flight is not None else (None, 0)
+
+
+async def replay_chunks(chunks: list[str]):
+    for content in chunks:
+        yield content
+
+
+async def generate_stream(ai_service_instance, text: str, note_id: str | None, flight: Flight | None = None,
+                          start: int = 0, cached: list[str] | None = None, user: User | None = None):
+    """生成流式响应
+
+    每个内容事件包含一个或多个合并的 chunk，id 为 <flight id>-<最后一个 chunk 的序号>。客户端断线后带 Last-Event-ID 重新发起同样的请求，
+    在 single_flight 保留期内从下一个 chunk 接着发送（flight、start 由 resume_flight 找回）；找不到对应的调用时重新生成，
+    客户端根据 id 中的 flight id 变化判断需要丢弃已收到的内容。
+    客户端断开时 StreamingResponse 取消这个生成器，single_flight 在宽限期后取消上游调用。
+    cached 为命中缓存的完整回复，直接回放；只有新的上游调用才经过 ai_scheduler 准入，排队期间发送 {"queue": {"position": n}} 事件。
+    """
+    started_at = time.perf_counter()
+    span = start_span("ai.process", **{"ai.note_id": note_id, "ai.input_chars": len(text)})
+    logger.debug("AI处理请求 note_id=%s 文本长度=%d 续传=%s", note_id, len(text), flight is not None)
+    chunk_count = 0
+    char_count = 0
+    outcome = "cancelled"
+    error = None
+    ticket = None
     try:
-        print("=" * 60)
-        print("【AI处理请求】")
-        print(f"笔记ID: {note_id}")
-        print(f"处理前文本长度: {len(text)} 字符")
-        print(f"处理前文本内容（前200字符）: {text[:200]}")
-        print("=" * 60)
-        
-        chunk_count = 0
-        total_content = ""
-        async for chunk in ai_service_instance.process_text_stream(text, note_id):
+        key = ai_service_instance.cache_key(text)
+        if flight is None and cached is not None:
+            # 回放缓存同样经过 single_flight，事件 id 和续传与新的生成一致
+            flight = single_flight.join(key, lambda: replay_chunks(cached))
+        elif flight is None:
+            # 相同文本已经在生成时直接加入，不占用名额；否则先经过准入调度，排队期间推送排队位置
+            if user is not None and not single_flight.in_flight(key):
+                ticket = ai_scheduler.submit(user.id, user.username, reserve_tokens(text))
+                async for position in ai_scheduler.wait(ticket):
+                    queued = json.dumps({"queue": {"position": position}}, ensure_ascii=False)
+                    yield f"data: {queued}\n\n"
+                if single_flight.in_flight(key):
+                    # 排队期间相同文本的生成已经开始
+                    ai_scheduler.release(ticket)
+                    ticket = None
+            # 相同文本的并发请求合并为一个上游流
+            flight = single_flight.join(key, lambda: ai_service_instance.process_text_stream(text, note_id))
+            if ticket is not None:
+                # 名额跟随上游调用，客户端断开后仍在宽限期内生成的部分也计入用量
+                input_tokens = estimate_tokens(text)
+                ai_scheduler.release_when_done(
+                    ticket, flight.task, lambda: input_tokens + estimate_tokens("".join(flight.chunks))
+                )
+                ticket = None
+        span.set_attribute("ai.resumed_from", start)
+
+        # 上游的增量往往只有一两个字，按时间窗口合并后再发送，减少小事件和写调用
+        batches = single_flight.subscribe_batches(
+            flight, start, settings.ai_sse_coalesce_ms / 1000, settings.ai_sse_max_frame_chars
+        )
+        async for last_index, chunks in batches:
+            content = "".join(chunks)
             # 使用Server-Sent Events格式
-            if chunk:  # 确保chunk不为空
-                total_content += chunk
-                data = json.dumps({"content": chunk}, ensure_ascii=False)
-                yield f"data: {data}\n\n"
-                chunk_count += 1
-        
-        print("=" * 60)
-        print("【AI处理完成】")
-        print(f"共处理 {chunk_count} 个chunk")
-        print(f"处理后文本长度: {len(total_content)} 字符")
-        print(f"处理后文本内容（前200字符）: {total_content[:200]}")
-        print("=" * 60)
-        
-        # 如果没有收到任何chunk，可能是API调用失败
-        if chunk_count == 0:
+            if content:  # 确保事件不为空
+                if char_count == 0:
+                    metrics.ai_time_to_first_token.observe(time.perf_counter() - started_at)
+                char_count += len(content)
+                chunk_count += len(chunks)
+                data = json.dumps({"content": content}, ensure_ascii=False)
+                yield f"id: {flight.id}-{last_index}\ndata: {data}\n\n"
+
+        # 如果整个调用没有产出任何chunk，可能是API调用失败
+        if not flight.chunks:
+            outcome = "empty"
             error_msg = json.dumps({"error": "AI服务未返回任何内容，请检查API配置和网络连接"}, ensure_ascii=False)
             yield f"data: {error_msg}\n\n"
-        
+        else:
+            outcome = "ok"
+
         yield "data: [DONE]\n\n"
+    except SchedulerRejected as e:
+        # 提交前的检查之后额度又被同一用户的其他请求用掉
+        outcome = "rejected"
+        error_data = json.dumps({"error": e.detail, "retryAfter": e.retry_after}, ensure_ascii=False)
+        yield f"data: {error_data}\n\n"
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"流式处理错误: {error_detail}")
+        outcome = "error"
+        error = e
+        logger.exception("流式处理错误 note_id=%s", note_id)
         error_data = json.dumps({"error": f"AI处理失败: {str(e)}"}, ensure_ascii=False)
         yield f"data: {error_data}\n\n"
+    finally:
+        if ticket is not None:
+            # 排队中断开，或拿到名额后没有启动生成
+            ai_scheduler.release(ticket)
+        elapsed = time.perf_counter() - started_at
+        metrics.ai_requests.labels(outcome).inc()
+        metrics.ai_stream_duration.labels(outcome).observe(elapsed)
+        metrics.ai_stream_chunks.inc(chunk_count)
+        metrics.ai_stream_chars.inc(char_count)
+        span.set_attribute("ai.outcome", outcome)
+        span.set_attribute("ai.chunks", chunk_count)
+        span.set_attribute("ai.output_chars", char_count)
+        end_span(span, error)
+        logger.debug("AI处理完成 note_id=%s 结果=%s chunk=%d 字符=%d 耗时=%.3fs",
+                     note_id, outcome, chunk_count, char_count, elapsed)
 
 
 @router.post("/process")
 async def process_text(
     request: AIProcessRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    last_event_id: str | None = Header(None),
+    accept_encoding: str | None = Header(None),
 ):
-    """处理文本（流式响应）"""
+    """处理文本（流式响应），断线后带 Last-Event-ID 重新请求可以续传"""
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"
+    }
+    # 续传、加入进行中的相同生成和回放缓存都不启动新的上游调用，先于准入检查处理，不占用额度
+    key = ai_service.cache_key(request.text)
+    flight, start = resume_flight(key, last_event_id)
+    cached = None
+    if flight is None and not single_flight.in_flight(key):
+        cached = await ai_service.cached_response(request.text)
+        if cached is None:
+            try:
+                ai_scheduler.check(current_user.id, current_user.username, reserve_tokens(request.text))
+            except SchedulerRejected as e:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=e.detail,
+                    headers={"Retry-After": str(e.retry_after)},
+                )
+    encoding = negotiate_encoding(accept_encoding, SSE_ENCODINGS)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if SSE_ENCODINGS:
+        headers["Vary"] = "Accept-Encoding"
     return StreamingResponse(
-        generate_stream(ai_service, request.text, request.note_id),
+        encode_event_stream(
+            generate_stream(ai_service, request.text, request.note_id, flight, start, cached, current_user),
+            encoding, settings.ai_sse_compression_level,
+        ),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers=headers,
     )
 
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    """AI响应缓存的命中统计"""
+    return await response_cache.stats()
+
+
+@router.get("/singleflight/stats")
+async def get_single_flight_stats(current_user: User = Depends(get_current_user)):
+    """请求合并的统计"""
+    return single_flight.stats()
@@ -1,13 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import String, and_, cast, delete, func, insert, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List
-from app.database import get_db
-from app.models import Note, User
+from app.database import IS_SQLITE, get_db
+from app.models import Note, NoteTombstone, User, format_datetime
 from app.auth import get_current_user
-from pydantic import BaseModel
+from app.services.change_feed import allocate_change_seqs, list_changes
+from app.services.http_cache import cache_headers, make_etag, not_modified
+from app.services.note_search import html_to_text, search_notes
+from app.services.note_patch import PatchError, VersionConflict, apply_note_patch, diff_ops
+from app.services.note_transfer import (
+    NoteImporter, NoteImportError, NoteImportTooLarge,
+    export_ndjson, export_zip, import_ndjson, import_zip, spool_to_tempfile,
+)
+from app.websocket.handlers import manager, note_patch_message
+from app.websocket.write_buffer import note_write_buffer
+from app.config import settings
+from pydantic import BaseModel, Field
+from datetime import datetime
+import asyncio
+import base64
+import json
+import os
+import uuid
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
+# 列表摘要中预览文本的长度；从数据库只截取前 PREVIEW_SOURCE_CHARS 个字符（含HTML标签）
+PREVIEW_CHARS = 100
+PREVIEW_SOURCE_CHARS = 400
+
+CHANGE_CURSOR_HEADER = "X-Change-Cursor"
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonlines"}
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
 
 class NoteCreate(BaseModel):
     title: str
@@ -19,37 +48,477 @@ class NoteUpdate(BaseModel):
     content: str | None = None
 
 
+class TextOp(BaseModel):
+    pos: int = Field(ge=0)
+    delete: int = Field(0, ge=0)
+    insert: str = ""
+
+
+class NotePatch(BaseModel):
+    baseVersion: int
+    ops: List[TextOp] = []
+    title: str | None = None
+
+
+class NotePatchResult(BaseModel):
+    id: str
+    version: int
+    updatedAt: str
+
+
 class NoteResponse(BaseModel):
     id: str
     title: str
     content: str
     createdAt: str
     updatedAt: str
+    version: int
 
     class Config:
         from_attributes = True
 
 
+class NoteSummary(BaseModel):
+    id: str
+    title: str
+    preview: str
+    createdAt: str
+    updatedAt: str
+
+
+class NoteSummaryPage(BaseModel):
+    items: List[NoteSummary]
+    nextCursor: str | None = None
+
+
+class NoteSearchResult(BaseModel):
+    id: str
+    title: str
+    titleHighlight: str
+    snippet: str
+    createdAt: str
+    updatedAt: str
+
+
+class NoteSearchPage(BaseModel):
+    items: List[NoteSearchResult]
+    nextOffset: int | None = None
+
+
+class NoteImportIssue(BaseModel):
+    at: str
+    detail: str
+
+
+class NoteImportResult(BaseModel):
+    importId: str
+    imported: int
+    failed: int
+    uploads: int
+    errors: List[NoteImportIssue]
+
+
+class NoteChange(BaseModel):
+    id: str
+    seq: int
+    version: int | None = None
+    updatedAt: str | None = None
+    deleted: bool = False
+
+
+class NoteChangePage(BaseModel):
+    changes: List[NoteChange]
+    cursor: str
+    hasMore: bool
+    resetRequired: bool = False
+
+
+class NoteIdList(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=settings.notes_batch_max_items)
+
+
+class NoteBatchUpdateItem(BaseModel):
+    id: str
+    title: str | None = None
+    content: str | None = None
+    # 提供时只有当前版本与之相同才更新，否则该项返回 409
+    baseVersion: int | None = None
+
+
+class NoteBatchUpdate(BaseModel):
+    items: List[NoteBatchUpdateItem] = Field(min_length=1, max_length=settings.notes_batch_max_items)
+
+
+class NoteBatchItemResult(BaseModel):
+    id: str
+    status: int
+    note: NoteResponse | None = None
+    detail: str | None = None
+    version: int | None = None
+
+
+class NoteBatchResult(BaseModel):
+    items: List[NoteBatchItemResult]
+
+
+def make_preview(content: str) -> str:
+    """去掉HTML标签，生成纯文本预览"""
+    return html_to_text(content)[:PREVIEW_CHARS]
+
+
+async def get_user_note(db: AsyncSession, note_id: str, user_id: str) -> Note | None:
+    result = await db.execute(select(Note).where(Note.id == note_id, Note.user_id == user_id))
+    return result.scalar_one_or_none()
+
+
+async def get_user_notes(db: AsyncSession, note_ids, user_id: str) -> dict[str, Note]:
+    """用一条 IN 查询取出多条笔记，返回 {笔记ID: 笔记}"""
+    result = await db.execute(select(Note).where(Note.user_id == user_id, Note.id.in_(set(note_ids))))
+    return {note.id: note for note in result.scalars()}
+
+
+def batch_error(note_id: str, status: int, detail: str, version: int | None = None) -> dict:
+    return {"id": note_id, "status": status, "detail": detail, "version": version}
+
+
+def encode_cursor(updated_at: str, note_id: str) -> str:
+    raw = json.dumps([updated_at, note_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """解析游标，返回可以直接和 Note.updated_at 比较的值以及笔记ID"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, note_id = json.loads(base64.urlsafe_b64decode(padded))
+        # SQLite 以文本形式存储时间，按原始文本比较才能精确命中相等条件
+        value = literal(updated_at, String) if IS_SQLITE else datetime.fromisoformat(updated_at)
+        return value, str(note_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def note_etag(note_id: str, version: int, updated_at) -> str:
+    return make_etag(note_id, version, updated_at)
+
+
 @router.get("", response_model=List[NoteResponse])
 async def get_notes(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取当前用户的所有笔记"""
-    notes = db.query(Note).filter(Note.user_id == current_user.id).order_by(Note.updated_at.desc()).all()
+    """获取当前用户的所有笔记
+
+    ETag 由笔记数量、版本号之和、最新更新时间和最新变更序号计算：新增、删除、修改任一笔记都会改变它
+    （变更序号只增不减，不受版本号之和碰巧相同、时间戳精度的影响），未变化时只执行这一条聚合查询并返回 304。
+    X-Change-Cursor 是这份列表对应的增量同步游标（包括删除记录的序号），之后用 /changes?since= 获取变更。
+    """
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改，ETag 和内容才是最新的
+    await note_write_buffer.flush_user(current_user.id)
+    last_deleted_seq = (
+        select(func.coalesce(func.max(NoteTombstone.change_seq), 0))
+        .where(NoteTombstone.user_id == current_user.id)
+        .scalar_subquery()
+    )
+    count, version_sum, last_updated, last_seq, deleted_seq = (await db.execute(
+        select(
+            func.count(Note.id),
+            func.coalesce(func.sum(Note.version), 0),
+            func.max(Note.updated_at),
+            func.coalesce(func.max(Note.change_seq), 0),
+            last_deleted_seq,
+        )
+        .where(Note.user_id == current_user.id)
+    )).one()
+    last_seq = max(last_seq, deleted_seq)
+    headers = cache_headers(make_etag(current_user.id, count, version_sum, last_updated, last_seq), last_updated)
+    headers[CHANGE_CURSOR_HEADER] = str(last_seq)
+    cached = not_modified(request, headers)
+    if cached is not None:
+        return cached
+    response.headers.update(headers)
+
+    result = await db.execute(
+        select(Note).where(Note.user_id == current_user.id).order_by(Note.updated_at.desc())
+    )
+    notes = result.scalars().all()
     return [note.to_dict() for note in notes]
 
 
+@router.get("/summaries", response_model=NoteSummaryPage)
+async def get_note_summaries(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """分页获取笔记摘要（按更新时间倒序，不加载完整内容）"""
+    await note_write_buffer.flush_user(current_user.id)
+    # 游标中保存排序键的原始值：SQLite 为存储的文本，其他数据库为ISO时间
+    sort_value = cast(Note.updated_at, String) if IS_SQLITE else Note.updated_at
+    query = select(
+        Note.id,
+        Note.title,
+        Note.created_at,
+        Note.updated_at,
+        sort_value.label("sort_value"),
+        func.substr(Note.content, 1, PREVIEW_SOURCE_CHARS).label("preview_source"),
+    ).where(Note.user_id == current_user.id)
+
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Note.updated_at < cursor_updated_at,
+            and_(Note.updated_at == cursor_updated_at, Note.id < cursor_id),
+        ))
+
+    query = query.order_by(Note.updated_at.desc(), Note.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        sort_text = last.sort_value if IS_SQLITE else last.sort_value.isoformat()
+        next_cursor = encode_cursor(sort_text, last.id)
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "title": row.title,
+                "preview": make_preview(row.preview_source),
+                "createdAt": format_datetime(row.created_at),
+                "updatedAt": format_datetime(row.updated_at),
+            }
+            for row in rows
+        ],
+        "nextCursor": next_cursor,
+    }
+
+
+@router.get("/changes", response_model=NoteChangePage)
+async def get_changes(
+    since: str = Query("0", max_length=20),
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """增量同步：返回游标之后新建、修改或删除的笔记（只含ID和版本，内容用 /batch/get 获取）
+
+    把响应中的 cursor 作为下一次的 since；hasMore 为真时继续请求。
+    resetRequired 为真表示游标太旧，期间的删除记录已被清理，需要重新获取全部笔记。
+    """
+    if not since.isdigit():
+        raise HTTPException(status_code=400, detail="无效的同步游标")
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改，让它们获得变更序号
+    await note_write_buffer.flush_user(current_user.id)
+    return await list_changes(db, current_user.id, int(since), limit)
+
+
+@router.get("/search", response_model=NoteSearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """全文搜索当前用户的笔记，按相关度排序并返回高亮片段"""
+    # 全文索引由触发器维护，缓冲中的修改写回之后才能被搜到
+    await note_write_buffer.flush_user(current_user.id)
+    items = await search_notes(db, current_user.id, q, limit + 1, offset)
+    has_more = len(items) > limit
+    return {
+        "items": items[:limit],
+        "nextOffset": offset + limit if has_more else None,
+    }
+
+
+@router.post("/batch/get", response_model=NoteBatchResult)
+async def batch_get_notes(
+    body: NoteIdList,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """一次获取多条笔记，结果按请求顺序逐项返回，不存在的笔记该项为 404"""
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改
+    await note_write_buffer.flush_notes(body.ids)
+    notes = await get_user_notes(db, body.ids, current_user.id)
+    return {"items": [
+        {"id": note_id, "status": 200, "note": notes[note_id].to_dict()} if note_id in notes
+        else batch_error(note_id, 404, "笔记不存在")
+        for note_id in body.ids
+    ]}
+
+
+@router.post("/batch/update", response_model=NoteBatchResult)
+async def batch_update_notes(
+    body: NoteBatchUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """一次更新多条笔记
+
+    不存在（404）、重复（400）或 baseVersion 不一致（409）的项被跳过并在结果中说明，
+    其余修改在同一个事务中提交。提交时如果有笔记刚被其他请求修改，整批回滚并返回 409。
+    """
+    ids = [item.id for item in body.items]
+    await note_write_buffer.flush_notes(ids)
+    notes = await get_user_notes(db, ids, current_user.id)
+
+    results: list[dict] = []
+    updated: set[str] = set()
+    for item in body.items:
+        note = notes.get(item.id)
+        if note is None:
+            results.append(batch_error(item.id, 404, "笔记不存在"))
+        elif item.id in updated:
+            results.append(batch_error(item.id, 400, "同一条笔记在一次请求中只能更新一次"))
+        elif item.baseVersion is not None and item.baseVersion != note.version:
+            results.append(batch_error(item.id, 409, str(VersionConflict(note.version)), note.version))
+        else:
+            if item.title is not None:
+                note.title = item.title
+            if item.content is not None:
+                note.content = item.content
+            updated.add(item.id)
+            results.append({"id": item.id, "status": 200})
+
+    if updated:
+        try:
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="部分笔记已被其他请求修改，本次批量更新未生效，请重新获取后再试")
+        # 更新时间由数据库生成，用一条查询取回最新状态
+        notes = await get_user_notes(db, updated, current_user.id)
+        for result in results:
+            if result["status"] == 200:
+                result["note"] = notes[result["id"]].to_dict()
+    return {"items": results}
+
+
+@router.post("/batch/delete", response_model=NoteBatchResult)
+async def batch_delete_notes(
+    body: NoteIdList,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """一次删除多条笔记（同一个事务），不存在的笔记该项为 404"""
+    existing = set((await db.execute(
+        select(Note.id).where(Note.user_id == current_user.id, Note.id.in_(set(body.ids)))
+    )).scalars())
+    if existing:
+        # 批量语句不经过 ORM，删除记录和变更序号在这里写入
+        seqs = await allocate_change_seqs(db, len(existing))
+        await db.execute(insert(NoteTombstone.__table__), [
+            {"note_id": note_id, "user_id": current_user.id, "change_seq": change_seq}
+            for change_seq, note_id in zip(seqs, sorted(existing))
+        ])
+        await db.execute(
+            delete(Note).where(Note.user_id == current_user.id, Note.id.in_(existing))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        for note_id in existing:
+            note_write_buffer.discard(note_id)
+    return {"items": [
+        {"id": note_id, "status": 204} if note_id in existing else batch_error(note_id, 404, "笔记不存在")
+        for note_id in body.ids
+    ]}
+
+
+@router.post("/import", response_model=NoteImportResult)
+async def import_notes(
+    request: Request,
+    import_id: str | None = Query(None, pattern=r"^[A-Za-z0-9_-]{1,64}$"),
+    current_user: User = Depends(get_current_user)
+):
+    """批量导入笔记
+
+    请求体为 NDJSON（每行一个 {title, content, createdAt?, updatedAt?}）或 zip（Markdown 文件、
+    本应用导出的 notes.ndjson 以及 uploads/ 目录）。边读边解析，按批在单个事务中插入；
+    每写完一批通过 WebSocket 向该用户推送 import_progress。中途出错时已写入的批次会保留。
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_CONTENT_TYPES | ZIP_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="只支持 application/x-ndjson 或 application/zip")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.notes_import_max_bytes:
+        raise HTTPException(
+            status_code=413, detail=f"导入文件超过上限 {settings.notes_import_max_bytes // (1024 * 1024)}MB"
+        )
+
+    import_id = import_id or str(uuid.uuid4())
+
+    async def on_progress(progress: dict):
+        await manager.broadcast_to_user(
+            current_user.id,
+            {"type": "import_progress", "payload": {"importId": import_id, **progress}},
+            conflate_key=f"import_progress:{import_id}",
+        )
+
+    importer = NoteImporter(current_user.id, on_progress=on_progress)
+    try:
+        if content_type in NDJSON_CONTENT_TYPES:
+            result = await import_ndjson(importer, request.stream())
+        else:
+            path = await spool_to_tempfile(request.stream())
+            try:
+                result = await import_zip(importer, path)
+            finally:
+                await asyncio.to_thread(os.remove, path)
+    except NoteImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{e}（已导入 {importer.imported} 条）")
+    except NoteImportError as e:
+        raise HTTPException(status_code=400, detail=f"{e}（已导入 {importer.imported} 条）")
+    return {"importId": import_id, **result}
+
+
+@router.get("/export")
+async def export_notes(
+    format: str = Query("zip", pattern="^(zip|ndjson)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出当前用户的全部笔记：ndjson 只含笔记，zip 另外包含笔记引用的上传文件"""
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改
+    await note_write_buffer.flush_user(current_user.id)
+    filename = f"notes-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    if format == "ndjson":
+        return StreamingResponse(export_ndjson(current_user.id), media_type="application/x-ndjson", headers=headers)
+    return StreamingResponse(export_zip(current_user.id), media_type="application/zip", headers=headers)
+
+
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(
     note_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取单个笔记"""
-    note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    """获取单个笔记，带 If-None-Match 且笔记未变化时返回 304"""
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改
+    await note_write_buffer.flush_note(note_id)
+    if request.headers.get("if-none-match"):
+        # 只查版本号和更新时间，命中时不必读取和序列化正文
+        row = (await db.execute(
+            select(Note.version, Note.updated_at).where(Note.id == note_id, Note.user_id == current_user.id)
+        )).one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="笔记不存在")
+        cached = not_modified(request, cache_headers(note_etag(note_id, row.version, row.updated_at), row.updated_at))
+        if cached is not None:
+            return cached
+    note = await get_user_note(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
+    response.headers.update(cache_headers(note_etag(note.id, note.version, note.updated_at), note.updated_at))
     return note.to_dict()
 
 
@@ -57,7 +526,7 @@ async def get_note(
 async def create_note(
     note_data: NoteCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """创建新笔记"""
     note = Note(
@@ -66,45 +535,110 @@ async def create_note(
         user_id=current_user.id
     )
     db.add(note)
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await db.refresh(note)
     return note.to_dict()
 
 
+async def stale_note_response(db: AsyncSession, note_id: str) -> JSONResponse:
+    """提交时发现笔记已被其他请求修改（version_id_col 检查失败）：返回 409 和当前版本，笔记已不存在时返回 404"""
+    version = (await db.execute(select(Note.version).where(Note.id == note_id))).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="笔记不存在")
+    return JSONResponse(
+        status_code=409, content={"detail": "笔记已被其他请求修改，请重新获取后再试", "version": version}
+    )
+
+
 @router.put("/{note_id}", response_model=NoteResponse)
 async def update_note(
     note_id: str,
     note_data: NoteUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """更新笔记"""
-    note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    """更新笔记
+
+    其他请求同时修改了这条笔记时返回 409 和当前版本号；保存成功后把与之前内容的差异
+    作为 note_patch 广播给该用户的 WebSocket 连接。
+    """
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改
+    await note_write_buffer.flush_note(note_id)
+    note = await get_user_note(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
+    base_version, base_title, base_content = note.version, note.title, note.content
 
     if note_data.title is not None:
         note.title = note_data.title
     if note_data.content is not None:
         note.content = note_data.content
 
-    db.commit()
-    db.refresh(note)
+    try:
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        return await stale_note_response(db, note_id)
+    await db.refresh(note)
+    if note.version != base_version:
+        title = note.title if note.title != base_title else None
+        await manager.broadcast_to_user(
+            current_user.id,
+            note_patch_message(note.id, base_version, note.version, diff_ops(base_content, note.content),
+                               note.updated_at, title),
+        )
     return note.to_dict()
 
 
+@router.patch("/{note_id}", response_model=NotePatchResult)
+async def patch_note(
+    note_id: str,
+    patch: NotePatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """增量更新笔记：在 baseVersion 版本上应用文本操作，版本不一致时返回 409
+
+    成功后把补丁广播给该用户的 WebSocket 连接，其他打开这条笔记的编辑器在本地应用。
+    """
+    # 先写回 WebSocket 编辑缓冲中尚未落库的修改
+    await note_write_buffer.flush_note(note_id)
+    note = await get_user_note(db, note_id, current_user.id)
+    if not note:
+        raise HTTPException(status_code=404, detail="笔记不存在")
+
+    ops = [op.model_dump() for op in patch.ops]
+    try:
+        await apply_note_patch(db, note, patch.baseVersion, ops, patch.title)
+    except PatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except VersionConflict as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "version": e.current_version})
+
+    await manager.broadcast_to_user(
+        current_user.id,
+        note_patch_message(note.id, patch.baseVersion, note.version, ops, note.updated_at, patch.title),
+    )
+    return {"id": note.id, "version": note.version, "updatedAt": format_datetime(note.updated_at)}
+
+
 @router.delete("/{note_id}", status_code=204)
 async def delete_note(
     note_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """删除笔记"""
-    note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    note = await get_user_note(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
 
-    db.delete(note)
-    db.commit()
+    await db.delete(note)
+    try:
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        return await stale_note_response(db, note_id)
+    note_write_buffer.discard(note_id)
     return None
 
@@ -1,32 +1,89 @@
 import os
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, QueryParams
+from starlette.staticfiles import NotModifiedResponse
+from app.config import settings
 from app.models import User
 from app.auth import get_current_user
+from app.services.http_cache import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, etag_matches
+from app.services.image_variants import VARIANTS, image_variants
+from app.services.upload_store import UploadError, UploadTooLarge, save_multipart_file
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "data", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# multipart 分隔符和字段头的额外开销
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 接口直接读取请求流，不声明 UploadFile 参数，请求体的结构在这里写进 OpenAPI 文档
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                },
+            },
+        },
+    },
+}
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
 
-@router.post("")
+@router.post("", openapi_extra=UPLOAD_OPENAPI)
 async def upload_file(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
-    if not file:
-        raise HTTPException(status_code=400, detail="No file uploaded")
-    file_ext = os.path.splitext(file.filename)[1]
-    filename = os.urandom(16).hex() + file_ext
-    save_path = os.path.join(UPLOAD_DIR, filename)
+    """上传文件：流式写入磁盘，按内容的 SHA-256 命名，相同文件只保存一份"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.upload_max_bytes + MULTIPART_OVERHEAD:
+        # 声明的大小已经超限，不必读取请求体
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(settings.upload_max_bytes)))
     try:
-        with open(save_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-    except Exception as e:
+        stored = await save_multipart_file(request.headers.get("content-type", ""), request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
 
-    url = f"/static/uploads/{filename}"
-    return JSONResponse({"url": url})
+    url = f"/static/uploads/{stored['filename']}"
+    response = {"url": url}
+    if image_variants.supports(stored["filename"]):
+        # 衍生图在后台生成，不等待；生成好之前这些地址返回原图
+        image_variants.schedule(stored["filename"])
+        response["variants"] = {name: f"{url}?variant={name}" for name in VARIANTS}
+    return JSONResponse(response)
+
+
+class UploadStaticFiles(StaticFiles):
+    """上传文件的静态服务，?variant=thumb|medium|webp 时返回对应的衍生图
+
+    上传文件按内容哈希命名、写入后不再修改，因此以文件名作为强 ETag 并允许长期缓存。
+    只有衍生图尚未生成、临时返回原图时要求客户端每次重新验证。
+    """
+
+    async def get_response(self, path: str, scope):
+        variant = QueryParams(scope.get("query_string", b"")).get("variant")
+        if variant:
+            resolved = await image_variants.resolve(path, variant)
+            scope["upload_variant_pending"] = resolved == path and variant in VARIANTS
+            path = resolved
+        return await super().get_response(path, scope)
 
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers["etag"] = '"' + os.path.basename(full_path) + '"'
+        if scope.get("upload_variant_pending"):
+            response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+        else:
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        if etag_matches(Headers(scope=scope).get("if-none-match"), response.headers["etag"]):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from app.config import settings
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本，让只差行尾空白、换行符或首尾空行的输入命中同一条缓存
+
+    行首缩进和行内的连续空格保留：代码、Markdown 列表和表格里它们有含义，润色结果也可能不同。
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip("\n")
+
+
+def make_cache_key(model: str, prompt_template: str, text: str, temperature: float) -> str:
+    """按 (模型, 提示词模板, 规范化文本, 温度) 计算内容地址"""
+    raw = json.dumps(
+        [model, prompt_template, normalize_text(text), temperature],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    chunks: list[str]
+    duration: float  # 上游生成耗时（秒），用于估算节省的时间
+    expires_at: float
+
+
+class MemoryCacheBackend:
+    """进程内 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self):
+        self._entries.clear()
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """SQLite 磁盘缓存，进程重启后仍然有效
+
+    sqlite3 调用是阻塞的，统一放到线程中执行。
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                chunks TEXT NOT NULL,
+                duration REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_cache_accessed ON ai_cache (accessed_at)")
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunks, duration, expires_at FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                self._conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                return None
+            self._conn.execute("UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return CacheEntry(chunks=json.loads(row[0]), duration=row[1], expires_at=row[2])
+
+    def _set(self, key: str, entry: CacheEntry):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, chunks, duration, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.chunks, ensure_ascii=False), entry.duration, entry.expires_at, now),
+            )
+            # 清理过期条目，再按最近访问时间淘汰超出上限的条目
+            expired = self._conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,)).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                "SELECT key FROM ai_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def _clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_cache")
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, entry: CacheEntry):
+        await asyncio.to_thread(self._set, key, entry)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+    async def size(self) -> int:
+        return await asyncio.to_thread(self._count)
+
+
+class ResponseCache:
+    """AI响应缓存，记录命中/未命中等统计"""
+
+    def __init__(self, backend, ttl_seconds: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_chars = 0
+        self.saved_seconds = 0.0
+
+    async def get(self, key: str, count_miss: bool = True) -> Optional[list[str]]:
+        """查找缓存；count_miss=False 用于预查，未命中时之后还会正式查找一次，不重复计入未命中"""
+        if not self.enabled:
+            return None
+        entry = await self.backend.get(key)
+        if entry is None:
+            if count_miss:
+                self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_chars += sum(len(chunk) for chunk in entry.chunks)
+        self.saved_seconds += entry.duration
+        return entry.chunks
+
+    async def set(self, key: str, chunks: list[str], duration: float):
+        if not self.enabled:
+            return
+        await self.backend.set(key, CacheEntry(
+            chunks=chunks,
+            duration=duration,
+            expires_at=time.time() + self.ttl_seconds,
+        ))
+        self.stores += 1
+
+    async def clear(self):
+        await self.backend.clear()
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": await self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.backend.evictions,
+            "savedChars": self.saved_chars,
+            "savedSeconds": round(self.saved_seconds, 3),
+        }
+
+
+def create_response_cache() -> ResponseCache:
+    if settings.ai_cache_backend == "sqlite":
+        backend = SQLiteCacheBackend(settings.ai_cache_path, settings.ai_cache_max_entries)
+    else:
+        backend = MemoryCacheBackend(settings.ai_cache_max_entries)
+    return ResponseCache(backend, settings.ai_cache_ttl_seconds, enabled=settings.ai_cache_enabled)
+
+
+response_cache = create_response_cache()
@@ -0,0 +1,318 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Dict, Optional
+from app.config import settings
+from app.services import metrics
+import asyncio
+import math
+import time
+
+# 两次清理空闲用户状态之间的间隔（秒）
+PRUNE_INTERVAL = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：按 UTF-8 字节数的 1/3，中文约一字一 token，英文略微高估"""
+    return math.ceil(len(text.encode("utf-8")) / 3)
+
+
+class SchedulerRejected(Exception):
+    """超出速率、token 预算或排队上限，retry_after 为建议的重试间隔（秒）"""
+
+    def __init__(self, reason: str, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每秒补充 rate；余额可以被结算成负数，还清之前拒绝新的请求"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self, amount: float) -> float:
+        """还需要等多久余额才够 amount，0 表示现在就够"""
+        self._refill()
+        # 单次请求超过容量时只要求桶满，避免永远无法通过
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def give(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass(eq=False)
+class Ticket:
+    """一个等待或正在占用生成名额的请求"""
+    user_id: str
+    reserved_tokens: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    finished: bool = False
+    position: int = 0
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class _UserState:
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.queue: deque[Ticket] = deque()
+        self.active = 0
+        self.rate: Optional[TokenBucket] = None
+        self.budget: Optional[TokenBucket] = None
+
+    @property
+    def idle(self) -> bool:
+        return (
+            not self.queue and not self.active
+            and (self.rate is None or self.rate.full) and (self.budget is None or self.budget.full)
+        )
+
+
+class AIScheduler:
+    """AI 生成的准入调度
+
+    同时进行的生成（上游调用）不超过 max_active，每个用户不超过 user_max_active。
+    超出的请求进入该用户自己的队列，名额空出时按加权轮询在有排队的用户之间分配：
+    轮到的用户连续获得 weight 个名额后换下一个用户，重度用户只能排自己的队，不会挤占其他用户。
+    每个用户另有请求速率和每小时 token 预算，超出或队列已满时直接拒绝（HTTP 429）。
+    token 预算在准入时按估计的最大用量预扣，生成结束后按实际用量结算。
+    """
+
+    def __init__(
+        self,
+        max_active: int,
+        max_queue: int,
+        user_max_active: int,
+        user_max_queue: int,
+        requests_per_minute: float = 0,
+        tokens_per_hour: float = 0,
+        weights: Dict[str, int] | None = None,
+    ):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.user_max_active = user_max_active
+        self.user_max_queue = user_max_queue
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_hour = tokens_per_hour
+        self.weights = weights or {}
+        self._users: Dict[str, _UserState] = {}
+        # 有排队请求的用户，按轮询顺序排列；队首用户本轮还能拿到 _credits 个名额
+        self._ring: deque[str] = deque()
+        self._credits = 0
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._next_prune = 0.0
+
+    def _user(self, user_id: str, username: str | None = None) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            weight = max(1, int(self.weights.get(username or "", self.weights.get(user_id, 1))))
+            state = self._users[user_id] = _UserState(weight)
+            if self.requests_per_minute > 0:
+                state.rate = TokenBucket(self.requests_per_minute, self.requests_per_minute / 60)
+            if self.tokens_per_hour > 0:
+                state.budget = TokenBucket(self.tokens_per_hour, self.tokens_per_hour / 3600)
+        return state
+
+    def _reject(self, reason: str, detail: str, retry_after: float):
+        self.rejected += 1
+        metrics.ai_scheduler_rejections.labels(reason).inc()
+        raise SchedulerRejected(reason, detail, retry_after)
+
+    def check(self, user_id: str, username: str | None, tokens: int):
+        """检查现在提交是否会被拒绝，不占用任何额度；被拒绝时抛出 SchedulerRejected"""
+        state = self._user(user_id, username)
+        if state.rate is not None:
+            wait = state.rate.retry_after(1)
+            if wait > 0:
+                self._reject("rate", "AI请求过于频繁，请稍后重试", wait)
+        if state.budget is not None:
+            wait = state.budget.retry_after(tokens)
+            if wait > 0:
+                self._reject("budget", "AI用量已超出当前额度，请稍后重试", wait)
+        if state.active >= self.user_max_active and len(state.queue) >= self.user_max_queue:
+            self._reject("user_queue", "同时进行的AI请求过多，请等待之前的请求完成", 5)
+        if self.active >= self.max_active and self.queued >= self.max_queue:
+            self._reject("queue", "AI服务繁忙，请稍后重试", 5)
+
+    def submit(self, user_id: str, username: str | None, tokens: int) -> Ticket:
+        """提交一个生成请求：检查额度后预扣，有空闲名额时立即获得，否则排队"""
+        self._prune()
+        self.check(user_id, username, tokens)
+        state = self._user(user_id, username)
+        if state.rate is not None:
+            state.rate.take(1)
+        if state.budget is not None:
+            state.budget.take(tokens)
+        ticket = Ticket(user_id=user_id, reserved_tokens=tokens)
+        self.admitted += 1
+        if not state.queue and state.active < self.user_max_active and self.active < self.max_active:
+            self._grant(state, ticket)
+        else:
+            if not state.queue:
+                self._ring.append(user_id)
+            state.queue.append(ticket)
+            self.queued += 1
+            self._update_positions()
+        return ticket
+
+    async def wait(self, ticket: Ticket) -> AsyncGenerator[int, None]:
+        """排队期间在排队位置变化时产出位置（1 表示下一个），获得名额后结束"""
+        reported = None
+        while True:
+            # 先清除再读取状态：产出位置期间发生的变化不会被漏掉
+            ticket.changed.clear()
+            if ticket.granted:
+                return
+            if ticket.position != reported:
+                reported = ticket.position
+                yield reported
+                continue
+            await ticket.changed.wait()
+
+    def release(self, ticket: Ticket, used_tokens: int | None = None):
+        """结束一个请求：排队中的移出队列，占用名额的归还名额；按实际用量结算预扣的 token"""
+        if ticket.finished:
+            return
+        ticket.finished = True
+        state = self._users.get(ticket.user_id)
+        if state is None:
+            return
+        if state.budget is not None:
+            used = 0 if used_tokens is None else used_tokens
+            state.budget.give(ticket.reserved_tokens - used)
+        if ticket.granted:
+            state.active -= 1
+            self.active -= 1
+            self._dispatch()
+        elif ticket in state.queue:
+            state.queue.remove(ticket)
+            self.queued -= 1
+            if not state.queue:
+                self._leave_ring(ticket.user_id)
+            self._update_positions()
+
+    def release_when_done(self, ticket: Ticket, task: asyncio.Task, used_tokens: Callable[[], int]):
+        """名额跟随上游调用：task 结束（包括被取消）时归还，按 used_tokens() 结算"""
+        task.add_done_callback(lambda _: self.release(ticket, used_tokens()))
+
+    def _grant(self, state: _UserState, ticket: Ticket):
+        ticket.granted = True
+        ticket.position = 0
+        state.active += 1
+        self.active += 1
+        metrics.ai_scheduler_queue_wait.observe(time.monotonic() - ticket.enqueued_at)
+        ticket.changed.set()
+
+    def _leave_ring(self, user_id: str):
+        if self._ring and self._ring[0] == user_id:
+            self._ring.popleft()
+            self._credits = 0
+        else:
+            self._ring.remove(user_id)
+
+    def _dispatch(self):
+        """把空出的名额按加权轮询分给排队的用户"""
+        granted = False
+        skipped = 0
+        while self.active < self.max_active and self._ring and skipped < len(self._ring):
+            user_id = self._ring[0]
+            state = self._users[user_id]
+            if state.active >= self.user_max_active:
+                # 该用户自己的并发已满，本轮跳过
+                self._ring.rotate(-1)
+                self._credits = 0
+                skipped += 1
+                continue
+            if self._credits <= 0:
+                self._credits = state.weight
+            self._grant(state, state.queue.popleft())
+            self.queued -= 1
+            self._credits -= 1
+            granted = True
+            skipped = 0
+            if not state.queue:
+                self._ring.popleft()
+                self._credits = 0
+            elif self._credits <= 0:
+                self._ring.rotate(-1)
+        if granted:
+            self._update_positions()
+
+    def _update_positions(self):
+        """按轮询顺序估算每个排队请求前面还有多少个请求，位置变化时唤醒等待者"""
+        queues = {user_id: iter(self._users[user_id].queue) for user_id in self._ring}
+        order = list(self._ring)
+        credits = self._credits
+        position = 0
+        while order:
+            remaining = []
+            for i, user_id in enumerate(order):
+                take = credits if i == 0 and credits > 0 else self._users[user_id].weight
+                exhausted = False
+                for _ in range(take):
+                    ticket = next(queues[user_id], None)
+                    if ticket is None:
+                        exhausted = True
+                        break
+                    position += 1
+                    if ticket.position != position:
+                        ticket.position = position
+                        ticket.changed.set()
+                if not exhausted:
+                    remaining.append(user_id)
+            order = remaining
+            credits = 0
+
+    def _prune(self):
+        """定期丢弃空闲且额度已恢复的用户状态"""
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + PRUNE_INTERVAL
+        for user_id in [user_id for user_id, state in self._users.items() if state.idle]:
+            del self._users[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "users": len(self._users),
+            "waitingUsers": len(self._ring),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+ai_scheduler = AIScheduler(
+    max_active=settings.ai_scheduler_max_active,
+    max_queue=settings.ai_scheduler_max_queue,
+    user_max_active=settings.ai_user_max_active,
+    user_max_queue=settings.ai_user_max_queue,
+    requests_per_minute=settings.ai_user_requests_per_minute,
+    tokens_per_hour=settings.ai_user_tokens_per_hour,
+    weights=settings.ai_user_weights,
+)
@@ -1,8 +1,30 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 from app.config import settings
+from app.services import metrics
+from app.services.ai_cache import make_cache_key, response_cache
+from app.services.text_splitter import split_document
+from app.services.tracing import end_span, start_span
 from typing import AsyncGenerator
 import asyncio
-import concurrent.futures
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+SYSTEM_PROMPT = "你是一个专业的文本润色助手，擅长改进文本的表达和结构。"
+
+PROMPT_TEMPLATE = """请帮我润色和扩展以下文本，使其更加清晰、有条理和完整。保持原意，但可以适当扩展和优化表达：
+
+{text}
+
+请直接输出润色后的内容，不要添加额外的说明或标记。"""
+
+TEMPERATURE = 0.7
+MAX_TOKENS = 2000
+# 少于这个长度的结果视为异常，不缓存并提示用户
+MIN_VALID_CHARS = 10
 
 
 class AIService:
@@ -10,17 +32,173 @@ class AIService:
         self.api_key = settings.openai_api_key
         self.api_base = settings.openai_api_base
         self._client = None
-    
+        self._http_client = None
+        # 限制同时进行的上游流式请求数量，超出的请求在此排队而不是压垮上游
+        self._semaphore = asyncio.Semaphore(settings.ai_max_concurrency)
+
     @property
-    def client(self):
-        """延迟初始化客户端，避免模块加载时的错误"""
+    def client(self) -> AsyncOpenAI:
+        """延迟初始化客户端，避免模块加载时的错误
+
+        所有请求共享同一个异步HTTP连接池，复用keep-alive连接。
+        """
         if self._client is None:
-            client_kwargs = {"api_key": self.api_key}
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.ai_max_connections,
+                    max_keepalive_connections=settings.ai_max_keepalive_connections,
+                    keepalive_expiry=settings.ai_keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(
+                    settings.ai_read_timeout,
+                    connect=settings.ai_connect_timeout,
+                ),
+            )
+            client_kwargs = {
+                "api_key": self.api_key,
+                "http_client": self._http_client,
+                "max_retries": settings.ai_max_retries,
+            }
             if self.api_base:
                 client_kwargs["base_url"] = self.api_base
-            self._client = OpenAI(**client_kwargs)
+            self._client = AsyncOpenAI(**client_kwargs)
         return self._client
 
+    async def aclose(self):
+        """关闭共享连接池（应用关闭时调用）"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._client = None
+        self._http_client = None
+
+    def build_messages(self, text: str) -> list[dict]:
+        """构建发送给模型的消息"""
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": PROMPT_TEMPLATE.format(text=text)},
+        ]
+
+    def cache_key(self, text: str) -> str:
+        """请求的内容地址：模型、提示词模板、规范化文本和温度都相同即视为同一请求"""
+        return make_cache_key(
+            settings.openai_model,
+            SYSTEM_PROMPT + PROMPT_TEMPLATE + f"|max_tokens={MAX_TOKENS}",
+            text,
+            TEMPERATURE,
+        )
+
+    async def _stream_completion(self, text: str) -> AsyncGenerator[str, None]:
+        """调用上游模型并逐个产出文本增量，全程不阻塞事件循环"""
+        async with self._semaphore:
+            started_at = time.perf_counter()
+            span = start_span("ai.upstream", **{"ai.model": settings.openai_model, "ai.input_chars": len(text)})
+            outcome = "cancelled"
+            error = None
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=settings.openai_model,  # 使用配置的模型名称
+                    messages=self.build_messages(text),
+                    stream=True,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS
+                )
+                # 退出时关闭响应，把连接归还连接池
+                async with stream:
+                    chunk_index = 0
+                    async for chunk in stream:
+                        chunk_index += 1
+                        if not chunk.choices:
+                            # 如果没有choices，可能是其他类型的chunk，继续处理
+                            logger.debug("收到非标准chunk (索引 %d): %s", chunk_index, type(chunk))
+                            continue
+
+                        choice = chunk.choices[0]
+                        content = choice.delta.content if choice.delta else None
+                        if content:
+                            yield content
+
+                        # 检查finish_reason（流结束标记），处理完当前chunk后退出
+                        if choice.finish_reason:
+                            span.set_attribute("ai.finish_reason", choice.finish_reason)
+                            break
+                    span.set_attribute("ai.upstream_chunks", chunk_index)
+                outcome = "ok"
+            except Exception as e:
+                outcome = "error"
+                error = e
+                metrics.ai_upstream_errors.labels(type(e).__name__).inc()
+                raise
+            finally:
+                metrics.ai_upstream_requests.labels(outcome).inc()
+                metrics.ai_upstream_duration.labels(outcome).observe(time.perf_counter() - started_at)
+                span.set_attribute("ai.outcome", outcome)
+                end_span(span, error)
+
+    async def cached_response(self, text: str) -> list[str] | None:
+        """整段回复已在缓存中时返回它的chunk，可以直接回放而不启动上游调用
+
+        长文档按片段分别缓存，整篇是否全部命中要逐段查找，这里不处理，返回 None。
+        """
+        if len(text) > settings.ai_long_doc_threshold:
+            return None
+        return await response_cache.get(self.cache_key(text), count_miss=False)
+
+    async def _polish_stream(self, text: str) -> AsyncGenerator[str, None]:
+        """润色一段文本，命中缓存时直接回放已保存的chunk，不再请求上游"""
+        key = self.cache_key(text)
+        cached_chunks = await response_cache.get(key)
+        if cached_chunks is not None:
+            for content in cached_chunks:
+                yield content
+            return
+
+        chunks = []
+        started_at = time.monotonic()
+        async for content in self._stream_completion(text):
+            chunks.append(content)
+            yield content
+
+        # 只缓存完整且正常的结果
+        if sum(len(content) for content in chunks) >= MIN_VALID_CHARS:
+            await response_cache.set(key, chunks, time.monotonic() - started_at)
+
+    async def _process_long_document(self, text: str) -> AsyncGenerator[str, None]:
+        """长文档模式：按段落/标题切分后并发润色，按文档顺序流式返回
+
+        第一个片段的内容实时输出，后面的片段在前面的片段输出完之前先缓冲在队列里。
+        """
+        parts = split_document(text, settings.ai_long_doc_chunk_chars)
+        logger.debug("长文档模式：%d 字符切分为 %d 个片段", len(text), len(parts))
+        queues = [asyncio.Queue() for _ in parts]
+        # asyncio.Semaphore 按先来后到唤醒，靠前的片段会先拿到名额
+        workers = asyncio.Semaphore(settings.ai_long_doc_workers)
+
+        async def polish(index: int, part: str):
+            async with workers:
+                try:
+                    async for content in self._polish_stream(part):
+                        queues[index].put_nowait(content)
+                    queues[index].put_nowait(None)
+                except Exception as e:
+                    queues[index].put_nowait(e)
+
+        tasks = [asyncio.create_task(polish(i, part)) for i, part in enumerate(parts)]
+        try:
+            for index, queue in enumerate(queues):
+                if index > 0:
+                    yield "\n\n"
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     async def process_text_stream(
         self, text: str, note_id: str | None = None
     ) -> AsyncGenerator[str, None]:
@@ -28,102 +206,28 @@ class AIService:
         流式处理文本，使用OpenAI API
         """
         try:
-            # 构建提示词
-            prompt = f"""请帮我润色和扩展以下文本，使其更加清晰、有条理和完整。保持原意，但可以适当扩展和优化表达：
+            if len(text) > settings.ai_long_doc_threshold:
+                source = self._process_long_document(text)
+            else:
+                source = self._polish_stream(text)
 
-{text}
-
-请直接输出润色后的内容，不要添加额外的说明或标记。"""
+            total_content = ""
+            async for content in source:
+                total_content += content
+                yield content
 
-            # OpenAI Python SDK 的流式调用是同步的，需要在线程池中运行
-            import concurrent.futures
-            
-            def create_stream():
-                try:
-                    print(f"调用AI API - 模型: {settings.openai_model}, Base URL: {settings.openai_api_base or '默认'}")
-                    response = self.client.chat.completions.create(
-                        model=settings.openai_model,  # 使用配置的模型名称
-                        messages=[
-                            {"role": "system", "content": "你是一个专业的文本润色助手，擅长改进文本的表达和结构。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        stream=True,
-                        temperature=0.7,
-                        max_tokens=2000
-                    )
-                    print("AI API调用成功，开始流式处理")
-                    return response
-                except Exception as e:
-                    print(f"AI API调用失败: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    raise
-            
-            # 在线程池中执行同步调用
-            loop = asyncio.get_event_loop()
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                stream = await loop.run_in_executor(executor, create_stream)
-                
-                # 流式返回内容
-                total_content = ""
-                chunk_index = 0
-                has_finished = False
-                
-                for chunk in stream:
-                    try:
-                        chunk_index += 1
-                        
-                        # 检查是否有finish_reason（流结束标记）
-                        if hasattr(chunk, 'choices') and chunk.choices and len(chunk.choices) > 0:
-                            choice = chunk.choices[0]
-                            
-                            # 检查finish_reason，但不立即退出，先处理完当前chunk
-                            if hasattr(choice, 'finish_reason') and choice.finish_reason:
-                                has_finished = True
-                                print(f"检测到流结束标记: {choice.finish_reason}")
-                            
-                            # 处理delta内容
-                            if hasattr(choice, 'delta'):
-                                delta = choice.delta
-                                if hasattr(delta, 'content') and delta.content:
-                                    content = delta.content
-                                    if content:  # 确保内容不为空
-                                        total_content += content
-                                        yield content
-                                        # 让出控制权，避免阻塞
-                                        await asyncio.sleep(0)
-                            
-                            # 如果已经结束，处理完当前chunk后退出
-                            if has_finished:
-                                print(f"流式处理完成，共处理 {chunk_index} 个chunk，总长度: {len(total_content)}")
-                                break
-                        else:
-                            # 如果没有choices，可能是其他类型的chunk，继续处理
-                            print(f"收到非标准chunk (索引 {chunk_index}): {type(chunk)}")
-                            
-                    except Exception as chunk_error:
-                        # 记录chunk处理错误，但继续处理
-                        print(f"处理chunk {chunk_index} 时出错: {chunk_error}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
-                
-                # 如果流自然结束（没有finish_reason），也记录
-                if not has_finished:
-                    print(f"流自然结束，共处理 {chunk_index} 个chunk，总长度: {len(total_content)}")
-                
-                if not total_content:
-                    print("警告：未收到任何内容，可能是API响应格式不兼容")
-                    yield "⚠️ AI服务未返回内容，请检查API配置或稍后重试。"
-                elif len(total_content) < 10:
-                    print(f"警告：返回内容过短 ({len(total_content)} 字符)，可能是API响应异常")
-                    yield f"{total_content}\n\n⚠️ 注意：返回内容可能不完整，请重试。"
+            if not total_content:
+                logger.warning("未收到任何内容，可能是API响应格式不兼容")
+                yield "⚠️ AI服务未返回内容，请检查API配置或稍后重试。"
+            elif len(total_content) < MIN_VALID_CHARS:
+                logger.warning("返回内容过短 (%d 字符)，可能是API响应异常", len(total_content))
+                yield f"{total_content}\n\n⚠️ 注意：返回内容可能不完整，请重试。"
 
         except Exception as e:
+            logger.warning("AI API调用失败: %s", e)
             error_msg = f"AI处理错误: {str(e)}"
             yield error_msg
             raise
 
 
 ai_service = AIService()
-
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, delete, event, func, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Note, NoteTombstone, SyncCounter, format_datetime
+import time
+
+CHANGE_SEQ = "change_seq"
+TOMBSTONE_HORIZON = "tombstone_horizon"
+# PostgreSQL 上变更序号来自序列，不再经过 sync_counters 中被行锁串行化的 change_seq 行
+CHANGE_SEQ_SEQUENCE = "note_change_seq"
+# PostgreSQL 上分配序号的写事务持有这个 advisory 锁的共享锁直到提交，
+# 读取变更前短暂获取排他锁，等已经拿到序号的事务全部结束
+CHANGE_FEED_LOCK = 7102843061
+# 两次清理过期删除记录之间的最短间隔（秒）
+PURGE_INTERVAL = 3600
+
+_next_purge = 0.0
+
+
+def uses_sequence(dialect) -> bool:
+    return dialect.name == "postgresql"
+
+
+def _allocate_statement(count: int):
+    return (
+        update(SyncCounter)
+        .where(SyncCounter.name == CHANGE_SEQ)
+        .values(value=SyncCounter.value + count)
+        .returning(SyncCounter.value)
+    )
+
+
+_LOCK_SHARED = text("SELECT pg_advisory_xact_lock_shared(:lock)").bindparams(lock=CHANGE_FEED_LOCK)
+_NEXTVAL = text(f"SELECT nextval('{CHANGE_SEQ_SEQUENCE}') FROM generate_series(1, :count)")
+
+
+def allocate_change_seqs_sync(connection: Connection, count: int) -> list[int]:
+    """在当前事务中分配 count 个递增的变更序号
+
+    SQLite：计数器行在事务提交前一直被锁住，其他写事务会在这里等待，序号连续，先后与提交顺序一致。
+    PostgreSQL：从序列取号，写事务之间不互相等待，序号可能不连续；取号前加的共享锁保证读取变更时
+    （current_change_seq）不会越过还没提交的序号。两种情况下客户端拿到序号 N 之后，都不会再有序号小于 N 的变更被提交。
+    """
+    if uses_sequence(connection.dialect):
+        connection.execute(_LOCK_SHARED)
+        return sorted(connection.execute(_NEXTVAL, {"count": count}).scalars())
+    last = connection.execute(_allocate_statement(count)).scalar_one()
+    return list(range(last - count + 1, last + 1))
+
+
+async def allocate_change_seqs(db: AsyncSession, count: int) -> list[int]:
+    """异步会话中分配变更序号，说明见 allocate_change_seqs_sync"""
+    if uses_sequence(db.bind.dialect):
+        await db.execute(_LOCK_SHARED)
+        return sorted((await db.execute(_NEXTVAL, {"count": count})).scalars())
+    last = (await db.execute(_allocate_statement(count))).scalar_one()
+    return list(range(last - count + 1, last + 1))
+
+
+async def current_change_seq(db: AsyncSession) -> int:
+    """已分配的最大变更序号；PostgreSQL 上先等拿到序号的写事务全部结束，保证不大于它的变更都已提交"""
+    if not uses_sequence(db.bind.dialect):
+        return (await db.execute(select(SyncCounter.value).where(SyncCounter.name == CHANGE_SEQ))).scalar() or 0
+    await db.execute(text("SELECT pg_advisory_lock(:lock)"), {"lock": CHANGE_FEED_LOCK})
+    try:
+        last_value, is_called = (await db.execute(
+            text(f"SELECT last_value, is_called FROM {CHANGE_SEQ_SEQUENCE}")
+        )).one()
+    finally:
+        await db.execute(text("SELECT pg_advisory_unlock(:lock)"), {"lock": CHANGE_FEED_LOCK})
+    return last_value if is_called else 0
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_change_seqs(session: Session, flush_context, instances):
+    """通过 ORM 新建、修改、删除笔记时自动分配变更序号，删除时写入删除记录
+
+    不经过 ORM 的批量语句（编辑缓冲写回、批量导入、批量删除）自行调用 allocate_change_seqs。
+    """
+    changed = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Note) and (obj in session.new or session.is_modified(obj))
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Note)]
+    if not changed and not deleted:
+        return
+    seqs = iter(allocate_change_seqs_sync(session.connection(), len(changed) + len(deleted)))
+    for note in changed:
+        note.change_seq = next(seqs)
+    for note in deleted:
+        session.add(NoteTombstone(note_id=note.id, user_id=note.user_id, change_seq=next(seqs)))
+
+
+def init_change_feed(engine: Engine):
+    """创建计数器（PostgreSQL 上还有序列），并给启用增量同步之前就存在的笔记补上变更序号"""
+    with engine.begin() as conn:
+        existing = dict(conn.execute(select(SyncCounter.name, SyncCounter.value)).all())
+        if uses_sequence(conn.dialect):
+            conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {CHANGE_SEQ_SEQUENCE}"))
+            # 从计数器行迁移：序列从已经分配过的最大序号之后继续
+            # （同一个事务里建序列、删计数器行，计数器行还在说明序列是刚建的）
+            if CHANGE_SEQ in existing:
+                if existing[CHANGE_SEQ] > 0:
+                    conn.execute(text(f"SELECT setval('{CHANGE_SEQ_SEQUENCE}', :value)"), {"value": existing[CHANGE_SEQ]})
+                conn.execute(delete(SyncCounter).where(SyncCounter.name == CHANGE_SEQ))
+            names = (TOMBSTONE_HORIZON,)
+        else:
+            names = (CHANGE_SEQ, TOMBSTONE_HORIZON)
+        for name in names:
+            if name not in existing:
+                conn.execute(insert(SyncCounter).values(name=name, value=0))
+        note_ids = list(conn.execute(select(Note.id).where(Note.change_seq == 0).order_by(Note.updated_at)).scalars())
+        if note_ids:
+            seqs = allocate_change_seqs_sync(conn, len(note_ids))
+            conn.execute(
+                update(Note.__table__)
+                .where(Note.__table__.c.id == bindparam("note_id"))
+                .values(change_seq=bindparam("seq")),
+                [{"note_id": note_id, "seq": seq} for note_id, seq in zip(note_ids, seqs)],
+            )
+
+
+async def purge_tombstones(db: AsyncSession) -> int:
+    """删除超过保留期的删除记录，并把它们的最大序号记为 tombstone_horizon
+
+    游标早于 tombstone_horizon 的客户端可能错过了删除，需要全量同步。
+    """
+    cutoff = datetime.utcnow() - timedelta(days=settings.sync_tombstone_retention_days)
+    horizon = (await db.execute(
+        select(func.max(NoteTombstone.change_seq)).where(NoteTombstone.deleted_at < cutoff)
+    )).scalar()
+    if horizon is None:
+        return 0
+    result = await db.execute(delete(NoteTombstone).where(NoteTombstone.change_seq <= horizon))
+    await db.execute(
+        update(SyncCounter)
+        .where(SyncCounter.name == TOMBSTONE_HORIZON, SyncCounter.value < horizon)
+        .values(value=horizon)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def list_changes(db: AsyncSession, user_id: str, since: int, limit: int) -> dict:
+    """返回序号大于 since 的变更（按序号排列，最多 limit 条）以及下一次请求使用的游标"""
+    global _next_purge
+    if time.monotonic() >= _next_purge:
+        _next_purge = time.monotonic() + PURGE_INTERVAL
+        await purge_tombstones(db)
+
+    # 只返回不大于 latest 的变更：更大的序号可能还有未提交的更小序号，见 allocate_change_seqs_sync
+    latest = await current_change_seq(db)
+    horizon = (await db.execute(
+        select(SyncCounter.value).where(SyncCounter.name == TOMBSTONE_HORIZON)
+    )).scalar() or 0
+    if since < horizon:
+        # 期间的删除记录已经清理，只能全量同步；返回当前序号作为全量同步之后的游标
+        return {"changes": [], "cursor": str(latest), "hasMore": False, "resetRequired": True}
+
+    updated = (await db.execute(
+        select(Note.id, Note.version, Note.updated_at, Note.change_seq)
+        .where(Note.user_id == user_id, Note.change_seq > since, Note.change_seq <= latest)
+        .order_by(Note.change_seq)
+        .limit(limit + 1)
+    )).all()
+    deleted = (await db.execute(
+        select(NoteTombstone.note_id, NoteTombstone.change_seq)
+        .where(NoteTombstone.user_id == user_id, NoteTombstone.change_seq > since, NoteTombstone.change_seq <= latest)
+        .order_by(NoteTombstone.change_seq)
+        .limit(limit + 1)
+    )).all()
+
+    changes = [
+        {"id": row.id, "seq": row.change_seq, "version": row.version,
+         "updatedAt": format_datetime(row.updated_at), "deleted": False}
+        for row in updated
+    ] + [
+        {"id": row.note_id, "seq": row.change_seq, "version": None, "updatedAt": None, "deleted": True}
+        for row in deleted
+    ]
+    changes.sort(key=lambda change: change["seq"])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    cursor = changes[-1]["seq"] if changes else since
+    return {"changes": changes, "cursor": str(cursor), "hasMore": has_more, "resetRequired": False}
@@ -0,0 +1,49 @@
+from email.utils import format_datetime as format_http_date
+from datetime import datetime, timezone
+from fastapi import Request, Response
+import hashlib
+
+# 上传文件按内容命名，永远不会变化
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 用户数据可以缓存，但每次使用前必须用 ETag 向服务器确认
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """由若干版本信息计算强 ETag"""
+    raw = "|".join(str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match 是否命中（按弱比较，忽略 W/ 前缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+
+def http_date(value: datetime | None) -> str | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_http_date(value.astimezone(timezone.utc), usegmt=True)
+
+
+def cache_headers(etag: str, last_modified: datetime | None = None,
+                  cache_control: str = REVALIDATE_CACHE_CONTROL) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    modified = http_date(last_modified)
+    if modified:
+        headers["Last-Modified"] = modified
+    return headers
+
+
+def not_modified(request: Request, headers: dict) -> Response | None:
+    """请求带的 ETag 与当前一致时返回 304 响应，否则返回 None"""
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return None
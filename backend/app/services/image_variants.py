@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from app.config import settings
+from app.services.upload_store import UPLOAD_DIR
+import asyncio
+import logging
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装 Pillow 时不生成衍生图，始终返回原图
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+
+# 衍生图规格：名称 -> 最长边像素（None 表示保持原尺寸，只转成 WebP）
+VARIANTS = {
+    "thumb": 320,
+    "medium": 1280,
+    "webp": None,
+}
+# 动图（GIF）和矢量图（SVG）不处理
+SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+
+def variant_filename(filename: str, variant: str) -> str:
+    """abc.png 的 thumb 衍生图为 abc.thumb.webp，与原图放在同一目录"""
+    return f"{os.path.splitext(filename)[0]}.{variant}.webp"
+
+
+def _render_variants(source_path: str, targets: list[tuple[str, Optional[int]]], quality: int) -> int:
+    """在子进程中执行：打开原图，依次生成各尺寸的 WebP，返回生成的数量"""
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "P") else "RGB")
+        for target_path, max_size in targets:
+            variant = image.copy()
+            if max_size is not None and max(variant.size) > max_size:
+                variant.thumbnail((max_size, max_size), Image.LANCZOS)
+            tmp_path = target_path + ".tmp"
+            variant.save(tmp_path, format="WEBP", quality=quality, method=4)
+            os.replace(tmp_path, target_path)
+    return len(targets)
+
+
+class ImageVariantPipeline:
+    """上传图片的衍生图生成管线
+
+    图片缩放和编码是 CPU 密集操作，放到独立的进程池中执行；上传接口只负责提交任务，
+    不等待结果。衍生图还没生成好时，请求衍生图会先拿到原图。
+    """
+
+    def __init__(self, directory: str, workers: int, quality: int, enabled: bool = True):
+        self.directory = directory
+        self.workers = workers
+        self.quality = quality
+        self.enabled = enabled and Image is not None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: dict[str, asyncio.Task] = {}
+        self.generated = 0
+        self.failed = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def supports(self, filename: str) -> bool:
+        return self.enabled and os.path.splitext(filename)[1].lower() in SOURCE_EXTENSIONS
+
+    def schedule(self, filename: str):
+        """提交后台任务生成缺少的衍生图，同一文件不会重复提交"""
+        if not self.supports(filename) or filename in self._pending:
+            return
+        task = asyncio.create_task(self._generate(filename))
+        self._pending[filename] = task
+        task.add_done_callback(lambda _: self._pending.pop(filename, None))
+
+    async def _generate(self, filename: str):
+        source = os.path.join(self.directory, filename)
+        targets = [
+            (os.path.join(self.directory, variant_filename(filename, name)), max_size)
+            for name, max_size in VARIANTS.items()
+        ]
+        exists = await asyncio.to_thread(lambda: [os.path.exists(path) for path, _ in targets])
+        targets = [target for target, done in zip(targets, exists) if not done]
+        if not targets:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+            self.generated += await loop.run_in_executor(
+                self.executor, _render_variants, source, targets, self.quality
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.warning("生成衍生图失败 %s: %s", filename, e)
+
+    async def resolve(self, filename: str, variant: str | None) -> str:
+        """返回应当返回的文件名：衍生图已生成时返回衍生图，否则返回原图并补生成"""
+        if not variant or variant not in VARIANTS or not self.supports(filename):
+            return filename
+        if os.path.basename(filename) != filename:
+            return filename
+        candidate = variant_filename(filename, variant)
+        if await asyncio.to_thread(os.path.exists, os.path.join(self.directory, candidate)):
+            return candidate
+        # 早于管线上线的图片在第一次被请求时补生成
+        if await asyncio.to_thread(os.path.exists, os.path.join(self.directory, filename)):
+            self.schedule(filename)
+        return filename
+
+    async def shutdown(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "generated": self.generated,
+            "failed": self.failed,
+        }
+
+
+image_variants = ImageVariantPipeline(
+    directory=UPLOAD_DIR,
+    workers=settings.image_variant_workers,
+    quality=settings.image_variant_quality,
+    enabled=settings.image_variants_enabled,
+)
@@ -0,0 +1,368 @@
+from bisect import bisect_left
+from typing import Callable, Iterable, Sequence
+import inspect
+import math
+import re
+import time
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 数量类直方图的分桶
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 采集时才计算的指标：返回（或异步返回）[(指标名, 类型, 说明, [(样本名, 标签, 值), ...]), ...]
+Sample = tuple[str, dict, float]
+Collector = Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """取得某组标签值对应的子指标（按 labelnames 的顺序传入）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[tuple[str, dict, float]]:
+        for values, child in self._children.items():
+            yield from child.samples(self.name, dict(zip(self.labelnames, values)))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def samples(self, name: str, labels: dict):
+        yield name + "_total", labels, self.value
+
+
+class Counter(_Metric):
+    """只增不减的计数；指标名不带 _total 后缀，输出时自动加上"""
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[0] = f"# HELP {self.name}_total {self.help}"
+        lines[1] = f"# TYPE {self.name}_total counter"
+        return lines
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def samples(self, name: str, labels: dict):
+        yield name, labels, self.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        # 落在第一个上界不小于 value 的桶里，采集时再累加
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: dict):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            yield name + "_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+class Timer:
+    """with 语句计时，退出时写入直方图"""
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def histogram_samples(name: str, values: Iterable[float], buckets: Sequence[float]) -> list[Sample]:
+    """把一组当前值整理成直方图样本，供采集时计算的分布类指标使用"""
+    child = _HistogramChild(tuple(buckets))
+    for value in values:
+        child.observe(value)
+    return list(child.samples(name, {}))
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+def stats_collector(prefix: str, stats: Callable, counters: Iterable[str] = ()) -> Collector:
+    """把服务已有的 stats()（同步或异步）转成指标：数值字段按 prefix_字段名 输出
+
+    counters 中的字段是累计值，输出为 counter，其余为 gauge；非数值和嵌套字段跳过。
+    """
+    counters = set(counters)
+
+    async def collect():
+        values = stats()
+        if inspect.isawaitable(values):
+            values = await values
+        families = []
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = float(value)
+            elif not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{_snake_case(key)}"
+            if key in counters:
+                name += "_total"
+                families.append((name, "counter", f"{prefix} {key}", [(name, {}, value)]))
+            else:
+                families.append((name, "gauge", f"{prefix} {key}", [(name, {}, value)]))
+        return families
+
+    return collect
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，按 Prometheus 文本格式输出
+
+    热路径上只做字典查找和加法，不加锁（指标只在事件循环线程中更新）。
+    各服务已有的 stats() 通过 collector 在采集时读取，不需要在业务代码里重复计数。
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Collector] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已存在")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+                if inspect.isawaitable(families):
+                    families = await families
+            except Exception as e:
+                lines.append(f"# 采集失败: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample_name, labels, value in samples:
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(float(value))}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _collect_process():
+    return [("process_cpu_seconds_total", "counter", "进程占用的 CPU 时间（用户态 + 内核态）",
+             [("process_cpu_seconds_total", {}, time.process_time())])]
+
+
+registry.add_collector(_collect_process)
+
+# HTTP
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（流式响应到最后一个字节）", ["method", "route", "status"]
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+# AI 流式润色
+ai_requests = registry.counter("ai_stream_requests", "AI 流式请求数", ["outcome"])
+ai_stream_resumes = registry.counter("ai_stream_resumes", "带 Last-Event-ID 的续传请求数", ["result"])
+ai_time_to_first_token = registry.histogram("ai_time_to_first_token_seconds", "AI 请求到第一个 chunk 的时间")
+ai_stream_duration = registry.histogram("ai_stream_duration_seconds", "AI 流式请求总耗时", ["outcome"])
+ai_stream_chunks = registry.counter("ai_stream_chunks", "发给客户端的 AI chunk（上游增量）数")
+ai_stream_chars = registry.counter("ai_stream_chars", "发给客户端的 AI 字符数")
+ai_sse_frames = registry.counter("ai_sse_frames", "发给客户端的 SSE 事件数")
+ai_sse_bytes = registry.counter("ai_sse_bytes", "SSE 响应实际发送的字节数（压缩后）", ["encoding"])
+ai_upstream_requests = registry.counter("ai_upstream_requests", "对上游模型的调用次数", ["outcome"])
+ai_upstream_errors = registry.counter("ai_upstream_errors", "上游模型调用失败次数", ["error"])
+ai_upstream_duration = registry.histogram("ai_upstream_duration_seconds", "单次上游模型调用耗时", ["outcome"])
+
+# AI 准入调度
+ai_scheduler_queue_wait = registry.histogram("ai_scheduler_queue_wait_seconds", "AI 请求排队等待生成名额的时间")
+ai_scheduler_rejections = registry.counter("ai_scheduler_rejections", "被拒绝（429）的 AI 请求数", ["reason"])
+
+# 数据库
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "单条 SQL 执行耗时", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+db_session_duration = registry.histogram("db_session_duration_seconds", "请求中数据库会话从打开到关闭的时间")
+
+
+class MetricsMiddleware:
+    """记录每个 HTTP 请求的耗时，按路由模板（而不是实际路径）分组
+
+    纯 ASGI 中间件，不缓冲响应体；流式响应的耗时计到最后一个字节发出为止。
+    路由匹配后 Starlette 会把 endpoint 写回 scope，据此查到路由模板，未匹配的请求归为 <unmatched>。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: dict | None = None
+
+    def _route_path(self, scope) -> str:
+        if self._route_paths is None:
+            # 路由在应用启动前全部注册完毕，第一次请求时建立 endpoint -> 路由模板 的映射
+            self._route_paths = {}
+            for route in scope["app"].routes:
+                # Mount 的 endpoint 是被挂载的子应用
+                endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if endpoint is not None:
+                    self._route_paths.setdefault(endpoint, route.path)
+        endpoint = scope.get("endpoint")
+        try:
+            return self._route_paths.get(endpoint, "<unmatched>")
+        except TypeError:
+            return "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.labels(scope["method"], self._route_path(scope), str(status_code)).observe(
+                time.perf_counter() - started_at
+            )
@@ -0,0 +1,72 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import Note
+
+
+class PatchError(ValueError):
+    """补丁格式不合法或超出文本范围"""
+
+
+class VersionConflict(Exception):
+    """客户端基于的版本已经不是最新版本"""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"版本冲突，当前版本为 {current_version}")
+        self.current_version = current_version
+
+
+def apply_ops(content: str, ops: list[dict]) -> str:
+    """按顺序把文本操作应用到内容上
+
+    每个操作为 {"pos": 位置, "delete": 删除的字符数, "insert": 插入的文本}，
+    位置按 Unicode 字符计算，且相对于前面的操作应用之后的文本。
+    """
+    if not isinstance(ops, list):
+        raise PatchError("无效的补丁操作")
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError("无效的补丁操作")
+        pos = op.get("pos")
+        delete = op.get("delete", 0)
+        insert = op.get("insert", "")
+        if not isinstance(pos, int) or not isinstance(delete, int) or not isinstance(insert, str):
+            raise PatchError("无效的补丁操作")
+        if pos < 0 or delete < 0 or pos + delete > len(content):
+            raise PatchError(f"补丁操作超出文本范围: pos={pos}, delete={delete}, 长度={len(content)}")
+        content = content[:pos] + insert + content[pos + delete:]
+    return content
+
+
+def diff_ops(old: str, new: str) -> list[dict]:
+    """把整体替换转换成一个文本操作（去掉相同的前缀和后缀），内容相同时返回空列表"""
+    if old == new:
+        return []
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return [{"pos": prefix, "delete": len(old) - prefix - suffix, "insert": new[prefix:len(new) - suffix]}]
+
+
+async def apply_note_patch(
+    db: AsyncSession, note: Note, base_version: int, ops: list[dict], title: str | None = None
+) -> Note:
+    """在 note 的 base_version 版本上应用补丁并提交，版本不一致时抛出 VersionConflict"""
+    if note.version != base_version:
+        raise VersionConflict(note.version)
+
+    note.content = apply_ops(note.content, ops)
+    if title is not None:
+        note.title = title
+    try:
+        await db.commit()
+    except StaleDataError:
+        # 读取之后被其他请求抢先修改了
+        await db.rollback()
+        await db.refresh(note)
+        raise VersionConflict(note.version)
+    await db.refresh(note)
+    return note
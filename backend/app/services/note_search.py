@@ -0,0 +1,268 @@
+from sqlalchemy import DateTime, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Note, format_datetime
+import html
+import re
+
+
+# 块级标签替换为空格，行内标签（加粗、链接等）直接去掉，避免把一个词拆开
+_BLOCK_TAG_RE = re.compile(
+    r"</?(?:p|div|br|li|ul|ol|h[1-6]|blockquote|pre|table|tr|td|th|hr|img)\b[^>]*>", re.IGNORECASE
+)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# trigram 分词器把文本切成连续的三个字符，对中文等没有空格分词的语言同样有效
+# 索引中保存去掉HTML标签后的正文。rowid 由所有者和笔记的索引键组成：高位是用户键，低 32 位是笔记键，
+# 同一用户的笔记在索引中是一段连续的 rowid，搜索时用 rowid 范围过滤用户，触发器按 rowid 删除旧行。
+# 索引键来自两张以 INTEGER PRIMARY KEY 为键的映射表：notes、users 的隐式 rowid 可能被 VACUUM 重新编号，
+# 映射表的键不会。note_id 不建索引，用于按主键连接 notes
+FTS_TABLE_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    note_id UNINDEXED, title, body, tokenize = 'trigram'
+)
+"""
+
+FTS_KEY_TABLES_DDL = [
+    "CREATE TABLE IF NOT EXISTS notes_fts_user_keys (key INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS notes_fts_note_keys (key INTEGER PRIMARY KEY, note_id VARCHAR NOT NULL UNIQUE)",
+]
+
+FTS_USER_SHIFT = 32
+FTS_NOTE_MASK = (1 << FTS_USER_SHIFT) - 1
+
+
+def _fts_rowid(row: str) -> str:
+    """触发器中计算索引 rowid 的表达式，row 为 new 或 old"""
+    return (
+        f"(((SELECT key FROM notes_fts_user_keys WHERE user_id = {row}.user_id) << {FTS_USER_SHIFT})"
+        f" | (SELECT key FROM notes_fts_note_keys WHERE note_id = {row}.id))"
+    )
+
+
+_FTS_INSERT = f"""
+        INSERT OR IGNORE INTO notes_fts_user_keys (user_id) VALUES (new.user_id);
+        INSERT OR IGNORE INTO notes_fts_note_keys (note_id) VALUES (new.id);
+        INSERT INTO notes_fts (rowid, note_id, title, body)
+        VALUES ({_fts_rowid("new")}, new.id, new.title, notes_plain_text(new.content));
+"""
+
+FTS_TRIGGERS = ["notes_fts_after_insert", "notes_fts_after_delete", "notes_fts_after_update"]
+
+FTS_TRIGGERS_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_after_insert AFTER INSERT ON notes BEGIN
+        {_FTS_INSERT}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_after_delete AFTER DELETE ON notes BEGIN
+        DELETE FROM notes_fts WHERE rowid = {_fts_rowid("old")};
+        DELETE FROM notes_fts_note_keys WHERE note_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_after_update AFTER UPDATE OF title, content, user_id ON notes BEGIN
+        DELETE FROM notes_fts WHERE rowid = {_fts_rowid("old")};
+        {_FTS_INSERT}
+    END
+    """,
+]
+
+# trigram 无法匹配少于3个字符的词（中文最常见的两字词也在此列），这类词不走倒排索引，
+# 而是在该用户的 rowid 范围内逐条做子串查找：开销与该用户的笔记数成正比，与全库规模无关
+# （1000 条笔记的用户约 10ms）；笔记很多的用户搜索两字词会明显变慢，需要时可再加一个二元分词的索引
+MIN_TRIGRAM_CHARS = 3
+# 相关度排序：标题中出现一次相当于正文中出现几次；正文越长，每次出现的权重越低（按这个字符数归一化）
+TITLE_WEIGHT = 5.0
+LENGTH_NORM_CHARS = 1000
+SNIPPET_TOKENS = 24
+FALLBACK_SNIPPET_CHARS = 60
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+
+def html_to_text(content: str | None) -> str:
+    """去掉HTML标签并合并空白，得到用于索引和预览的纯文本"""
+    if not content:
+        return ""
+    text = _TAG_RE.sub("", _BLOCK_TAG_RE.sub(" ", content))
+    return _WHITESPACE_RE.sub(" ", html.unescape(text)).strip()
+
+
+def init_search_index(engine: Engine):
+    """创建 FTS5 索引表、索引键映射表和同步触发器；首次创建或从旧版结构迁移时回填已有笔记（仅 SQLite）
+
+    旧版索引（按 note_id、user_id 的 trigram 匹配，或直接使用 notes、users 的隐式 rowid）没有映射表，
+    启动时删除后按当前结构重建。
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    current = inspector.has_table("notes_fts") and inspector.has_table("notes_fts_note_keys")
+    with engine.begin() as conn:
+        if not current:
+            for trigger in FTS_TRIGGERS:
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS notes_fts")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS notes_fts_user_keys")
+        for ddl in FTS_KEY_TABLES_DDL:
+            conn.exec_driver_sql(ddl)
+        conn.execute(text(FTS_TABLE_DDL))
+        for ddl in FTS_TRIGGERS_DDL:
+            conn.execute(text(ddl))
+        if not current:
+            conn.exec_driver_sql("INSERT OR IGNORE INTO notes_fts_user_keys (user_id) SELECT DISTINCT user_id FROM notes")
+            conn.exec_driver_sql("INSERT OR IGNORE INTO notes_fts_note_keys (note_id) SELECT id FROM notes")
+            conn.execute(text(
+                "INSERT INTO notes_fts (rowid, note_id, title, body) "
+                f"SELECT (u.key << {FTS_USER_SHIFT}) | n.key, notes.id, notes.title, notes_plain_text(notes.content) "
+                "FROM notes JOIN notes_fts_user_keys u ON u.user_id = notes.user_id "
+                "JOIN notes_fts_note_keys n ON n.note_id = notes.id"
+            ))
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _score_sql(count: int) -> str:
+    """相关度：各关键词在标题和正文中的出现次数加权求和，再按正文长度归一化
+
+    不使用 FTS5 的 bm25：它按整张索引表（所有用户）统计每个关键词的文档频率，
+    每次查询都要读完关键词的全部倒排列表，开销与全库命中数成正比，rowid 范围过滤帮不上忙。
+    """
+    occurrences = " + ".join(
+        f"({TITLE_WEIGHT} * (length(notes_fts.title) - length(replace(lower(notes_fts.title), :k{i}, '')))"
+        f" + length(notes_fts.body) - length(replace(lower(notes_fts.body), :k{i}, ''))) / length(:k{i})"
+        for i in range(count)
+    )
+    return f"({occurrences}) / (1.0 + length(notes_fts.body) / {LENGTH_NORM_CHARS}.0)"
+
+
+def _escape_html(value: str) -> str:
+    return html.escape(value, quote=False)
+
+
+def _highlight(value: str, terms: list[str]) -> str:
+    """在Python中高亮关键词（用于没有 FTS 排名信息的退化路径）"""
+    if not terms:
+        return _escape_html(value)
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in pattern.finditer(value):
+        parts.append(_escape_html(value[last:match.start()]))
+        parts.append(HIGHLIGHT_START + _escape_html(match.group(0)) + HIGHLIGHT_END)
+        last = match.end()
+    parts.append(_escape_html(value[last:]))
+    return "".join(parts)
+
+
+def _fallback_snippet(body: str, terms: list[str]) -> str:
+    lowered = body.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    start = max(0, min(positions) - FALLBACK_SNIPPET_CHARS // 2) if positions else 0
+    excerpt = body[start:start + FALLBACK_SNIPPET_CHARS]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + FALLBACK_SNIPPET_CHARS < len(body) else ""
+    return prefix + _highlight(excerpt, terms) + suffix
+
+
+async def _search_fts(db: AsyncSession, user_id: str, terms: list[str], limit: int, offset: int) -> list[dict]:
+    long_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_CHARS]
+    short_terms = [term for term in terms if len(term) < MIN_TRIGRAM_CHARS]
+
+    user_key = (await db.execute(
+        text("SELECT key FROM notes_fts_user_keys WHERE user_id = :user_id"), {"user_id": user_id}
+    )).scalar()
+    if user_key is None:
+        return []
+    # 该用户的笔记在索引中的 rowid 范围，FTS5 只读取这一段
+    conditions = ["notes_fts.rowid BETWEEN :first AND :last", "notes.user_id = :user_id"]
+    params = {
+        "user_id": user_id,
+        "first": user_key << FTS_USER_SHIFT,
+        "last": (user_key << FTS_USER_SHIFT) | FTS_NOTE_MASK,
+        "limit": limit,
+        "offset": offset,
+    }
+    if long_terms:
+        conditions.append("notes_fts MATCH :match")
+        params["match"] = "{title body}:(" + " AND ".join(_quote(term) for term in long_terms) + ")"
+        for i, term in enumerate(long_terms):
+            params[f"k{i}"] = term.lower()
+    for i, term in enumerate(short_terms):
+        conditions.append(f"(instr(lower(notes_fts.title), :t{i}) > 0 OR instr(lower(notes_fts.body), :t{i}) > 0)")
+        params[f"t{i}"] = term.lower()
+
+    order = f"{_score_sql(len(long_terms))} DESC, notes.updated_at DESC" if long_terms else "notes.updated_at DESC"
+    # CROSS JOIN 固定连接顺序：先在索引中按 rowid 范围（和关键词）查找，再按主键取笔记
+    sql = f"""
+        SELECT notes.id, notes.created_at, notes.updated_at,
+               notes_fts.title AS title, notes_fts.body AS body,
+               highlight(notes_fts, 1, :hl_start, :hl_end) AS title_highlight,
+               snippet(notes_fts, 2, :hl_start, :hl_end, '…', {SNIPPET_TOKENS}) AS snippet
+        FROM notes_fts CROSS JOIN notes ON notes.id = notes_fts.note_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """
+    params.update({"hl_start": "\x02", "hl_end": "\x03"})
+    statement = text(sql).columns(created_at=DateTime, updated_at=DateTime)
+    rows = (await db.execute(statement, params)).mappings().all()
+
+    results = []
+    for row in rows:
+        if long_terms:
+            # snippet 的高亮标记先用控制字符占位，转义HTML后再替换成 <mark>
+            title = _escape_html(row["title_highlight"]).replace("\x02", HIGHLIGHT_START).replace("\x03", HIGHLIGHT_END)
+            snippet = _escape_html(row["snippet"]).replace("\x02", HIGHLIGHT_START).replace("\x03", HIGHLIGHT_END)
+        else:
+            title = _highlight(row["title"], short_terms)
+            snippet = _fallback_snippet(row["body"], short_terms)
+        results.append({
+            "id": row["id"],
+            "title": row["title"],
+            "titleHighlight": title,
+            "snippet": snippet,
+            "createdAt": format_datetime(row["created_at"]),
+            "updatedAt": format_datetime(row["updated_at"]),
+        })
+    return results
+
+
+async def _search_like(db: AsyncSession, user_id: str, terms: list[str], limit: int, offset: int) -> list[dict]:
+    """非 SQLite 数据库的退化实现：按子串匹配，按更新时间排序"""
+    query = select(Note.id, Note.title, Note.content, Note.created_at, Note.updated_at).where(Note.user_id == user_id)
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.where(Note.title.ilike(pattern) | Note.content.ilike(pattern))
+    query = query.order_by(Note.updated_at.desc(), Note.id.desc()).offset(offset).limit(limit)
+    rows = (await db.execute(query)).all()
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "titleHighlight": _highlight(row.title, terms),
+            "snippet": _fallback_snippet(html_to_text(row.content), terms),
+            "createdAt": format_datetime(row.created_at),
+            "updatedAt": format_datetime(row.updated_at),
+        }
+        for row in rows
+    ]
+
+
+async def search_notes(db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> list[dict]:
+    """搜索某个用户的笔记，多个关键词之间为 AND 关系
+
+    返回的 titleHighlight 和 snippet 是已经转义过的HTML，关键词用 <mark> 标出。
+    """
+    terms = [term for term in query.split() if term]
+    if not terms:
+        return []
+    if db.bind.dialect.name == "sqlite":
+        return await _search_fts(db, user_id, terms, limit, offset)
+    return await _search_like(db, user_id, terms, limit, offset)
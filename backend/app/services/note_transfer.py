@@ -0,0 +1,514 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+from sqlalchemy import insert, select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Note, format_datetime
+from app.services.change_feed import allocate_change_seqs
+from app.services.upload_store import UPLOAD_DIR
+import asyncio
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+
+# 笔记正文中引用的上传文件：按内容哈希（SHA-256）命名，或者是改为哈希命名之前上传的 32 位随机名
+UPLOAD_REF_RE = re.compile(r"/static/uploads/((?:[0-9a-f]{32}|[0-9a-f]{64})\.[A-Za-z0-9]{1,10})")
+HASHED_UPLOAD_STEM_LEN = 64
+EXPORT_NOTES_ENTRY = "notes.ndjson"
+EXPORT_UPLOADS_PREFIX = "uploads/"
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+# 导出时攒够这么多字节再交给响应发送
+EXPORT_CHUNK_BYTES = 64 * 1024
+# 最多返回的错误明细条数
+MAX_REPORTED_ERRORS = 50
+
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+
+class NoteImportError(ValueError):
+    """导入文件格式不正确"""
+
+
+class NoteImportTooLarge(NoteImportError):
+    """导入文件或其中的单条笔记超过大小限制"""
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """解析导出文件中的 ISO 时间，统一转换为数据库中保存的不带时区的 UTC 时间"""
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def note_row(record, user_id: str) -> dict:
+    """把一条导入记录转换成 notes 表的一行，格式不正确时抛出 NoteImportError"""
+    if not isinstance(record, dict):
+        raise NoteImportError("每条记录必须是 JSON 对象")
+    title = record.get("title", "新笔记")
+    content = record.get("content", "")
+    if not isinstance(title, str) or not isinstance(content, str):
+        raise NoteImportError("title 和 content 必须是字符串")
+    now = datetime.utcnow()
+    created_at = parse_timestamp(record.get("createdAt")) or now
+    return {
+        # 总是分配新的ID，避免和已有笔记冲突；同一文件重复导入会得到两份笔记
+        "id": str(uuid.uuid4()),
+        "title": title or "新笔记",
+        "content": content,
+        "user_id": user_id,
+        "created_at": created_at,
+        "updated_at": parse_timestamp(record.get("updatedAt")) or created_at,
+        "version": 1,
+    }
+
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s+(.*)$")
+_SAFE_URL_RE = re.compile(r"^(https?:|mailto:|/|#|\.)", re.IGNORECASE)
+
+
+def _link(match: re.Match, image: bool) -> str:
+    text, url = match.group(1), match.group(2)
+    if not _SAFE_URL_RE.match(url):
+        return text
+    return f'<img src="{url}" alt="{text}">' if image else f'<a href="{url}">{text}</a>'
+
+
+_INLINE_RULES = [
+    (re.compile(r"!\[([^\]]*)\]\(([^)\s]+)\)"), lambda m: _link(m, image=True)),
+    (re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)"), lambda m: _link(m, image=False)),
+    (re.compile(r"\*\*(.+?)\*\*|__(.+?)__"), lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>"),
+    (re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)"),
+     lambda m: f"<em>{m.group(1) or m.group(2)}</em>"),
+]
+
+
+def _render_inline(text: str) -> str:
+    # 行内代码先取出来，内容不再做其他替换
+    parts = re.split(r"(`[^`]+`)", text)
+    rendered = []
+    for part in parts:
+        if len(part) > 2 and part.startswith("`") and part.endswith("`"):
+            rendered.append(f"<code>{html.escape(part[1:-1])}</code>")
+            continue
+        part = html.escape(part)
+        for pattern, replacement in _INLINE_RULES:
+            part = pattern.sub(replacement, part)
+        rendered.append(part)
+    return "".join(rendered)
+
+
+def markdown_to_html(text: str) -> str:
+    """把 Markdown 转换成编辑器使用的 HTML
+
+    只支持常用语法：标题、段落、列表、引用、代码块、分隔线，以及加粗、斜体、行内代码、链接和图片。
+    """
+    blocks: list[str] = []
+    paragraph: list[str] = []
+    list_tag: Optional[str] = None
+    list_items: list[str] = []
+    code: Optional[list[str]] = None
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append("<p>" + _render_inline(" ".join(paragraph)) + "</p>")
+            paragraph.clear()
+
+    def end_list():
+        nonlocal list_tag
+        if list_tag:
+            blocks.append(f"<{list_tag}>" + "".join(f"<li><p>{item}</p></li>" for item in list_items) + f"</{list_tag}>")
+            list_items.clear()
+            list_tag = None
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if code is not None:
+            if line.strip().startswith("```"):
+                blocks.append("<pre><code>" + html.escape("\n".join(code)) + "</code></pre>")
+                code = None
+            else:
+                code.append(line)
+            continue
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            end_paragraph()
+            end_list()
+            code = []
+            continue
+        if not stripped:
+            end_paragraph()
+            end_list()
+            continue
+        heading = _HEADING_RE.match(stripped)
+        item = _LIST_RE.match(line)
+        if heading:
+            end_paragraph()
+            end_list()
+            level = len(heading.group(1))
+            blocks.append(f"<h{level}>{_render_inline(heading.group(2))}</h{level}>")
+        elif re.fullmatch(r"(-\s*){3,}|(\*\s*){3,}|(_\s*){3,}", stripped):
+            end_paragraph()
+            end_list()
+            blocks.append("<hr>")
+        elif stripped.startswith(">"):
+            end_paragraph()
+            end_list()
+            blocks.append("<blockquote><p>" + _render_inline(stripped.lstrip("> ")) + "</p></blockquote>")
+        elif item:
+            end_paragraph()
+            tag = "ol" if item.group(1)[0].isdigit() else "ul"
+            if list_tag != tag:
+                end_list()
+                list_tag = tag
+            list_items.append(_render_inline(item.group(2)))
+        else:
+            end_list()
+            paragraph.append(stripped)
+    if code is not None:
+        blocks.append("<pre><code>" + html.escape("\n".join(code)) + "</code></pre>")
+    end_paragraph()
+    end_list()
+    return "".join(blocks)
+
+
+def markdown_note(name: str, text: str) -> dict:
+    """Markdown 文件转换为导入记录：第一行一级标题作为笔记标题，否则使用文件名"""
+    lines = text.lstrip("﻿").split("\n", 1)
+    first = lines[0].strip()
+    if first.startswith("# "):
+        title = first[2:].strip()
+        body = lines[1] if len(lines) > 1 else ""
+    else:
+        title = os.path.splitext(os.path.basename(name))[0]
+        body = text
+    return {"title": title, "content": markdown_to_html(body)}
+
+
+class NoteImporter:
+    """把导入记录攒成批，每批在一个事务中用一条多行 INSERT 写入
+
+    单条记录格式错误只记入 errors，不影响其他记录；每写完一批通过 on_progress 报告进度。
+    """
+
+    def __init__(self, user_id: str, batch_size: int | None = None,
+                 on_progress: Optional[ProgressCallback] = None):
+        self.user_id = user_id
+        self.batch_size = batch_size or settings.notes_import_batch_size
+        self.on_progress = on_progress
+        self._batch: list[dict] = []
+        self.imported = 0
+        self.failed = 0
+        self.uploads = 0
+        self.errors: list[dict] = []
+
+    def fail(self, where: str, detail: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"at": where, "detail": detail})
+
+    async def add(self, where: str, record):
+        try:
+            self._batch.append(note_row(record, self.user_id))
+        except NoteImportError as e:
+            self.fail(where, str(e))
+            return
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._batch:
+            return
+        rows, self._batch = self._batch, []
+        async with AsyncSessionLocal() as db, db.begin():
+            seqs = await allocate_change_seqs(db, len(rows))
+            for change_seq, row in zip(seqs, rows):
+                row["change_seq"] = change_seq
+            # 直接对表执行 executemany，不经过 ORM 的逐对象处理
+            await db.execute(insert(Note.__table__), rows)
+        self.imported += len(rows)
+        await self.report(done=False)
+
+    async def report(self, done: bool):
+        if self.on_progress is not None:
+            await self.on_progress({"imported": self.imported, "failed": self.failed, "done": done})
+
+    async def finish(self) -> dict:
+        await self.flush()
+        await self.report(done=True)
+        return self.result()
+
+    def result(self) -> dict:
+        return {"imported": self.imported, "failed": self.failed, "uploads": self.uploads, "errors": self.errors}
+
+
+async def _add_line(importer: NoteImporter, where: str, line: bytes | None):
+    if line is None:
+        importer.fail(where, "超过单条笔记大小上限")
+        return
+    if not line.strip():
+        return
+    try:
+        record = json.loads(line)
+    except ValueError:
+        importer.fail(where, "不是有效的 JSON")
+        return
+    await importer.add(where, record)
+
+
+async def import_ndjson(importer: NoteImporter, stream: AsyncIterator[bytes],
+                        max_bytes: int | None = None, max_line_bytes: int | None = None) -> dict:
+    """边读请求体边解析 NDJSON，内存中最多只有一行和一个批次"""
+    max_bytes = max_bytes or settings.notes_import_max_bytes
+    max_line_bytes = max_line_bytes or settings.notes_import_max_note_bytes
+    buffer = b""
+    received = 0
+    line_no = 0
+
+    async def handle(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        await _add_line(importer, f"line {line_no}", line)
+
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_bytes:
+            raise NoteImportTooLarge(f"导入文件超过上限 {max_bytes // (1024 * 1024)}MB")
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            await handle(line)
+        if len(buffer) > max_line_bytes:
+            raise NoteImportTooLarge(f"第 {line_no + 1} 行超过单条笔记上限 {max_line_bytes // (1024 * 1024)}MB")
+    await handle(buffer)
+    return await importer.finish()
+
+
+async def spool_to_tempfile(stream: AsyncIterator[bytes], max_bytes: int | None = None) -> str:
+    """把请求体写入临时文件（zip 需要随机读取），返回文件路径，由调用方删除"""
+    max_bytes = max_bytes or settings.notes_import_max_bytes
+    fd, path = tempfile.mkstemp(prefix="note-import-", suffix=".zip")
+    received = 0
+    try:
+        with os.fdopen(fd, "wb") as file:
+            async for chunk in stream:
+                received += len(chunk)
+                if received > max_bytes:
+                    raise NoteImportTooLarge(f"导入文件超过上限 {max_bytes // (1024 * 1024)}MB")
+                await asyncio.to_thread(file.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _restore_upload(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bool:
+    """把导出包中的上传文件放回上传目录
+
+    按内容哈希命名的文件，文件名必须和内容哈希一致；旧的随机文件名无从校验，原样恢复。
+    上传目录中已有同名文件时不覆盖。
+    """
+    filename = info.filename[len(EXPORT_UPLOADS_PREFIX):]
+    if not UPLOAD_REF_RE.fullmatch(f"/static/uploads/{filename}") or info.file_size > settings.upload_max_bytes:
+        return False
+    target = os.path.join(UPLOAD_DIR, filename)
+    if os.path.exists(target):
+        return True
+    digest = hashlib.sha256()
+    temp = os.path.join(UPLOAD_DIR, f".import-{os.urandom(8).hex()}.tmp")
+    try:
+        with archive.open(info) as source, open(temp, "wb") as out:
+            while chunk := source.read(1024 * 1024):
+                digest.update(chunk)
+                out.write(chunk)
+        stem = filename.split(".", 1)[0]
+        if len(stem) == HASHED_UPLOAD_STEM_LEN and digest.hexdigest() != stem:
+            return False
+        os.replace(temp, target)
+        return True
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def _read_zip_entries(archive: zipfile.ZipFile, infos: list[zipfile.ZipInfo]) -> list[tuple[str, object]]:
+    """读取一组条目（在线程中执行），返回 (位置, 记录或错误) 列表；上传文件返回 ("upload", 是否恢复)"""
+    results = []
+    for info in infos:
+        name = info.filename
+        try:
+            if name.startswith(EXPORT_UPLOADS_PREFIX):
+                results.append(("upload", _restore_upload(archive, info)))
+            elif name.lower().endswith(MARKDOWN_EXTENSIONS):
+                if info.file_size > settings.notes_import_max_note_bytes:
+                    results.append((name, NoteImportError("超过单条笔记大小上限")))
+                    continue
+                text = archive.read(info).decode("utf-8", errors="replace")
+                results.append((name, markdown_note(name, text)))
+        except (OSError, zipfile.BadZipFile, RuntimeError) as e:
+            results.append((name, NoteImportError(f"无法读取: {e}")))
+    return results
+
+
+def _read_lines(archive: zipfile.ZipFile, info: zipfile.ZipInfo, count: int):
+    """按批读取 zip 中的 NDJSON 条目，每次产出至多 count 行；过长的行以 None 代替"""
+    with archive.open(info) as source:
+        batch = []
+        for line in source:
+            batch.append(None if len(line) > settings.notes_import_max_note_bytes else line)
+            if len(batch) >= count:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+async def _import_entries(importer: NoteImporter, archive: zipfile.ZipFile, infos: list[zipfile.ZipInfo]):
+    for start in range(0, len(infos), importer.batch_size):
+        entries = await asyncio.to_thread(_read_zip_entries, archive, infos[start:start + importer.batch_size])
+        for where, record in entries:
+            if where == "upload":
+                importer.uploads += bool(record)
+            elif isinstance(record, NoteImportError):
+                importer.fail(where, str(record))
+            else:
+                await importer.add(where, record)
+
+
+async def import_zip(importer: NoteImporter, path: str) -> dict:
+    """导入 zip：Markdown 文件各为一条笔记，*.ndjson 按行导入（本应用的导出格式），
+    uploads/ 下的文件恢复到上传目录。读取和解压在线程中按批进行。
+    """
+    try:
+        archive = await asyncio.to_thread(zipfile.ZipFile, path)
+    except zipfile.BadZipFile:
+        raise NoteImportError("不是有效的 zip 文件")
+    with archive:
+        infos = [info for info in archive.infolist() if not info.is_dir() and "__MACOSX/" not in info.filename]
+        # 先恢复上传文件，笔记写入后引用的图片就能立即访问
+        await _import_entries(importer, archive, [
+            info for info in infos if info.filename.startswith(EXPORT_UPLOADS_PREFIX)
+        ])
+        for info in infos:
+            if not info.filename.lower().endswith(".ndjson"):
+                continue
+            batches = _read_lines(archive, info, importer.batch_size)
+            line_no = 0
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                for line in batch:
+                    line_no += 1
+                    await _add_line(importer, f"{info.filename}:{line_no}", line)
+        await _import_entries(importer, archive, [
+            info for info in infos if info.filename.lower().endswith(MARKDOWN_EXTENSIONS)
+        ])
+    return await importer.finish()
+
+
+def _note_query(user_id: str):
+    return (
+        select(Note.id, Note.title, Note.content, Note.created_at, Note.updated_at, Note.version)
+        .where(Note.user_id == user_id)
+        .order_by(Note.created_at, Note.id)
+        .execution_options(yield_per=500)
+    )
+
+
+def _note_line(row) -> bytes:
+    record = {
+        "id": row.id,
+        "title": row.title,
+        "content": row.content,
+        "createdAt": format_datetime(row.created_at),
+        "updatedAt": format_datetime(row.updated_at),
+        "version": row.version,
+    }
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def export_ndjson(user_id: str) -> AsyncIterator[bytes]:
+    """逐行导出用户的全部笔记，服务端游标每次只取一批"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_note_query(user_id))
+        chunk = []
+        size = 0
+        async for row in result:
+            line = _note_line(row)
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+
+
+class _ChunkSink:
+    """zipfile 的输出目标：不可 seek，写入的数据由导出生成器取走后发送"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+def referenced_uploads(content: str) -> Iterable[str]:
+    return UPLOAD_REF_RE.findall(content)
+
+
+async def export_zip(user_id: str) -> AsyncIterator[bytes]:
+    """导出 zip：notes.ndjson 加上笔记引用的上传文件（uploads/ 目录）
+
+    zip 以数据描述符方式流式生成，不需要知道条目大小；笔记和文件都是边读边发，
+    内存中只有当前的一个分块。图片等上传文件本身已压缩，按存储方式写入。
+    """
+    sink = _ChunkSink()
+    uploads: set[str] = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(EXPORT_NOTES_ENTRY, "w", force_zip64=True) as entry:
+            async with AsyncSessionLocal() as db:
+                result = await db.stream(_note_query(user_id))
+                async for row in result:
+                    entry.write(_note_line(row))
+                    uploads.update(referenced_uploads(row.content))
+                    if sink.size >= EXPORT_CHUNK_BYTES:
+                        yield sink.drain()
+
+        for filename in sorted(uploads):
+            path = os.path.join(UPLOAD_DIR, filename)
+            if not await asyncio.to_thread(os.path.isfile, path):
+                continue
+            info = zipfile.ZipInfo.from_file(path, EXPORT_UPLOADS_PREFIX + filename)
+            info.compress_type = zipfile.ZIP_STORED
+            source = await asyncio.to_thread(open, path, "rb")
+            try:
+                with archive.open(info, "w", force_zip64=True) as entry:
+                    while chunk := await asyncio.to_thread(source.read, 1024 * 1024):
+                        entry.write(chunk)
+                        if sink.size >= EXPORT_CHUNK_BYTES:
+                            yield sink.drain()
+            finally:
+                await asyncio.to_thread(source.close)
+    yield sink.drain()
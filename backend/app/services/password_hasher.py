@@ -0,0 +1,113 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from passlib.context import CryptContext
+from app.config import settings
+import asyncio
+import math
+import time
+
+# 密码加密上下文；调整 rounds 后旧的哈希仍可验证
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.auth_bcrypt_rounds,
+)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _timed(func, *args):
+    """在工作线程/进程中执行，返回结果和纯计算耗时（不含排队时间）"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class HasherBusy(Exception):
+    """排队的哈希任务已达上限，调用方应稍后重试"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"密码校验繁忙，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """在独立的有界线程池/进程池中执行 bcrypt
+
+    bcrypt 每次计算要耗费上百毫秒 CPU，直接在事件循环里执行会卡住所有流式响应和 WebSocket。
+    排队的任务超过 max_pending 时直接拒绝，由接口返回 429，而不是无限堆积。
+    """
+
+    def __init__(self, workers: int, max_pending: int, executor: str = "thread"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_type = executor
+        self._executor: Executor | None = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._avg_seconds = 0.25  # 单次哈希耗时的滑动平均，用于估算 Retry-After
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.pending / self.workers * self._avg_seconds))
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy(self.retry_after())
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(_timed, func, *args)
+        self.pending += 1
+        # 在任务真正结束（或排队时被取消）时计数，而不是在等待它的协程里：
+        # 协程被取消后工作线程可能仍在计算，这段时间仍要算作排队中
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self._finished, done))
+        result, _ = await asyncio.wrap_future(future)
+        return result
+
+    def _finished(self, future):
+        self.pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.completed += 1
+        self._avg_seconds = self._avg_seconds * 0.9 + future.result()[1] * 0.1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avgSeconds": round(self._avg_seconds, 4),
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.auth_hash_workers,
+    max_pending=settings.auth_hash_max_pending,
+    executor=settings.auth_hash_executor,
+)
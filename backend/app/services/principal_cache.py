@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import event
+from app.config import settings
+from app.models import User
+import hashlib
+import time
+
+
+def password_fingerprint(password_hash: str) -> str:
+    """密码哈希的短指纹，写入 token；修改密码后旧 token 的指纹对不上即失效"""
+    return hashlib.sha256(password_hash.encode("utf-8")).hexdigest()[:16]
+
+
+class PrincipalCache:
+    """已认证用户的进程内 LRU + TTL 缓存
+
+    缓存的是与会话分离的 User 对象，只能读取列属性，不能访问 notes 等关系。
+    用户被修改或删除时通过 ORM 事件立即失效；其他进程中的修改最多在 TTL 之后生效。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[User, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, user_id: str) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, user: User):
+        if not self.enabled:
+            return
+        self._entries[user.id] = (user, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds,
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target: User):
+    principal_cache.invalidate(target.id)
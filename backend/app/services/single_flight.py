@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Optional
+from app.config import settings
+import asyncio
+import uuid
+
+
+class Flight:
+    """一次进行中的上游流式调用，以及它已经产出的全部chunk"""
+
+    def __init__(self, key: str):
+        self.key = key
+        # 续传时用来找回这次调用，随机生成，不能由请求内容推出
+        self.id = uuid.uuid4().hex
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        # 最后一个订阅者离开后，延迟取消上游调用的定时器
+        self._abandon: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return isinstance(self.error, asyncio.CancelledError)
+
+    def notify(self):
+        # 唤醒当前所有等待者，再换一个新的Event给后续等待者使用
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """请求合并：相同key的并发请求共享同一个上游流
+
+    第一个请求启动上游调用，之后加入的订阅者先收到已经产出的chunk，再接收实时的后续内容。
+    所有订阅者都离开后等待 grace_seconds，期间没有人重新订阅就取消上游调用。
+    调用结束后已产出的chunk再保留 retain_seconds，断线的客户端可以按 flight.id 和序号续传。
+    """
+
+    def __init__(self, grace_seconds: float = 0.0, retain_seconds: float = 0.0, max_retained: int = 0):
+        self.grace_seconds = grace_seconds
+        self.retain_seconds = retain_seconds
+        self.max_retained = max_retained
+        # 进行中的调用，按请求内容查找
+        self._flights: Dict[str, Flight] = {}
+        # 可以续传的调用（进行中的和刚结束的），按 flight.id 查找，按创建顺序排列
+        self._resumable: "OrderedDict[str, Flight]" = OrderedDict()
+        self.started = 0
+        self.joined = 0
+        self.resumed = 0
+        self.abandoned = 0
+
+    def join(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> Flight:
+        """加入相同key的进行中调用，没有时启动新的调用"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.joined += 1
+            return flight
+        flight = Flight(key)
+        self._flights[key] = flight
+        self._resumable[flight.id] = flight
+        flight.task = asyncio.create_task(self._run(flight, factory))
+        self.started += 1
+        self._trim()
+        return flight
+
+    def resume(self, flight_id: str, key: str, count: bool = True) -> Optional[Flight]:
+        """按 id 找回调用，不存在、已过期、已取消或内容不符时返回 None"""
+        flight = self._resumable.get(flight_id)
+        if flight is None or flight.key != key or flight.cancelled:
+            return None
+        if count:
+            self.resumed += 1
+        return flight
+
+    def in_flight(self, key: str) -> bool:
+        """相同key的调用是否正在进行（加入它不会产生新的上游调用）"""
+        return key in self._flights
+
+    def _enter(self, flight: Flight):
+        flight.subscribers += 1
+        if flight._abandon is not None:
+            flight._abandon.cancel()
+            flight._abandon = None
+
+    def _leave(self, flight: Flight):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            if self.grace_seconds > 0:
+                flight._abandon = asyncio.get_running_loop().call_later(self.grace_seconds, self._cancel, flight)
+            else:
+                self._cancel(flight)
+
+    async def subscribe(self, flight: Flight, start: int = 0) -> AsyncGenerator[tuple[int, str], None]:
+        """从第 start 个chunk开始产出 (序号, chunk)，直到调用结束"""
+        self._enter(flight)
+        try:
+            index = start
+            while True:
+                while index < len(flight.chunks):
+                    yield index, flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight._changed.wait()
+        finally:
+            self._leave(flight)
+
+    async def subscribe_batches(
+        self, flight: Flight, start: int = 0, window: float = 0.0, max_chars: int = 0
+    ) -> AsyncGenerator[tuple[int, list[str]], None]:
+        """按时间窗口合并chunk，产出 (最后一个chunk的序号, chunk列表)
+
+        距离上一批已经超过 window 秒、积累超过 max_chars 个字符或调用已结束时立即产出，
+        否则等到窗口结束再把期间到达的chunk一起产出。第一批不等待，上游慢于窗口时每个chunk也不会被推迟。
+        window 为 0 时逐个产出。
+        """
+        self._enter(flight)
+        loop = asyncio.get_running_loop()
+        try:
+            index = start
+            last_batch = None
+            while True:
+                # window 为 0 时不合并，每批只有一个chunk
+                end = len(flight.chunks) if window > 0 else min(len(flight.chunks), index + 1)
+                if end > index:
+                    now = loop.time()
+                    due = (
+                        last_batch is None or flight.done or window <= 0 or now - last_batch >= window
+                        or (max_chars and sum(len(chunk) for chunk in flight.chunks[index:end]) >= max_chars)
+                    )
+                    if due:
+                        yield end - 1, flight.chunks[index:end]
+                        index = end
+                        last_batch = loop.time()
+                        continue
+                    # 等新的chunk（可能凑够 max_chars）或窗口结束，两者都会回到上面重新判断
+                    try:
+                        await asyncio.wait_for(flight._changed.wait(), last_batch + window - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight._changed.wait()
+        finally:
+            self._leave(flight)
+
+    async def stream(
+        self, key: str, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncGenerator[str, None]:
+        async for _, chunk in self.subscribe(self.join(key, factory)):
+            yield chunk
+
+    def _cancel(self, flight: Flight):
+        """没有订阅者了：取消上游调用，新的请求不再加入这次调用"""
+        flight._abandon = None
+        if flight.subscribers or flight.done:
+            return
+        self.abandoned += 1
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        self._resumable.pop(flight.id, None)
+        flight.task.cancel()
+
+    async def _run(self, flight: Flight, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError as e:
+            flight.error = e
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if flight.cancelled or self.retain_seconds <= 0:
+                self._resumable.pop(flight.id, None)
+            elif flight.id in self._resumable:
+                asyncio.get_running_loop().call_later(self.retain_seconds, self._resumable.pop, flight.id, None)
+            flight.notify()
+
+    def _trim(self):
+        """可续传的调用超过上限时，丢弃最早结束的"""
+        if len(self._resumable) <= self.max_retained:
+            return
+        for flight_id in [flight_id for flight_id, flight in self._resumable.items() if flight.done]:
+            del self._resumable[flight_id]
+            if len(self._resumable) <= self.max_retained:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._flights),
+            "subscribers": sum(flight.subscribers for flight in self._flights.values()),
+            "resumable": len(self._resumable),
+            "started": self.started,
+            "joined": self.joined,
+            "resumed": self.resumed,
+            "abandoned": self.abandoned,
+        }
+
+
+single_flight = SingleFlight(
+    grace_seconds=settings.ai_resume_grace_seconds,
+    retain_seconds=settings.ai_resume_retain_seconds,
+    max_retained=settings.ai_resume_max_buffers,
+)
@@ -0,0 +1,53 @@
+from contextlib import aclosing
+from typing import AsyncIterator
+from app.services import metrics
+import zlib
+
+# Content-Encoding -> zlib 的 wbits：gzip 带 gzip 头，deflate 按 HTTP 规范是 zlib 格式
+ENCODING_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def negotiate_encoding(accept_encoding: str | None, allowed: list[str]) -> str | None:
+    """按 allowed 的顺序选第一个客户端接受的压缩格式，都不接受时返回 None（不压缩）"""
+    if not accept_encoding or not allowed:
+        return None
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in allowed:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+async def encode_event_stream(
+    frames: AsyncIterator[str], encoding: str | None = None, level: int = 6
+) -> AsyncIterator[bytes]:
+    """把 SSE 事件编码成发送的字节，按需压缩
+
+    压缩时每个事件之后做一次 Z_SYNC_FLUSH，把已压缩的数据完整输出，客户端收到后就能解出这个事件，
+    同时保留压缩字典，后面的事件仍能引用之前出现过的内容（JSON 字段名、重复的词）。
+    """
+    label = encoding or "identity"
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODING_WBITS[encoding]) if encoding else None
+    # 提前退出时立即关闭上游生成器，不等垃圾回收
+    async with aclosing(frames):
+        async for frame in frames:
+            data = frame.encode("utf-8")
+            if compressor is not None:
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            metrics.ai_sse_frames.inc()
+            metrics.ai_sse_bytes.labels(label).inc(len(data))
+            yield data
+    if compressor is not None:
+        tail = compressor.flush()
+        metrics.ai_sse_bytes.labels(label).inc(len(tail))
+        yield tail
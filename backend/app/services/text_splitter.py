@@ -0,0 +1,78 @@
+import re
+
+
+# 可以作为切分点的块级结束标签（编辑器保存的是HTML）
+_BLOCK_END_RE = re.compile(r"</(?:p|h[1-6]|ul|ol|blockquote|pre|table|div)>", re.IGNORECASE)
+# 会包含其他块的容器标签，位于其内部时不切分
+_CONTAINER_RE = re.compile(r"<(/?)(ul|ol|blockquote|pre|table)\b[^>]*>", re.IGNORECASE)
+_BLANK_LINE_RE = re.compile(r"\n[ \t]*\n")
+_HEADING_RE = re.compile(r"^\s*(?:<h[1-6]\b|#{1,6}\s)", re.IGNORECASE)
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？；.!?;\n])")
+
+
+def _split_blocks(text: str) -> list[str]:
+    """按段落/标题等块级边界切分，返回的块首尾相接即为原文"""
+    boundaries = set()
+    depth = 0
+    events = [(m.end(), "tag", m) for m in _CONTAINER_RE.finditer(text)]
+    events += [(m.end(), "end", m) for m in _BLOCK_END_RE.finditer(text)]
+    events += [(m.end(), "blank", m) for m in _BLANK_LINE_RE.finditer(text)]
+    # 同一位置先处理容器标签，保证 </ul> 本身可以作为切分点
+    for pos, kind, match in sorted(events, key=lambda e: (e[0], e[1] != "tag")):
+        if kind == "tag":
+            depth = max(0, depth + (-1 if match.group(1) else 1))
+        elif depth == 0:
+            boundaries.add(pos)
+
+    blocks = []
+    start = 0
+    for pos in sorted(boundaries):
+        if pos > start:
+            blocks.append(text[start:pos])
+            start = pos
+    if start < len(text):
+        blocks.append(text[start:])
+    return blocks
+
+
+def _split_oversized(block: str, max_chars: int) -> list[str]:
+    """单个块超过上限时按句子切分，仍然过长则硬切"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(block):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if len(current) + len(sentence) > max_chars and current:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_document(text: str, max_chars: int) -> list[str]:
+    """把长文档切分成长度约为 max_chars 的片段
+
+    优先在标题处开始新片段，其次在段落边界处切分；片段按顺序拼接即为原文。
+    """
+    chunks = []
+    current = ""
+    for block in _split_blocks(text):
+        pieces = _split_oversized(block, max_chars) if len(block) > max_chars else [block]
+        for piece in pieces:
+            # 很短的片段（例如单独的标题）不单独成段，允许略微超出上限
+            too_long = len(current) + len(piece) > max_chars and len(current) >= max_chars // 10
+            # 标题前面已经积累了足够多的内容时，从标题处另起一个片段
+            new_section = _HEADING_RE.match(piece) and len(current) >= max_chars // 2
+            if current and (too_long or new_section):
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
@@ -0,0 +1,72 @@
+from app.config import settings
+import logging
+
+try:
+    from opentelemetry import trace
+except ImportError:  # 未安装 opentelemetry 时所有 span 都是空操作
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+_tracer = None
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def init_tracing():
+    """按配置启用 OpenTelemetry
+
+    安装了 opentelemetry-sdk 和 OTLP 导出器时，在这里创建 TracerProvider，导出地址等
+    使用 OTEL_EXPORTER_OTLP_* 环境变量；只安装了 API 时使用外部（例如 opentelemetry-instrument）
+    配置好的全局 TracerProvider。
+    """
+    global _tracer
+    if not settings.otel_enabled:
+        return
+    if trace is None:
+        logger.warning("已启用 OTEL_ENABLED，但未安装 opentelemetry-api，不记录 span")
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.info("未安装 opentelemetry-sdk / OTLP 导出器，使用全局 TracerProvider")
+    else:
+        provider = TracerProvider(resource=Resource.create({"service.name": settings.otel_service_name}))
+        # 批量导出在后台线程中进行，不阻塞请求
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("app")
+
+
+def start_span(name: str, **attributes):
+    """开始一个 span，调用方负责 end()
+
+    流式响应跨越多次 yield，不适合用上下文管理器把 span 设为当前 span，
+    这里只以调用时的当前上下文为父节点。未启用时返回空操作的 span。
+    """
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, attributes={key: value for key, value in attributes.items() if value is not None})
+
+
+def end_span(span, error: BaseException | None = None):
+    """结束 span，有异常时记录异常并标记为错误"""
+    if error is not None and span is not NOOP_SPAN:
+        span.record_exception(error)
+        span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+    span.end()
@@ -0,0 +1,197 @@
+from typing import AsyncIterator, Optional
+from multipart.multipart import MultipartParser, parse_options_header
+from app.config import settings
+import asyncio
+import hashlib
+import os
+import re
+
+UPLOAD_DIR = os.path.join(os.getcwd(), "data", "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+_EXT_RE = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+
+
+class UploadError(ValueError):
+    """请求格式不正确或缺少文件"""
+
+
+class UploadTooLarge(UploadError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"文件大小超过上限 {max_bytes // (1024 * 1024)}MB")
+        self.max_bytes = max_bytes
+
+
+# 按文件头识别的常见格式和它们的规范扩展名
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+    (b"%PDF-", ".pdf"),
+]
+# 同一格式的其他写法，统一成一个扩展名
+_EXT_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".jfif": ".jpg", ".tif": ".tiff", ".htm": ".html"}
+# 识别格式需要的文件头长度
+SNIFF_BYTES = 16
+
+
+def safe_extension(filename: str | None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _EXT_RE.match(ext) else ""
+
+
+def sniff_extension(head: bytes) -> str | None:
+    """按文件头判断格式，返回规范扩展名，无法识别时返回 None"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def upload_extension(head: bytes, filename: str | None) -> str:
+    """保存时使用的扩展名：能从内容识别格式时以内容为准，否则规范化文件名中的扩展名
+
+    文件按内容哈希加扩展名命名，扩展名不统一时，同一张图以 .jpg 和 .jpeg 上传会保存两份。
+    """
+    sniffed = sniff_extension(head)
+    if sniffed is not None:
+        return sniffed
+    ext = safe_extension(filename)
+    return _EXT_ALIASES.get(ext, ext)
+
+
+class HashingWriter:
+    """边写临时文件边计算 SHA-256，完成后按内容哈希命名
+
+    文件读写放到线程中执行，不阻塞事件循环；内存中最多只有一个分块。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        # 文件开头的几个字节，用于识别格式
+        self.head = b""
+        self._hash = hashlib.sha256()
+        self._path = os.path.join(directory, f".upload-{os.urandom(8).hex()}.tmp")
+        self._file = None
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        if self._file is None:
+            self._file = await asyncio.to_thread(open, self._path, "wb")
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+        self._hash.update(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self, ext: str) -> tuple[str, bool]:
+        """返回 (文件名, 是否新建)；相同内容的文件已存在时直接复用"""
+        if self._file is None:
+            self._file = await asyncio.to_thread(open, self._path, "wb")
+        await asyncio.to_thread(self._file.close)
+        filename = self._hash.hexdigest() + ext
+        target = os.path.join(self.directory, filename)
+        if await asyncio.to_thread(os.path.exists, target):
+            await asyncio.to_thread(os.remove, self._path)
+            return filename, False
+        await asyncio.to_thread(os.replace, self._path, target)
+        return filename, True
+
+    async def abort(self):
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+        if await asyncio.to_thread(os.path.exists, self._path):
+            await asyncio.to_thread(os.remove, self._path)
+
+
+async def save_multipart_file(
+    content_type: str,
+    stream: AsyncIterator[bytes],
+    field: str = "file",
+    max_bytes: Optional[int] = None,
+) -> dict:
+    """流式解析 multipart 请求体，把指定字段的文件按内容哈希保存到上传目录
+
+    超过 max_bytes 时立即中止并删除临时文件，不会把整个请求体读进内存。
+    """
+    max_bytes = max_bytes or settings.upload_max_bytes
+    mime, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if mime != b"multipart/form-data" or not boundary:
+        raise UploadError("请求必须是 multipart/form-data")
+
+    # 解析器的回调是同步的，先收集事件，每喂完一个分块再异步处理
+    events: list[tuple[str, object]] = []
+    header_name = b""
+    header_value = b""
+    headers: dict[bytes, bytes] = {}
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        nonlocal header_name
+        header_name += data[start:end]
+
+    def on_header_value(data, start, end):
+        nonlocal header_value
+        header_value += data[start:end]
+
+    def on_header_end():
+        nonlocal header_name, header_value
+        headers[header_name.lower()] = header_value
+        header_name = header_value = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        events.append(("begin", options))
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    writer: Optional[HashingWriter] = None
+    filename = None
+    result = None
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            for kind, value in events:
+                if kind == "begin":
+                    if value.get(b"name", b"").decode() == field and b"filename" in value and result is None:
+                        filename = value[b"filename"].decode("utf-8", errors="ignore")
+                        writer = HashingWriter(UPLOAD_DIR, max_bytes)
+                elif kind == "data" and writer is not None:
+                    await writer.write(value)
+                elif kind == "end" and writer is not None:
+                    stored, created = await writer.commit(upload_extension(writer.head, filename))
+                    result = {"filename": stored, "size": writer.size, "created": created}
+                    writer = None
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if writer is not None:
+            await writer.abort()
+        raise
+    if result is None:
+        raise UploadError("No file uploaded")
+    return result
@@ -0,0 +1,273 @@
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
+from app.config import settings
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 收到其他进程广播时的回调：(频道, 消息文本)
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+
+class MemoryBackplane:
+    """进程内的广播总线（默认），只在同一进程的 ConnectionManager 之间转发
+
+    单 worker 部署时不需要任何外部服务；多 worker 或多节点部署请使用 RedisBackplane。
+    """
+
+    _hubs: dict[str, set["MemoryBackplane"]] = {}
+
+    def __init__(self, hub: str = "default"):
+        self.hub = hub
+        self._handler: Optional[MessageHandler] = None
+        self._channels: set[str] = set()
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+        self._hubs.setdefault(self.hub, set()).add(self)
+
+    async def stop(self):
+        self._hubs.get(self.hub, set()).discard(self)
+
+    async def subscribe(self, channel: str):
+        self._channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self._channels.discard(channel)
+
+    async def publish(self, channel: str, data: str):
+        self.published += 1
+        for peer in list(self._hubs.get(self.hub, ())):
+            if peer is not self and channel in peer._channels and peer._handler is not None:
+                peer.received += 1
+                await peer._handler(channel, data)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "channels": len(self._channels),
+                "published": self.published, "received": self.received}
+
+
+class RespError(Exception):
+    """Redis 返回的错误回复"""
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    """读取一条 RESP2 回复"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("连接已关闭")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body.decode()
+    if prefix == b"-":
+        raise RespError(body.decode())
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"无法解析的回复: {line!r}")
+
+
+def _encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class RedisBackplane:
+    """基于 Redis PUBLISH/SUBSCRIBE 的跨进程广播总线
+
+    直接实现 RESP 协议，不依赖 redis 客户端库。使用两条连接：一条只用于订阅和接收，
+    一条用于发布。订阅连接断开后自动重连并重新订阅所有频道，断开期间的消息会丢失，
+    客户端重新连接 WebSocket 后会拿到最新内容。
+
+    publish 只把消息放进队列立即返回，由后台任务把积压的消息以流水线方式批量发出，
+    Redis 变慢或不可用时不会阻塞触发广播的请求；连接和读取回复都有超时，失败的批次记录日志后丢弃。
+    """
+
+    def __init__(self, url: str, prefix: str = "ai-notebook:ws:", timeout: float | None = None,
+                 queue_size: int | None = None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.prefix = prefix
+        self.timeout = timeout or settings.ws_backplane_timeout
+        self._handler: Optional[MessageHandler] = None
+        self._channels: set[str] = set()
+        self._sub_writer: Optional[asyncio.StreamWriter] = None
+        self._pub: Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._pub_queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(queue_size or settings.ws_backplane_queue_size)
+        self._publisher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self.dropped = 0
+
+    async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        if self.password:
+            writer.write(_encode_command("AUTH", self.password))
+            try:
+                await asyncio.wait_for(writer.drain(), self.timeout)
+                await asyncio.wait_for(_read_reply(reader), self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+        self._listener = asyncio.create_task(self._listen())
+        self._publisher = asyncio.create_task(self._publish_loop())
+        # 等待首次连接，连不上时不阻止应用启动，由后台任务继续重试
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("无法连接广播总线 %s:%s，将在后台重试", self.host, self.port)
+
+    async def stop(self):
+        for task in (self._listener, self._publisher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = None
+        self._publisher = None
+        for writer in (self._sub_writer, self._pub[1] if self._pub else None):
+            if writer is not None:
+                writer.close()
+        self._sub_writer = None
+        self._pub = None
+
+    async def _listen(self):
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await self._open()
+                self._sub_writer = writer
+                if self._channels:
+                    writer.write(_encode_command("SUBSCRIBE", *(self.prefix + c for c in self._channels)))
+                    await writer.drain()
+                self._connected.set()
+                delay = 0.1
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        channel = reply[1].decode()[len(self.prefix):]
+                        self.received += 1
+                        try:
+                            await self._handler(channel, reply[2].decode("utf-8"))
+                        except Exception as e:
+                            logger.exception("处理广播消息失败: %s", e)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, RespError, asyncio.IncompleteReadError) as e:
+                self._connected.clear()
+                self._sub_writer = None
+                self.reconnects += 1
+                logger.warning("广播总线连接断开，%.1fs 后重连: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def _send_subscription(self, command: str, channel: str):
+        writer = self._sub_writer
+        if writer is None:
+            # 尚未连上，重连后会统一订阅
+            return
+        try:
+            writer.write(_encode_command(command, self.prefix + channel))
+            await writer.drain()
+        except (OSError, ConnectionError):
+            pass
+
+    async def subscribe(self, channel: str):
+        if channel not in self._channels:
+            self._channels.add(channel)
+            await self._send_subscription("SUBSCRIBE", channel)
+
+    async def unsubscribe(self, channel: str):
+        if channel in self._channels:
+            self._channels.discard(channel)
+            await self._send_subscription("UNSUBSCRIBE", channel)
+
+    async def publish(self, channel: str, data: str):
+        """放入发布队列后立即返回；队列已满（Redis 长时间不可用）时丢弃消息"""
+        try:
+            self._pub_queue.put_nowait((channel, data))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("广播总线发布队列已满，已丢弃 %d 条消息", self.dropped)
+
+    async def _publish_loop(self):
+        delay = 0.1
+        while True:
+            batch = [await self._pub_queue.get()]
+            while not self._pub_queue.empty():
+                batch.append(self._pub_queue.get_nowait())
+            try:
+                await self._publish_batch(batch)
+                delay = 0.1
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                if self._pub is not None:
+                    self._pub[1].close()
+                    self._pub = None
+                self.dropped += len(batch)
+                logger.warning("发布广播消息失败，丢弃 %d 条，%.1fs 后重试: %r", len(batch), delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def _publish_batch(self, batch: list[tuple[str, str]]):
+        """一次写出整批 PUBLISH，再依次读取回复"""
+        if self._pub is None:
+            self._pub = await self._open()
+        reader, writer = self._pub
+        writer.write(b"".join(_encode_command("PUBLISH", self.prefix + channel, data) for channel, data in batch))
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        for _ in batch:
+            try:
+                await asyncio.wait_for(_read_reply(reader), self.timeout)
+                self.published += 1
+            except RespError as e:
+                self.dropped += 1
+                logger.warning("Redis 拒绝了广播消息: %s", e)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "connected": self._connected.is_set(), "channels": len(self._channels),
+                "published": self.published, "received": self.received, "reconnects": self.reconnects,
+                "pending": self._pub_queue.qsize(), "dropped": self.dropped}
+
+
+def create_backplane():
+    if settings.ws_backplane == "redis":
+        return RedisBackplane(settings.ws_backplane_url, settings.ws_backplane_prefix,
+                              settings.ws_backplane_timeout, settings.ws_backplane_queue_size)
+    return MemoryBackplane()
+
+
+# 本进程的标识，用于忽略自己发布后又从总线收到的消息
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,117 @@
+from collections import deque
+from typing import Optional
+from fastapi import WebSocket
+import asyncio
+import json
+
+# 关闭慢连接时使用的状态码：1013 Try Again Later，客户端会自动重连并重新同步
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """一个 WebSocket 连接的发送端
+
+    所有发往该连接的消息都先进入有界的发送队列，由独立的发送任务逐条写出，
+    广播方只负责入队，不会被某个慢客户端拖住。
+    同一个 conflate_key 的消息（例如同一笔记的完整快照）在队列中只保留最新一条；
+    积压超过 max_pending 或单次发送超过 send_timeout 时视为慢消费者，直接断开。
+    """
+
+    def __init__(self, websocket: WebSocket, max_pending: int, send_timeout: float):
+        self.websocket = websocket
+        self.user_id: Optional[str] = None
+        # 连接时指定的笔记（编辑器页面），用于统计每条笔记的在线连接数
+        self.note_id: Optional[str] = None
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        # 队列元素为 [conflate_key, 文本]，合并时原地替换文本，保持原来的位置
+        self._queue: deque[list] = deque()
+        self._keyed: dict[str, list] = {}
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.conflated = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, text: str, conflate_key: str | None = None) -> bool:
+        """把已经序列化好的消息放入发送队列，连接已关闭时返回 False"""
+        if self.closed:
+            return False
+        if conflate_key is not None:
+            entry = self._keyed.get(conflate_key)
+            if entry is not None:
+                entry[1] = text
+                self.conflated += 1
+                return True
+        if len(self._queue) >= self.max_pending:
+            self.close(SLOW_CONSUMER_CLOSE_CODE)
+            return False
+        entry = [conflate_key, text]
+        self._queue.append(entry)
+        if conflate_key is not None:
+            self._keyed[conflate_key] = entry
+        self._ready.set()
+        return True
+
+    def send(self, message: dict) -> bool:
+        """发给这一个连接（回执、心跳等）"""
+        return self.enqueue(json.dumps(message, ensure_ascii=False))
+
+    async def _run(self):
+        try:
+            # 除了取消任务，还要检查 closed：wait_for 在内部任务恰好完成时会吞掉取消
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                key, text = self._queue.popleft()
+                if key is not None:
+                    self._keyed.pop(key, None)
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # 发送超时或连接已断开
+            self.close(SLOW_CONSUMER_CLOSE_CODE)
+
+    def stop(self):
+        """连接已经断开时停止发送任务"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        self._ready.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def join(self):
+        """等待发送任务退出"""
+        if self._task is not None and self._task is not asyncio.current_task():
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def close(self, code: int = 1000):
+        """停止发送并主动关闭底层连接，接收循环随之结束并完成清理"""
+        if self.closed:
+            return
+        self.stop()
+        self._closer = asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
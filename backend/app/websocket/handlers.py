@@ -1,67 +1,256 @@
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
 from typing import Dict, Set
 import json
-from app.database import SessionLocal
-from app.models import Note
+import logging
+from app.auth import get_current_user
+from app.config import settings
+from app.models import User, format_datetime
+from app.services.note_patch import PatchError, VersionConflict, diff_ops
+from app.websocket.backplane import PROCESS_ID, create_backplane
+from app.websocket.connection import ClientConnection
+from app.websocket.write_buffer import PendingNote, note_write_buffer
+
+USER_CHANNEL_PREFIX = "user:"
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id: str) -> str:
+    return USER_CHANNEL_PREFIX + user_id
 
 
 class ConnectionManager:
-    def __init__(self):
-        # 存储每个笔记的连接
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+    """管理本进程的 WebSocket 连接，按用户建立索引
+
+    笔记只对所有者可见，订阅某条笔记的连接一定属于它的所有者，因此所有事件都只发给
+    所有者的连接：每个事件的开销与接收者数量成正比，与服务器上的连接总数无关。
+    广播时消息只序列化一次，放进各连接的发送队列后立即返回，不等待任何一个客户端；
+    然后发布到广播总线的用户频道，由其他 worker / 节点转发给该用户在那里的连接。
+    """
 
-    async def connect(self, websocket: WebSocket, note_id: str):
+    def __init__(self, backplane=None, max_pending: int | None = None, send_timeout: float | None = None):
+        # 每个用户在本进程的连接
+        self.user_connections: Dict[str, Set[ClientConnection]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.backplane = backplane or create_backplane()
+        self.max_pending = max_pending or settings.ws_send_queue_size
+        self.send_timeout = send_timeout or settings.ws_send_timeout
+
+    async def start(self):
+        await self.backplane.start(self._on_backplane_message)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> ClientConnection:
         await websocket.accept()
-        if note_id not in self.active_connections:
-            self.active_connections[note_id] = set()
-        self.active_connections[note_id].add(websocket)
-
-    def disconnect(self, websocket: WebSocket, note_id: str):
-        if note_id in self.active_connections:
-            self.active_connections[note_id].discard(websocket)
-            if not self.active_connections[note_id]:
-                del self.active_connections[note_id]
-
-    async def broadcast_to_note(self, note_id: str, message: dict):
-        """向特定笔记的所有连接广播消息"""
-        if note_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[note_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    disconnected.add(connection)
-            
-            # 清理断开的连接
-            for conn in disconnected:
-                self.disconnect(conn, note_id)
-
-    async def broadcast_to_all(self, message: dict):
-        """向所有连接广播消息"""
-        all_connections = set()
-        for connections in self.active_connections.values():
-            all_connections.update(connections)
-        
-        disconnected = set()
-        for connection in all_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                disconnected.add(connection)
-        
-        # 清理断开的连接
-        for conn in disconnected:
-            for note_id, connections in list(self.active_connections.items()):
-                if conn in connections:
-                    self.disconnect(conn, note_id)
+        client = ClientConnection(websocket, self.max_pending, self.send_timeout)
+        client.user_id = user_id
+        client.start()
+        self.clients[websocket] = client
+        if user_id not in self.user_connections:
+            self.user_connections[user_id] = set()
+            await self.backplane.subscribe(user_channel(user_id))
+        self.user_connections[user_id].add(client)
+        return client
+
+    async def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        client.stop()
+        await client.join()
+        connections = self.user_connections.get(client.user_id)
+        if connections is not None:
+            connections.discard(client)
+            if not connections:
+                del self.user_connections[client.user_id]
+                await self.backplane.unsubscribe(user_channel(client.user_id))
+
+    def _send_local(self, user_id: str, text: str, exclude: WebSocket | None = None,
+                    conflate_key: str | None = None):
+        """放入本进程中该用户的连接的发送队列"""
+        for client in self.user_connections.get(user_id, ()):
+            if client.websocket is not exclude:
+                client.enqueue(text, conflate_key)
+
+    async def _on_backplane_message(self, channel: str, data: str):
+        header, text = data.split("\n", 1)
+        origin, conflate_key = json.loads(header)
+        if origin == PROCESS_ID or not channel.startswith(USER_CHANNEL_PREFIX):
+            return
+        self._send_local(channel[len(USER_CHANNEL_PREFIX):], text, conflate_key=conflate_key)
+
+    async def broadcast_to_user(self, user_id: str, message: dict, exclude: WebSocket | None = None,
+                                conflate_key: str | None = None):
+        """发给某个用户的所有连接（包括其他进程中的连接）
+
+        conflate_key 相同的消息在慢客户端的队列里只保留最新一条，只能用于完整快照类的消息。
+        """
+        text = json.dumps(message, ensure_ascii=False)
+        self._send_local(user_id, text, exclude, conflate_key)
+        # 第一行是 JSON 编码的 [来源进程, conflate_key]（不含换行），之后是原样的消息文本
+        header = json.dumps([PROCESS_ID, conflate_key], ensure_ascii=False)
+        try:
+            await self.backplane.publish(user_channel(user_id), f"{header}\n{text}")
+        except Exception:
+            # 广播失败不影响触发广播的请求（修改已经保存）
+            logger.exception("发布广播消息失败")
+
+    def note_connections(self) -> Dict[str, int]:
+        """每条笔记在本进程打开的连接数"""
+        counts: Dict[str, int] = {}
+        for client in self.clients.values():
+            if client.note_id is not None:
+                counts[client.note_id] = counts.get(client.note_id, 0) + 1
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.clients),
+            "users": len(self.user_connections),
+            "notes": len(self.note_connections()),
+            "pending": sum(client.pending for client in self.clients.values()),
+            "conflated": sum(client.conflated for client in self.clients.values()),
+            "backplane": self.backplane.stats(),
+        }
 
 
 manager = ConnectionManager()
 
 
+async def authenticate(websocket: WebSocket) -> User | None:
+    """校验查询参数中的 token，失败时以 1008 关闭连接"""
+    token = websocket.query_params.get("token")
+    if token:
+        try:
+            return await get_current_user(token)
+        except HTTPException:
+            pass
+    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    return None
+
+
+async def get_owned_note(client: ClientConnection, note_id) -> PendingNote | None:
+    """取得笔记的最新状态，不存在或不属于该连接的用户时返回 None"""
+    if not isinstance(note_id, str):
+        return None
+    note = await note_write_buffer.get(note_id)
+    if note is None or note.user_id != client.user_id:
+        return None
+    return note
+
+
+async def send_conflict(client: ClientConnection, note_id: str):
+    """编辑没有生效：把笔记的最新内容发给发送方"""
+    note = await note_write_buffer.get(note_id)
+    if note is None:
+        client.send({"type": "error", "payload": {"id": note_id, "detail": "笔记不存在"}})
+    else:
+        client.send({"type": "note_conflict", "payload": note.to_dict()})
+
+
+def note_patch_message(note_id: str, base_version: int, version: int, ops: list, updated_at,
+                       title: str | None = None) -> dict:
+    """广播给其他订阅者的增量：客户端在 baseVersion 版本上应用 ops，版本对不上时重新获取笔记"""
+    delta = {
+        "id": note_id,
+        "baseVersion": base_version,
+        "version": version,
+        "ops": ops,
+        "updatedAt": format_datetime(updated_at),
+    }
+    if title is not None:
+        delta["title"] = title
+    return {"type": "note_patch", "payload": delta}
+
+
+async def handle_note_update(client: ClientConnection, payload: dict) -> str | None:
+    """整体更新笔记：先写入内存缓冲，把与之前内容的差异广播给其他订阅者，稍后批量写回数据库"""
+    note_id = payload.get("id")
+    current = await get_owned_note(client, note_id)
+    if current is None:
+        client.send({"type": "error", "payload": {"id": note_id, "detail": "笔记不存在"}})
+        return None
+    base_version, base_content, base_title = current.version, current.content, current.title
+    try:
+        note = await note_write_buffer.update(note_id, payload.get("title"), payload.get("content"))
+    except VersionConflict:
+        # 立即写回模式下其他进程抢先修改了笔记
+        await send_conflict(client, note_id)
+        return None
+    if note is None or note.version == base_version:
+        # 内容没有变化（例如 REST 保存之后的回显），不广播
+        return None
+    title = note.title if note.title != base_title else None
+    message = note_patch_message(note_id, base_version, note.version, diff_ops(base_content, note.content),
+                                 note.updated_at, title)
+    await manager.broadcast_to_user(note.user_id, message, exclude=client.websocket)
+    return note_id
+
+
+async def handle_note_patch(client: ClientConnection, payload: dict) -> str | None:
+    """应用增量补丁，只把补丁本身广播给其他订阅者"""
+    note_id = payload.get("id")
+    base_version = payload.get("baseVersion")
+    ops = payload.get("ops", [])
+    title = payload.get("title")
+    if await get_owned_note(client, note_id) is None:
+        client.send({"type": "error", "payload": {"id": note_id, "detail": "笔记不存在"}})
+        return None
+    try:
+        note = await note_write_buffer.patch(note_id, base_version, ops, title)
+    except PatchError as e:
+        client.send({"type": "error", "payload": {"id": note_id, "detail": str(e)}})
+        return None
+    except VersionConflict:
+        # 版本冲突：把最新的完整内容发给发送方，由客户端重新同步
+        await send_conflict(client, note_id)
+        return None
+    if note is None:
+        client.send({"type": "error", "payload": {"id": note_id, "detail": "笔记不存在"}})
+        return None
+
+    client.send({
+        "type": "note_patch_ack",
+        "payload": {"id": note_id, "version": note.version, "updatedAt": format_datetime(note.updated_at)}
+    })
+    message = note_patch_message(note_id, base_version, note.version, ops, note.updated_at, title)
+    await manager.broadcast_to_user(note.user_id, message, exclude=client.websocket)
+    return note_id
+
+
+async def notify_flush_conflicts(notes: list[PendingNote]):
+    """缓冲中的修改写回失败被丢弃：把数据库中的内容发给所有者的连接，客户端用它替换未保存的内容"""
+    for dropped in notes:
+        note = await note_write_buffer.get(dropped.id)
+        if note is None:
+            await manager.broadcast_to_user(dropped.user_id, {"type": "note_delete", "payload": {"id": dropped.id}})
+            continue
+        await manager.broadcast_to_user(
+            note.user_id, {"type": "note_conflict", "payload": note.to_dict()}, conflate_key=f"note_conflict:{note.id}"
+        )
+
+
+note_write_buffer.on_conflict = notify_flush_conflicts
+
+
 async def websocket_endpoint(websocket: WebSocket, note_id: str | None = None):
-    """WebSocket端点处理"""
-    await manager.connect(websocket, note_id or "global")
+    """WebSocket端点处理
+
+    连接需要在查询参数中携带 token；note_id 可选，指定时必须是该用户自己的笔记。
+    """
+    user = await authenticate(websocket)
+    if user is None:
+        return
+    client = await manager.connect(websocket, user.id)
+    if note_id and await get_owned_note(client, note_id) is None:
+        await manager.disconnect(websocket)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    client.note_id = note_id
+    # 这个连接编辑过的笔记，断开时立即写回
+    edited_notes = set()
     
     try:
         while True:
@@ -71,51 +260,32 @@ async def websocket_endpoint(websocket: WebSocket, note_id: str | None = None):
                 msg_type = message.get("type")
                 
                 if msg_type == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    client.send({"type": "pong"})
                 elif msg_type == "note_update":
-                    # 更新数据库
-                    db = SessionLocal()
-                    try:
-                        note_data = message.get("payload", {})
-                        note = db.query(Note).filter(Note.id == note_data.get("id")).first()
-                        if note:
-                            if "title" in note_data:
-                                note.title = note_data["title"]
-                            if "content" in note_data:
-                                note.content = note_data["content"]
-                            db.commit()
-                            
-                            # 广播更新
-                            await manager.broadcast_to_note(
-                                note_data.get("id"),
-                                {
-                                    "type": "note_update",
-                                    "payload": note.to_dict()
-                                }
-                            )
-                    finally:
-                        db.close()
-                elif msg_type == "note_create":
-                    note_data = message.get("payload", {})
-                    await manager.broadcast_to_all({
-                        "type": "note_create",
-                        "payload": note_data
-                    })
-                elif msg_type == "note_delete":
-                    payload = message.get("payload", {})
-                    note_id_to_delete = payload.get("id")
-                    await manager.broadcast_to_all({
-                        "type": "note_delete",
-                        "payload": payload
+                    edited_id = await handle_note_update(client, message.get("payload", {}))
+                    if edited_id:
+                        edited_notes.add(edited_id)
+                elif msg_type == "note_patch":
+                    edited_id = await handle_note_patch(client, message.get("payload", {}))
+                    if edited_id:
+                        edited_notes.add(edited_id)
+                elif msg_type in ("note_create", "note_delete"):
+                    # 只通知同一用户的其他连接（例如另一个标签页）
+                    await manager.broadcast_to_user(user.id, {
+                        "type": msg_type,
+                        "payload": message.get("payload", {})
                     })
             except json.JSONDecodeError:
                 # 忽略无效的JSON消息
                 continue
             except Exception as e:
                 # 处理其他错误
-                print(f"WebSocket处理错误: {e}")
+                logger.exception("WebSocket处理错误: %s", e)
                 continue
                     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, note_id or "global")
-
+        pass
+    finally:
+        await manager.disconnect(websocket)
+        if edited_notes:
+            await note_write_buffer.flush_notes(edited_notes)
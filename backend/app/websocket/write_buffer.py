@@ -0,0 +1,317 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Note, format_datetime
+from app.services.change_feed import allocate_change_seqs
+from app.services.note_patch import VersionConflict, apply_ops
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingNote:
+    """内存中的笔记最新状态，尚未写回数据库的修改会累积在这里"""
+    id: str
+    user_id: str
+    title: str
+    content: str
+    created_at: datetime
+    updated_at: datetime
+    version: int  # 内存中的最新版本
+    flushed_version: int  # 数据库中的版本
+    edits: int = 0
+    edited_chars: int = 0
+    dirty_since: Optional[float] = None
+    # 写回时发现数据库中的版本已变化，修改被丢弃
+    dropped: bool = False
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.flushed_version
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "content": self.content,
+            "createdAt": format_datetime(self.created_at),
+            "updatedAt": format_datetime(self.updated_at),
+            "version": self.version
+        }
+
+
+class NoteWriteBuffer:
+    """WebSocket 高频编辑的写回缓冲
+
+    编辑先应用到内存中的笔记并立即广播，之后按时间或累积量批量写回数据库：
+    同一条笔记的多次编辑合并为一次 UPDATE，多条笔记在同一个事务里提交。
+    写回时数据库中的版本已经变化（其他请求或进程修改了笔记），缓冲中的修改只能丢弃；
+    这些修改已经确认并广播过，通过 on_conflict 通知所有者的客户端重新同步。
+
+    缓冲只在本进程内，要求同一条笔记只有一个写入者。多个 worker / 节点共用数据库时（广播总线为 redis），
+    各进程会各自缓冲同一条笔记，后写回的一方的修改会因为版本检查被丢弃。
+    这时使用 write_through：每次编辑在确认和广播之前写回数据库，缓冲中不保留未修改的笔记（每次从数据库读取），
+    并发写入由版本检查发现，冲突的编辑不会被确认，而是作为 VersionConflict 抛出。
+    """
+
+    def __init__(self, flush_interval: float, max_edits: int, max_chars: int, write_through: bool = False):
+        self.flush_interval = flush_interval
+        self.max_edits = max_edits
+        self.max_chars = max_chars
+        self.write_through = write_through
+        # 写回冲突时调用，参数为被丢弃修改的笔记（由 WebSocket 处理模块设置）
+        self.on_conflict: Optional[Callable[[list[PendingNote]], Awaitable[None]]] = None
+        self._notes: Dict[str, PendingNote] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_notes = 0
+        self.coalesced_edits = 0
+        self.conflicts = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务，并把剩余修改全部写回数据库"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            deadline = time.monotonic() - self.flush_interval
+            due = [
+                note.id for note in self._notes.values()
+                if note.dirty and (
+                    note.dirty_since <= deadline
+                    or note.edits >= self.max_edits
+                    or note.edited_chars >= self.max_chars
+                )
+            ]
+            if due:
+                try:
+                    await self.flush_notes(due)
+                except Exception as e:
+                    logger.exception("笔记写回失败，稍后重试: %s", e)
+
+    async def _load(self, note_id: str) -> Optional[PendingNote]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Note).where(Note.id == note_id))
+            note = result.scalar_one_or_none()
+            if note is None:
+                return None
+            return PendingNote(
+                id=note.id,
+                user_id=note.user_id,
+                title=note.title,
+                content=note.content,
+                created_at=note.created_at,
+                updated_at=note.updated_at,
+                version=note.version,
+                flushed_version=note.version,
+            )
+
+    async def get(self, note_id: str) -> Optional[PendingNote]:
+        """取得笔记的最新状态，不在缓冲中时从数据库加载"""
+        note = self._notes.get(note_id)
+        if note is not None:
+            if note.dirty or not self.write_through:
+                return note
+            # 其他进程可能已经修改了数据库中的笔记，未修改的缓存不可信
+            del self._notes[note_id]
+        # 同一条笔记的并发加载只查询一次数据库
+        loading = self._loading.get(note_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(note_id))
+            self._loading[note_id] = loading
+            try:
+                note = await loading
+            finally:
+                del self._loading[note_id]
+            if note is not None:
+                self._notes.setdefault(note_id, note)
+            return self._notes.get(note_id)
+        await loading
+        return self._notes.get(note_id)
+
+    def _mark_dirty(self, note: PendingNote, edited_chars: int):
+        note.version += 1
+        note.updated_at = datetime.utcnow()
+        note.edits += 1
+        note.edited_chars += edited_chars
+        if note.dirty_since is None:
+            note.dirty_since = time.monotonic()
+        if note.edits > 1:
+            self.coalesced_edits += 1
+        if note.edits >= self.max_edits or note.edited_chars >= self.max_chars:
+            self._wakeup.set()
+
+    async def update(self, note_id: str, title: str | None = None, content: str | None = None) -> Optional[PendingNote]:
+        """整体替换标题/内容；与当前内容相同时不算一次编辑（不增加版本）"""
+        note = await self.get(note_id)
+        if note is None:
+            return None
+        if (title is None or title == note.title) and (content is None or content == note.content):
+            return note
+        edited = 0
+        if title is not None:
+            note.title = title
+        if content is not None:
+            edited = abs(len(content) - len(note.content)) or 1
+            note.content = content
+        self._mark_dirty(note, edited)
+        await self._write_through(note)
+        return note
+
+    async def patch(self, note_id: str, base_version, ops: list, title: str | None = None) -> Optional[PendingNote]:
+        """在 base_version 上应用文本操作，版本不一致时抛出 VersionConflict"""
+        note = await self.get(note_id)
+        if note is None:
+            return None
+        if note.version != base_version:
+            raise VersionConflict(note.version)
+        note.content = apply_ops(note.content, ops)
+        if title is not None:
+            note.title = title
+        edited = sum(len(op.get("insert", "")) + op.get("delete", 0) for op in ops)
+        self._mark_dirty(note, edited or 1)
+        await self._write_through(note)
+        return note
+
+    async def _write_through(self, note: PendingNote):
+        """write_through 模式下立即写回，数据库中的版本已变化时抛出 VersionConflict（这次编辑没有生效）"""
+        if not self.write_through:
+            return
+        await self._flush([note.id])
+        if note.dropped:
+            current = await self.get(note.id)
+            raise VersionConflict(current.version if current is not None else note.flushed_version)
+
+    async def _write(self, snapshots: list[dict]) -> list[str]:
+        """在一个事务中写回多条笔记，返回写入成功的笔记ID"""
+        written = []
+        async with AsyncSessionLocal() as db, db.begin():
+            seqs = await allocate_change_seqs(db, len(snapshots))
+            for change_seq, snapshot in zip(seqs, snapshots):
+                result = await db.execute(
+                    update(Note)
+                    .where(Note.id == snapshot["id"], Note.version == snapshot["flushed_version"])
+                    .values(title=snapshot["title"], content=snapshot["content"], version=snapshot["version"],
+                            change_seq=change_seq)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount:
+                    written.append(snapshot["id"])
+                else:
+                    logger.warning(
+                        "笔记 %s 已被其他请求修改，放弃缓冲中版本 %d 到 %d 的修改",
+                        snapshot["id"], snapshot["flushed_version"], snapshot["version"],
+                    )
+        return written
+
+    async def flush_notes(self, note_ids: Iterable[str]):
+        """把指定笔记的缓冲修改写回数据库"""
+        conflicts = await self._flush(note_ids)
+        if conflicts and self.on_conflict is not None:
+            try:
+                await self.on_conflict(conflicts)
+            except Exception:
+                logger.exception("通知写回冲突失败")
+
+    async def _flush(self, note_ids: Iterable[str]) -> list[PendingNote]:
+        """写回缓冲修改，返回因版本冲突被丢弃的笔记"""
+        conflicts = []
+        async with self._flush_lock:
+            notes = [self._notes[note_id] for note_id in note_ids if note_id in self._notes]
+            dirty = [note for note in notes if note.dirty]
+            snapshots = [
+                {
+                    "id": note.id,
+                    "title": note.title,
+                    "content": note.content,
+                    "version": note.version,
+                    "flushed_version": note.flushed_version,
+                }
+                for note in dirty
+            ]
+            written = set()
+            if snapshots:
+                written = set(await self._write(snapshots))
+                self.flushes += 1
+                self.flushed_notes += len(written)
+
+            for note, snapshot in zip(dirty, snapshots):
+                if note.id not in written:
+                    # 数据库中的版本已变化，丢弃缓冲，下次使用时重新加载
+                    self._notes.pop(note.id, None)
+                    note.dropped = True
+                    conflicts.append(note)
+                    continue
+                note.flushed_version = snapshot["version"]
+                note.edits = 0
+                note.edited_chars = 0
+                # 写回期间又有新的编辑时继续保留在缓冲中
+                note.dirty_since = time.monotonic() if note.dirty else None
+            for note in notes:
+                if not note.dirty and self._notes.get(note.id) is note:
+                    del self._notes[note.id]
+        self.conflicts += len(conflicts)
+        return conflicts
+
+    async def flush_note(self, note_id: str):
+        """REST 接口读写笔记前调用，保证数据库中是最新内容"""
+        if note_id in self._notes:
+            await self.flush_notes([note_id])
+
+    async def flush_user(self, user_id: str):
+        """写回某个用户的全部缓冲修改（导出前调用）"""
+        note_ids = [note.id for note in self._notes.values() if note.user_id == user_id]
+        if note_ids:
+            await self.flush_notes(note_ids)
+
+    async def flush_all(self):
+        await self.flush_notes(list(self._notes))
+
+    def discard(self, note_id: str):
+        self._notes.pop(note_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "bufferedNotes": len(self._notes),
+            "dirtyNotes": sum(1 for note in self._notes.values() if note.dirty),
+            "flushes": self.flushes,
+            "flushedNotes": self.flushed_notes,
+            "coalescedEdits": self.coalesced_edits,
+            "conflicts": self.conflicts,
+        }
+
+
+note_write_buffer = NoteWriteBuffer(
+    flush_interval=settings.ws_flush_interval,
+    max_edits=settings.ws_flush_max_edits,
+    max_chars=settings.ws_flush_max_chars,
+    # 多进程共用数据库时各进程的缓冲互相覆盖，改为每次编辑立即写回
+    write_through=settings.ws_backplane != "memory",
+)
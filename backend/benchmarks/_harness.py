@@ -0,0 +1,121 @@
+"""压测公共工具：启动子进程服务、准备测试账号、统计分位数"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"端口 {port} 未在 {timeout}s 内就绪")
+
+
+@contextlib.contextmanager
+def run_process(args: list[str], port: int, env: dict | None = None, cwd: str = BACKEND_DIR):
+    """以子进程启动服务，等待端口就绪，退出时终止"""
+    proc_env = dict(os.environ)
+    proc_env.update(env or {})
+    proc = subprocess.Popen([sys.executable, *args], cwd=cwd, env=proc_env)
+    try:
+        wait_for_port(port)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextlib.contextmanager
+def run_fake_openai(first_token_delay: float = 0.2, token_delay: float = 0.01, token_chars: int = 4):
+    port = free_port()
+    args = [
+        "-m", "benchmarks.fake_openai", "--port", str(port),
+        "--first-token-delay", str(first_token_delay),
+        "--token-delay", str(token_delay),
+        "--token-chars", str(token_chars),
+    ]
+    with run_process(args, port):
+        yield f"http://127.0.0.1:{port}/v1"
+
+
+@contextlib.contextmanager
+def run_fake_redis():
+    port = free_port()
+    with run_process(["-m", "benchmarks.fake_redis", "--port", str(port)], port, {"OPENAI_API_KEY": "sk-benchmark"}):
+        yield f"redis://127.0.0.1:{port}/0"
+
+
+@contextlib.contextmanager
+def run_app(env: dict | None = None, cwd: str = BACKEND_DIR):
+    """在临时数据目录中启动单 worker 的后端应用"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        app_env = {
+            "OPENAI_API_KEY": "sk-benchmark",
+            "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        }
+        app_env.update(env or {})
+        args = ["-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning", "--workers", "1"]
+        with run_process(args, port, app_env, cwd):
+            yield f"http://127.0.0.1:{port}"
+
+
+@contextlib.contextmanager
+def checkout(ref: str):
+    """把指定的 git 版本检出到临时工作区，返回其中的 backend 目录，用于前后对比"""
+    repo_root = os.path.dirname(BACKEND_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = os.path.join(tmp, "worktree")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, ref], cwd=repo_root, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            yield os.path.join(worktree, os.path.basename(BACKEND_DIR))
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=repo_root, check=False)
+
+
+def create_user_token(base_url: str, username: str | None = None, password: str = "benchmark") -> str:
+    username = username or f"bench_{uuid.uuid4().hex[:8]}"
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        client.post("/api/auth/register", json={"username": username, "password": password}).raise_for_status()
+        resp = client.post("/api/auth/login", data={"username": username, "password": password})
+        resp.raise_for_status()
+        return resp.json()["access_token"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, values: list[float], unit: str = "ms", scale: float = 1000.0) -> str:
+    return (
+        f"{name:<12} p50={percentile(values, 50) * scale:8.1f}{unit}  "
+        f"p90={percentile(values, 90) * scale:8.1f}{unit}  "
+        f"p99={percentile(values, 99) * scale:8.1f}{unit}  "
+        f"max={max(values, default=0) * scale:8.1f}{unit}"
+    )
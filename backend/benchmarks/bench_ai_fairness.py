@@ -0,0 +1,85 @@
+"""AI 准入调度公平性压测
+
+一个重度用户一次性提交 --heavy 个流式请求，占满全局名额（AI_SCHEDULER_MAX_ACTIVE=--slots）并排起长队，
+随后 --light 个轻度用户各提交一个请求，统计轻度用户的首个内容事件延迟和排队位置。
+对照组给重度用户设置很大的轮询权重，相当于按到达顺序分配名额，轻度用户排在重度用户的整个队列之后。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ai_fairness --heavy 40 --light 5 --slots 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app, run_fake_openai, summarize
+
+
+async def one(client: httpx.AsyncClient, headers: dict, text: str) -> tuple[float, int]:
+    """返回首个内容事件的延迟和收到的第一个排队位置（没有排队为 0）"""
+    start = time.perf_counter()
+    position = 0
+    async with client.stream("POST", "/api/ai/process", json={"text": text}, headers=headers) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: {"):
+                continue
+            data = json.loads(line[6:])
+            if "queue" in data and not position:
+                position = data["queue"]["position"]
+            elif "content" in data:
+                return time.perf_counter() - start, position
+    return time.perf_counter() - start, position
+
+
+async def run_load(base_url: str, heavy_token: str, light_tokens: list[str], heavy: int, tag: str):
+    limits = httpx.Limits(max_connections=heavy + len(light_tokens) + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        heavy_headers = {"Authorization": f"Bearer {heavy_token}"}
+        heavy_tasks = [
+            asyncio.create_task(one(client, heavy_headers, f"公平性压测 {tag} 重度用户第 {i} 个请求"))
+            for i in range(heavy)
+        ]
+        # 等重度用户的请求全部进入队列
+        await asyncio.sleep(0.5)
+        light = await asyncio.gather(*(
+            one(client, {"Authorization": f"Bearer {token}"}, f"公平性压测 {tag} 轻度用户 {i}")
+            for i, token in enumerate(light_tokens)
+        ))
+        heavy_results = await asyncio.gather(*heavy_tasks)
+
+    print(f"[{tag}] 轻度用户排队位置 {sorted(position for _, position in light)}")
+    print("  " + summarize("轻度用户首字延迟", [latency for latency, _ in light]))
+    print("  " + summarize("重度用户首字延迟", [latency for latency, _ in heavy_results]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heavy", type=int, default=40, help="重度用户同时提交的请求数")
+    parser.add_argument("--light", type=int, default=5, help="轻度用户数，每人一个请求")
+    parser.add_argument("--slots", type=int, default=4, help="全局同时生成上限")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    with run_fake_openai(first_token_delay=0.1, token_delay=args.token_delay) as openai_base:
+        for tag, weight in (("按到达顺序", 1_000_000), ("加权轮询", 1)):
+            env = {
+                "OPENAI_API_BASE": openai_base,
+                "AI_CACHE_ENABLED": "false",
+                "AI_SCHEDULER_MAX_ACTIVE": str(args.slots),
+                "AI_USER_MAX_ACTIVE": str(args.slots),
+                "AI_USER_MAX_QUEUE": str(args.heavy),
+                "AI_USER_REQUESTS_PER_MINUTE": "0",
+                "AI_USER_TOKENS_PER_HOUR": "0",
+                "AI_USER_WEIGHTS": json.dumps({"bench_heavy": weight}),
+            }
+            with run_app(env) as base_url:
+                heavy_token = create_user_token(base_url, "bench_heavy")
+                light_tokens = [create_user_token(base_url) for _ in range(args.light)]
+                asyncio.run(run_load(base_url, heavy_token, light_tokens, args.heavy, tag))
+
+
+if __name__ == "__main__":
+    main()
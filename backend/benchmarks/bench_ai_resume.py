@@ -0,0 +1,94 @@
+"""AI 流式响应断线续传压测
+
+并发发起 --clients 个流式请求，每个请求收到 --cut 个事件后主动断开，等待 --pause 秒再重连：
+续传组带上最后一个事件的 Last-Event-ID，对照组不带（重新生成）。统计完成全部内容的耗时、
+客户端总共收到的事件数，以及上游模型被调用和被取消的次数（读取 /metrics）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ai_resume --clients 50 --cut 10 --pause 1
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app, run_fake_openai, summarize
+
+
+async def read_events(client: httpx.AsyncClient, headers: dict, text: str, limit: int | None = None) -> list[str]:
+    """读取内容事件的 id，收到 limit 个后断开"""
+    ids = []
+    buffer = ""
+    async with client.stream("POST", "/api/ai/process", json={"text": text}, headers=headers) as resp:
+        resp.raise_for_status()
+        async for text_chunk in resp.aiter_text():
+            buffer += text_chunk
+            *events, buffer = buffer.split("\n\n")
+            for event in events:
+                if event.startswith("id: "):
+                    ids.append(event[4:event.index("\n")])
+                    if limit is not None and len(ids) >= limit:
+                        return ids
+    return ids
+
+
+def upstream_counts(metrics_text: str) -> dict:
+    counts = {}
+    for line in metrics_text.splitlines():
+        if line.startswith("ai_upstream_requests_total"):
+            outcome = line.split('outcome="', 1)[1].split('"', 1)[0]
+            counts[outcome] = int(float(line.rsplit(" ", 1)[1]))
+    return counts
+
+
+async def run_load(base_url: str, token: str, clients: int, cut: int, pause: float, resume: bool, tag: str):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=clients * 2, max_keepalive_connections=clients * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        before = upstream_counts((await client.get("/metrics")).text)
+        durations, received = [], []
+
+        async def one(i: int):
+            # 每个客户端的文本不同，避免被缓存或合并
+            text = f"续传压测文本，{tag} 第 {i} 个客户端。" * 4
+            start = time.perf_counter()
+            first = await read_events(client, headers, text, cut)
+            await asyncio.sleep(pause)
+            retry_headers = {**headers, "Last-Event-ID": first[-1]} if resume else headers
+            rest = await read_events(client, retry_headers, text)
+            durations.append(time.perf_counter() - start)
+            received.append(len(first) + len(rest))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+        # 等宽限期结束，被放弃的上游调用计入 cancelled
+        await asyncio.sleep(1.5)
+        after = upstream_counts((await client.get("/metrics")).text)
+
+    upstream = {outcome: after.get(outcome, 0) - before.get(outcome, 0) for outcome in after}
+    print(f"[{'续传' if resume else '重新生成'}] {clients} 个客户端，总耗时 {elapsed:.2f}s，"
+          f"平均收到 {sum(received) / len(received):.1f} 个事件，上游调用 {upstream}")
+    print("  " + summarize("完成耗时", durations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--cut", type=int, default=10, help="断开前接收的事件数")
+    parser.add_argument("--pause", type=float, default=1.0, help="断开后多久重连（秒），应小于宽限期")
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with run_fake_openai(first_token_delay=0.2, token_delay=args.token_delay) as openai_base:
+        env = {"OPENAI_API_BASE": openai_base, "AI_CACHE_ENABLED": "false", "AI_RESUME_GRACE_SECONDS": "1"}
+        with run_app(env) as base_url:
+            token = create_user_token(base_url)
+            for resume in (False, True):
+                asyncio.run(run_load(base_url, token, args.clients, args.cut, args.pause,
+                                     resume, "resume" if resume else "restart"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""/api/ai/process 并发流式压测
+
+启动本地模拟的 OpenAI 兼容服务和单 worker 的后端，同时发起 N 个流式请求，
+统计首字节时间（TTFB）和完整响应耗时的分位数。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ai_stream --concurrency 200 --requests 400
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app, run_fake_openai, summarize
+
+
+async def one_request(client: httpx.AsyncClient, token: str, text: str) -> tuple[float, float, int]:
+    start = time.perf_counter()
+    ttfb = None
+    received = 0
+    async with client.stream(
+        "POST", "/api/ai/process",
+        json={"text": text},
+        headers={"Authorization": f"Bearer {token}"},
+    ) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            received += len(chunk)
+    return ttfb or 0.0, time.perf_counter() - start, received
+
+
+async def run_load(base_url: str, token: str, concurrency: int, total: int, text: str):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    ttfbs, durations, errors = [], [], 0
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def worker(i: int):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    # 每个请求的文本不同，避免被缓存或合并
+                    ttfb, duration, _ = await one_request(client, token, f"{text} #{i}")
+                    ttfbs.append(ttfb)
+                    durations.append(duration)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    print(f"并发 {concurrency}，请求 {total}，失败 {errors}，总耗时 {elapsed:.2f}s，吞吐 {total / elapsed:.1f} req/s")
+    print(summarize("TTFB", ttfbs))
+    print(summarize("总耗时", durations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--text-length", type=int, default=400)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--token-chars", type=int, default=16)
+    args = parser.parse_args()
+
+    text = ("这是一段用于压测的笔记内容。" * (args.text_length // 14 + 1))[:args.text_length]
+    with run_fake_openai(args.first_token_delay, args.token_delay, args.token_chars) as openai_base:
+        with run_app({"OPENAI_API_BASE": openai_base}) as base_url:
+            token = create_user_token(base_url)
+            asyncio.run(run_load(base_url, token, args.concurrency, args.requests, text))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""认证开销微基准：每次请求查库 vs 进程内用户缓存
+
+在进程内直接调用 get_current_user，统计每次认证的耗时和执行的 SQL 语句数：
+  - 按用户名查库：旧 token（只有 sub）且关闭缓存，等同于改造前的行为
+  - 按ID查库：新 token 但关闭缓存
+  - 缓存命中：新 token，缓存开启
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_auth --iterations 5000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_data_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_data_dir.name, 'bench.db')}"
+
+from sqlalchemy import event  # noqa: E402
+
+from app.auth import create_access_token, create_user_token, get_current_user, get_password_hash  # noqa: E402
+from app.database import AsyncSessionLocal, async_engine, init_db  # noqa: E402
+from app.models import User  # noqa: E402
+from app.services.principal_cache import principal_cache  # noqa: E402
+
+statements = 0
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+async def measure(label: str, token: str, iterations: int, cache: bool):
+    global statements
+    principal_cache.clear()
+    principal_cache.max_entries = 10000 if cache else 0
+    await get_current_user(token)  # 预热连接池和缓存
+    statements = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await get_current_user(token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed / iterations * 1e6:8.1f}µs/次  SQL {statements / iterations:.2f} 条/次")
+
+
+async def main(iterations: int):
+    init_db()
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench_auth", password_hash=get_password_hash("benchmark"))
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+
+    legacy_token = create_access_token(data={"sub": user.username})
+    token = create_user_token(user)
+    await measure("按用户名查库", legacy_token, iterations, cache=False)
+    await measure("按ID查库", token, iterations, cache=False)
+    await measure("缓存命中", token, iterations, cache=True)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5000)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -0,0 +1,98 @@
+"""笔记接口并发压测：同步会话 vs 异步会话
+
+启动单 worker 的后端，N 个并发客户端混合执行读单条笔记（70%）、分页摘要（20%）、
+更新笔记（10%），同时以固定间隔探测 /health，衡量数据库访问对事件循环的阻塞。
+传入 --compare-ref 时会先对该 git 版本（例如改造前的提交）跑一遍同样的负载。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_db_concurrency --concurrency 64 --duration 10 --compare-ref <提交>
+"""
+import argparse
+import asyncio
+import contextlib
+import random
+import time
+
+import httpx
+
+from benchmarks._harness import BACKEND_DIR, checkout, create_user_token, run_app, summarize
+
+
+async def seed(client: httpx.AsyncClient, headers: dict, count: int) -> list[str]:
+    ids = []
+    for i in range(count):
+        resp = await client.post(
+            "/api/notes",
+            json={"title": f"压测笔记{i}", "content": "<p>" + "压测内容。" * 200 + "</p>"},
+            headers=headers,
+        )
+        resp.raise_for_status()
+        ids.append(resp.json()["id"])
+    return ids
+
+
+async def run_load(base_url: str, token: str, concurrency: int, duration: float, notes: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        ids = await seed(client, headers, notes)
+        latencies, probes, errors = [], [], 0
+        has_summaries = (await client.get("/api/notes/summaries", headers=headers)).status_code == 200
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                roll = random.random()
+                note_id = random.choice(ids)
+                start = time.perf_counter()
+                if roll < 0.7:
+                    resp = await client.get(f"/api/notes/{note_id}", headers=headers)
+                elif roll < 0.9:
+                    path = "/api/notes/summaries" if has_summaries else "/api/notes"
+                    resp = await client.get(path, headers=headers)
+                else:
+                    resp = await client.put(f"/api/notes/{note_id}", json={"title": f"更新{start}"}, headers=headers)
+                if resp.status_code >= 400:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get("/health")
+                probes.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        start = time.perf_counter()
+        await asyncio.gather(probe(), *(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"  请求 {len(latencies)}，失败 {errors}，吞吐 {len(latencies) / elapsed:.1f} req/s")
+    print("  " + summarize("接口延迟", latencies))
+    print("  " + summarize("/health", probes))
+
+
+def bench(label: str, cwd: str, args):
+    print(f"[{label}]")
+    with run_app(cwd=cwd) as base_url:
+        token = create_user_token(base_url)
+        asyncio.run(run_load(base_url, token, args.concurrency, args.duration, args.notes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--compare-ref", help="作为对照的 git 版本")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.compare_ref:
+            bench(args.compare_ref, stack.enter_context(checkout(args.compare_ref)), args)
+        bench("当前版本", BACKEND_DIR, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""登录洪峰压测：并发登录期间普通笔记请求的延迟
+
+先准备若干账号，然后持续发起并发登录，同时以固定间隔读取一条笔记，
+统计登录吞吐、429 次数以及笔记请求的延迟分位数。bcrypt 在事件循环里执行时，
+笔记请求会被整批登录卡住；放进独立的哈希池后应基本不受影响。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_login --logins 8 --duration 10 --compare-ref <提交>
+"""
+import argparse
+import asyncio
+import contextlib
+import time
+
+import httpx
+
+from benchmarks._harness import BACKEND_DIR, checkout, create_user_token, run_app, summarize
+
+
+async def run_load(base_url: str, token: str, logins: int, duration: float):
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        note = (await client.post("/api/notes", json={"title": "延迟探测", "content": "<p>探测</p>"}, headers=headers)).json()
+        baseline = []
+        for _ in range(20):
+            start = time.perf_counter()
+            await client.get(f"/api/notes/{note['id']}", headers=headers)
+            baseline.append(time.perf_counter() - start)
+
+        users = [f"login_{int(time.time())}_{i}" for i in range(logins)]
+        for username in users:
+            (await client.post("/api/auth/register", json={"username": username, "password": "benchmark"})).raise_for_status()
+
+        deadline = time.perf_counter() + duration
+        login_latencies, note_latencies, rejected = [], [], 0
+
+        async def login(username: str):
+            nonlocal rejected
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                resp = await client.post("/api/auth/login", data={"username": username, "password": "benchmark"})
+                if resp.status_code == 429:
+                    rejected += 1
+                    await asyncio.sleep(float(resp.headers.get("Retry-After", "1")))
+                    continue
+                resp.raise_for_status()
+                login_latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get(f"/api/notes/{note['id']}", headers=headers)
+                note_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+
+        start = time.perf_counter()
+        await asyncio.gather(probe(), *(login(username) for username in users))
+        elapsed = time.perf_counter() - start
+
+    print(f"  登录 {len(login_latencies)} 次，{len(login_latencies) / elapsed:.1f} 次/s，429 {rejected} 次")
+    print("  " + summarize("登录延迟", login_latencies))
+    print("  " + summarize("笔记(空闲)", baseline))
+    print("  " + summarize("笔记(登录中)", note_latencies))
+
+
+def bench(label: str, cwd: str, args):
+    print(f"[{label}]")
+    env = {"AUTH_BCRYPT_ROUNDS": str(args.rounds)}
+    with run_app(env, cwd=cwd) as base_url:
+        token = create_user_token(base_url)
+        asyncio.run(run_load(base_url, token, args.logins, args.duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=8, help="并发登录的客户端数")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt 成本参数")
+    parser.add_argument("--compare-ref", help="作为对照的 git 版本")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.compare_ref:
+            bench(args.compare_ref, stack.enter_context(checkout(args.compare_ref)), args)
+        bench("当前版本", BACKEND_DIR, args)
+
+
+if __name__ == "__main__":
+    main()
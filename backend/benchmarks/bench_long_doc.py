@@ -0,0 +1,76 @@
+"""长文档润色压测：单次调用 vs 切分并发润色
+
+对 10k–100k 字符的笔记分别走原来的单次调用路径和长文档模式，
+统计总耗时、首字节时间和输出字符数（单次调用会被 max_tokens 截断）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_long_doc --sizes 10000 30000 100000 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks._harness import run_fake_openai
+
+
+def make_note(size: int) -> str:
+    paragraphs = []
+    index = 0
+    while sum(len(p) for p in paragraphs) < size:
+        index += 1
+        if index % 5 == 1:
+            paragraphs.append(f"<h2>第{index // 5 + 1}节</h2>")
+        paragraphs.append(f"<p>{'这是第%d段的内容，用来模拟一篇很长的笔记。' % index * 6}</p>")
+    return "".join(paragraphs)[:size]
+
+
+async def measure(source) -> tuple[float, float, int]:
+    start = time.perf_counter()
+    ttfb = None
+    output = 0
+    async for content in source:
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+        output += len(content)
+    return time.perf_counter() - start, ttfb or 0.0, output
+
+
+async def run(sizes: list[int]):
+    from app.services.ai_service import ai_service
+
+    print(f"{'字符数':>8} {'模式':<6} {'总耗时':>9} {'TTFB':>8} {'输出字符':>9}")
+    for size in sizes:
+        text = make_note(size)
+        for mode, source in (
+            ("单次", lambda: ai_service._polish_stream(text)),
+            ("切分", lambda: ai_service._process_long_document(text)),
+        ):
+            elapsed, ttfb, output = await measure(source())
+            print(f"{size:>8} {mode:<6} {elapsed:>8.2f}s {ttfb:>7.2f}s {output:>9}")
+    await ai_service.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 30000, 100000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-chars", type=int, default=1500)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--token-chars", type=int, default=8)
+    args = parser.parse_args()
+
+    with run_fake_openai(args.first_token_delay, args.token_delay, args.token_chars) as openai_base:
+        os.environ.update({
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-benchmark"),
+            "OPENAI_API_BASE": openai_base,
+            "AI_CACHE_ENABLED": "false",
+            "AI_LONG_DOC_WORKERS": str(args.workers),
+            "AI_LONG_DOC_CHUNK_CHARS": str(args.chunk_chars),
+        })
+        asyncio.run(run(args.sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""批量接口压测：逐条请求 vs /api/notes/batch/*
+
+准备 --notes 条笔记，分别用逐条请求（并发 --concurrency）和批量接口完成
+「读取全部」「更新全部」「删除全部」，统计请求数和总耗时。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_notes_batch --notes 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app
+
+
+async def create_notes(client: httpx.AsyncClient, headers: dict, count: int) -> list[str]:
+    ids = []
+    for i in range(count):
+        resp = await client.post("/api/notes", json={"title": f"批量 {i}", "content": "<p>内容</p>"}, headers=headers)
+        ids.append(resp.raise_for_status().json()["id"])
+    return ids
+
+
+async def one_by_one(client: httpx.AsyncClient, concurrency: int, requests: list):
+    queue = iter(requests)
+
+    async def worker():
+        for method, url, body in queue:
+            (await client.request(method, url, json=body)).raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def run_load(base_url: str, token: str, notes: int, concurrency: int, batch: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=120) as client:
+        for mode in ("逐条", "批量"):
+            ids = await create_notes(client, headers, notes)
+            chunks = [ids[i:i + batch] for i in range(0, len(ids), batch)]
+            if mode == "逐条":
+                steps = {
+                    "读取": [("GET", f"/api/notes/{note_id}", None) for note_id in ids],
+                    "更新": [("PUT", f"/api/notes/{note_id}", {"title": "已更新"}) for note_id in ids],
+                    "删除": [("DELETE", f"/api/notes/{note_id}", None) for note_id in ids],
+                }
+            else:
+                steps = {
+                    "读取": [("POST", "/api/notes/batch/get", {"ids": chunk}) for chunk in chunks],
+                    "更新": [("POST", "/api/notes/batch/update",
+                              {"items": [{"id": note_id, "title": "已更新"} for note_id in chunk]}) for chunk in chunks],
+                    "删除": [("POST", "/api/notes/batch/delete", {"ids": chunk}) for chunk in chunks],
+                }
+            print(f"[{mode}] {notes} 条笔记")
+            for name, requests in steps.items():
+                start = time.perf_counter()
+                await one_by_one(client, concurrency, requests)
+                elapsed = time.perf_counter() - start
+                print(f"  {name}: {len(requests):4d} 个请求 {elapsed * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=100, help="每个批量请求包含的笔记数")
+    args = parser.parse_args()
+
+    with run_app() as base_url:
+        token = create_user_token(base_url)
+        asyncio.run(run_load(base_url, token, args.notes, args.concurrency, args.batch))
+
+
+if __name__ == "__main__":
+    main()
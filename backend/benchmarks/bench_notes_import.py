@@ -0,0 +1,84 @@
+"""批量导入 / 导出压测
+
+对照组：逐条 POST /api/notes（每条一个事务），只跑 --baseline 条后按速率外推到 --notes 条。
+实验组：把 --notes 条笔记作为一个 NDJSON 请求体流式上传到 POST /api/notes/import，
+随后分别以 ndjson 和 zip 格式流式导出，统计耗时和吞吐。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_notes_import --notes 100000 --baseline 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app
+
+
+def note_record(i: int) -> dict:
+    return {"title": f"导入笔记 {i}", "content": f"<p>第 {i} 条笔记的正文，" + "用于导入压测的内容。" * 10 + "</p>"}
+
+
+async def ndjson_body(count: int, chunk_notes: int = 1000):
+    """边生成边上传，客户端也不把整个请求体放进内存"""
+    for start in range(0, count, chunk_notes):
+        lines = [json.dumps(note_record(i), ensure_ascii=False) for i in range(start, min(count, start + chunk_notes))]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def run_load(base_url: str, token: str, notes: int, baseline: int, concurrency: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        if baseline:
+            queue = iter(range(baseline))
+
+            async def worker():
+                for i in queue:
+                    (await client.post("/api/notes", json=note_record(i), headers=headers)).raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            rate = baseline / elapsed
+            print(f"逐条 POST: {baseline} 条 {elapsed:.2f}s，{rate:.0f} 条/s，"
+                  f"外推 {notes} 条约 {notes / rate:.0f}s")
+
+        start = time.perf_counter()
+        resp = await client.post("/api/notes/import", content=ndjson_body(notes),
+                                 headers={**headers, "Content-Type": "application/x-ndjson"})
+        resp.raise_for_status()
+        elapsed = time.perf_counter() - start
+        result = resp.json()
+        print(f"批量导入: {result['imported']} 条 {elapsed:.2f}s，{result['imported'] / elapsed:.0f} 条/s，"
+              f"失败 {result['failed']}")
+
+        for fmt in ("ndjson", "zip"):
+            start = time.perf_counter()
+            size = 0
+            first_byte = None
+            async with client.stream("GET", f"/api/notes/export?format={fmt}", headers=headers) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_raw():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+                    size += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"导出 {fmt:<6}: {size / 1024 / 1024:.1f}MB {elapsed:.2f}s，首字节 {first_byte * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--baseline", type=int, default=2000, help="逐条 POST 的笔记数，0 表示跳过")
+    parser.add_argument("--concurrency", type=int, default=8, help="逐条 POST 的并发数")
+    args = parser.parse_args()
+
+    with run_app() as base_url:
+        token = create_user_token(base_url)
+        asyncio.run(run_load(base_url, token, args.notes, args.baseline, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""全文搜索压测：大笔记库中单个用户的搜索延迟
+
+--users 个用户各导入 --notes / --users 条笔记，正文由固定的随机词表生成；
+然后以其中一个用户的身份反复搜索，分别统计几类关键词的延迟分位数：
+只在该用户少数笔记中出现的稀有词、在全库约两成笔记中出现的常见词、中文词和不足3个字符的短词。
+全库命中数越多，按 FTS 匹配后再过滤用户的开销越大，常见词是最差情况。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_notes_search --notes 1000000 --users 200 --compare-ref <提交>
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks._harness import BACKEND_DIR, checkout, create_user_token, run_app, summarize
+
+RARE_WORD = "xylophonist"
+COMMON_WORD = "lorem"
+CHINESE_WORD = "增量同步"
+SHORT_WORD = "ip"
+QUERIES = {"稀有词": RARE_WORD, "常见词": COMMON_WORD, "中文词": CHINESE_WORD, "短词": SHORT_WORD}
+
+
+def vocabulary(size: int = 20000) -> list[str]:
+    rng = random.Random(0)
+    letters = "abcdefghjkmnoqrsuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def note_record(rng: random.Random, words: list[str], i: int, rare: bool) -> dict:
+    body = [rng.choice(words) for _ in range(40)]
+    if rng.random() < 0.2:
+        body[rng.randrange(len(body))] = COMMON_WORD
+    if rng.random() < 0.1:
+        body[rng.randrange(len(body))] = CHINESE_WORD
+    if rng.random() < 0.1:
+        body[rng.randrange(len(body))] = SHORT_WORD
+    if rare:
+        body[rng.randrange(len(body))] = RARE_WORD
+    return {"title": f"笔记 {i} {rng.choice(words)}", "content": "<p>" + " ".join(body) + "</p>"}
+
+
+async def ndjson_body(seed: int, count: int, rare_every: int, chunk_notes: int = 1000):
+    rng = random.Random(seed)
+    words = vocabulary()
+    for start in range(0, count, chunk_notes):
+        lines = [
+            json.dumps(note_record(rng, words, i, rare_every > 0 and i % rare_every == 0), ensure_ascii=False)
+            for i in range(start, min(count, start + chunk_notes))
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def run_load(base_url: str, args) -> None:
+    per_user = args.notes // args.users
+    tokens = [create_user_token(base_url) for _ in range(args.users)]
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        for seed, token in enumerate(tokens):
+            # 稀有词只出现在第一个用户（搜索者）的少数笔记中
+            rare_every = per_user // 5 if seed == 0 else 0
+            resp = await client.post(
+                "/api/notes/import", content=ndjson_body(seed, per_user, rare_every),
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"},
+            )
+            resp.raise_for_status()
+        print(f"  导入 {per_user * args.users} 条笔记（{args.users} 个用户）: {time.perf_counter() - start:.1f}s")
+
+        headers = {"Authorization": f"Bearer {tokens[0]}"}
+        for label, query in QUERIES.items():
+            latencies = []
+            hits = 0
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                resp = await client.get("/api/notes/search", params={"q": query, "limit": 20}, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                resp.raise_for_status()
+                hits = len(resp.json()["items"])
+            print(f"  {summarize(label, latencies)}  返回 {hits} 条")
+
+
+def bench(label: str, cwd: str, args):
+    print(f"[{label}]")
+    with run_app({"AUTH_BCRYPT_ROUNDS": "4"}, cwd=cwd) as base_url:
+        asyncio.run(run_load(base_url, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100_000, help="全库笔记总数")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=50, help="每类关键词的搜索次数")
+    parser.add_argument("--compare-ref", help="作为对照的 git 版本")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        if args.compare_ref:
+            bench(args.compare_ref, stack.enter_context(checkout(args.compare_ref)), args)
+        bench("当前版本", BACKEND_DIR, args)
+
+
+if __name__ == "__main__":
+    main()
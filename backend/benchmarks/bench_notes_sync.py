@@ -0,0 +1,74 @@
+"""增量同步压测：全量 GET /api/notes vs /changes + /batch/get
+
+用批量导入准备不同规模的笔记库，然后修改 --changed 条笔记、删除一条，比较客户端重新同步的开销：
+全量获取所有笔记，对比按游标获取变更再批量拉取变化的笔记。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_notes_sync --sizes 1000 10000 50000 --changed 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app
+
+
+async def grow_library(client: httpx.AsyncClient, headers: dict, count: int):
+    body = "\n".join(
+        json.dumps({"title": f"笔记 {i}", "content": "<p>" + "同步压测内容。" * 20 + "</p>"}, ensure_ascii=False)
+        for i in range(count)
+    ).encode("utf-8")
+    resp = await client.post("/api/notes/import", content=body,
+                             headers={**headers, "Content-Type": "application/x-ndjson"})
+    resp.raise_for_status()
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def run_load(base_url: str, sizes: list[int], changed: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        for size in sizes:
+            token = create_user_token(base_url)
+            headers = {"Authorization": f"Bearer {token}"}
+            await grow_library(client, headers, size)
+            listing = await client.get("/api/notes", headers=headers)
+            cursor = listing.headers["x-change-cursor"]
+            ids = [note["id"] for note in listing.json()]
+
+            await client.post("/api/notes/batch/update", headers=headers,
+                              json={"items": [{"id": note_id, "title": "已修改"} for note_id in ids[:changed]]})
+            await client.delete(f"/api/notes/{ids[-1]}", headers=headers)
+
+            full, full_time = await timed(client.get("/api/notes", headers=headers))
+
+            async def incremental():
+                feed = await client.get("/api/notes/changes", params={"since": cursor}, headers=headers)
+                changes = feed.json()["changes"]
+                wanted = [change["id"] for change in changes if not change["deleted"]]
+                resp = await client.post("/api/notes/batch/get", json={"ids": wanted}, headers=headers)
+                return len(changes), len(feed.content) + len(resp.content)
+
+            (change_count, incremental_bytes), incremental_time = await timed(incremental())
+            print(f"{size:6d} 条笔记: 全量 {full_time * 1000:8.1f}ms {len(full.content) / 1024:9.0f}KB | "
+                  f"增量 {incremental_time * 1000:6.1f}ms {incremental_bytes / 1024:6.0f}KB（{change_count} 条变更）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--changed", type=int, default=10)
+    args = parser.parse_args()
+
+    with run_app() as base_url:
+        asyncio.run(run_load(base_url, args.sizes, args.changed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""AI 流式响应的 SSE 帧合并与压缩压测
+
+模拟上游每 --token-delay 秒产出 --token-chars 个字符的细碎增量，分别在
+「逐个发送 / 按时间窗口合并」×「不压缩 / gzip」四种配置下并发发起 --streams 个流式请求，
+统计每秒事件数、线上字节数、每个流占用的服务端 CPU（/metrics 中的 process_cpu_seconds_total）
+以及首字节时间，确认合并不影响首个内容的到达。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_sse_frames --streams 100 --window-ms 30
+"""
+import argparse
+import asyncio
+import time
+import zlib
+
+import httpx
+
+from benchmarks._harness import create_user_token, run_app, run_fake_openai, summarize
+
+
+async def one_stream(client: httpx.AsyncClient, headers: dict, text: str) -> tuple[float, int, int]:
+    """返回 (首字节时间, 线上字节数, 事件数)"""
+    start = time.perf_counter()
+    ttfb = None
+    wire = 0
+    plain = b""
+    async with client.stream("POST", "/api/ai/process", json={"text": text}, headers=headers) as resp:
+        resp.raise_for_status()
+        encoding = resp.headers.get("content-encoding")
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+        async for data in resp.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            wire += len(data)
+            plain += decoder.decompress(data) if decoder else data
+    return ttfb or 0.0, wire, plain.count(b"\n\n")
+
+
+def cpu_seconds(metrics_text: str) -> float:
+    for line in metrics_text.splitlines():
+        if line.startswith("process_cpu_seconds_total"):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+async def run_load(base_url: str, token: str, streams: int, text: str, gzip: bool):
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip" if gzip else "identity"}
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        cpu_before = cpu_seconds((await client.get("/metrics")).text)
+        start = time.perf_counter()
+        # 每个请求的文本不同，避免被缓存或合并
+        results = await asyncio.gather(*(one_stream(client, headers, f"{text} #{i}") for i in range(streams)))
+        elapsed = time.perf_counter() - start
+        cpu = cpu_seconds((await client.get("/metrics")).text) - cpu_before
+    ttfbs = [result[0] for result in results]
+    wire = sum(result[1] for result in results)
+    events = sum(result[2] for result in results)
+    return elapsed, ttfbs, wire, events, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=100)
+    parser.add_argument("--window-ms", type=float, default=30.0)
+    parser.add_argument("--text-length", type=int, default=400)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--token-chars", type=int, default=2)
+    args = parser.parse_args()
+
+    text = ("这是一段用于压测的笔记内容。" * (args.text_length // 14 + 1))[:args.text_length]
+    configs = [
+        ("逐个发送", 0.0, False),
+        ("合并", args.window_ms, False),
+        ("逐个发送+gzip", 0.0, True),
+        ("合并+gzip", args.window_ms, True),
+    ]
+    with run_fake_openai(first_token_delay=0.1, token_delay=args.token_delay, token_chars=args.token_chars) as openai_base:
+        for label, window_ms, gzip in configs:
+            env = {
+                "OPENAI_API_BASE": openai_base,
+                "AI_CACHE_ENABLED": "false",
+                "AI_SSE_COALESCE_MS": str(window_ms),
+                "AI_SSE_COMPRESSION": "gzip" if gzip else "",
+            }
+            with run_app(env) as base_url:
+                token = create_user_token(base_url)
+                elapsed, ttfbs, wire, events, cpu = asyncio.run(run_load(base_url, token, args.streams, text, gzip))
+            print(f"[{label}] {args.streams} 个流 {elapsed:.2f}s，事件 {events / elapsed:8.0f}/s "
+                  f"（每流 {events / args.streams:.0f} 个），线上 {wire / args.streams / 1024:6.1f}KB/流，"
+                  f"CPU {cpu / args.streams * 1000:6.1f}ms/流")
+            print("  " + summarize("TTFB", ttfbs))
+
+
+if __name__ == "__main__":
+    main()
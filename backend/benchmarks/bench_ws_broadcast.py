@@ -0,0 +1,113 @@
+"""单进程广播压测：逐个 await 发送 vs 发送队列
+
+在进程内模拟 N 个 WebSocket（默认 1000 个），其中一小部分是慢客户端（每次发送要等待较长时间），
+连续广播若干条消息，统计：
+  - 广播调用本身的耗时（调用方被阻塞多久）
+  - 每条消息送达全部正常客户端的延迟分位数
+对照组是改造前的实现：对每个连接依次 await send_json。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ws_broadcast --sockets 1000 --slow 10 --messages 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.websocket.backplane import MemoryBackplane  # noqa: E402
+from app.websocket.handlers import ConnectionManager  # noqa: E402
+
+from benchmarks._harness import summarize  # noqa: E402
+
+
+class FakeWebSocket:
+    """记录每条消息到达时间的假连接；slow 为每次发送的额外耗时"""
+
+    def __init__(self, slow: float = 0.0, io_delay: float = 0.0):
+        self.slow = slow
+        self.io_delay = io_delay
+        self.received: dict[int, float] = {}
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.slow or self.io_delay)
+        self.received[json.loads(text)["payload"]["seq"]] = time.perf_counter()
+
+    async def send_json(self, message: dict):
+        await self.send_text(json.dumps(message, ensure_ascii=False))
+
+
+async def sequential_broadcast(sockets: list[FakeWebSocket], message: dict):
+    """改造前的实现：每个连接依次 await"""
+    for socket in sockets:
+        try:
+            await socket.send_json(message)
+        except Exception:
+            pass
+
+
+async def run(mode: str, args):
+    sockets = [FakeWebSocket(slow=args.slow_delay if i < args.slow else 0.0, io_delay=args.io_delay)
+               for i in range(args.sockets)]
+    healthy = sockets[args.slow:]
+    manager = ConnectionManager(backplane=MemoryBackplane(hub=f"bench-{mode}"), max_pending=args.queue)
+    if mode == "queue":
+        await manager.start()
+        for socket in sockets:
+            await manager.connect(socket, "user")
+
+    sent_at, call_times = {}, []
+    payload = {"id": "note", "title": "广播压测", "content": "<p>" + "内容" * 200 + "</p>"}
+    for seq in range(args.messages):
+        message = {"type": "note_patch", "payload": {**payload, "seq": seq}}
+        sent_at[seq] = time.perf_counter()
+        if mode == "queue":
+            await manager.broadcast_to_user("user", message)
+        else:
+            await sequential_broadcast(sockets, message)
+        call_times.append(time.perf_counter() - sent_at[seq])
+        await asyncio.sleep(args.interval)
+
+    # 等待正常客户端收完
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline and any(len(s.received) < args.messages for s in healthy):
+        await asyncio.sleep(0.01)
+
+    delivery = [max(s.received.get(seq, 0) for s in healthy) - sent_at[seq] for seq in range(args.messages)]
+    delivered = sum(len(s.received) for s in healthy)
+    print(f"[{mode}] 正常客户端送达 {delivered}/{len(healthy) * args.messages}")
+    print("  " + summarize("广播调用", call_times))
+    print("  " + summarize("全部送达", delivery))
+    if mode == "queue":
+        print(f"  断开的慢客户端 {sum(1 for s in sockets[:args.slow] if manager.clients[s].closed)}/{args.slow}")
+        for socket in list(manager.clients):
+            await manager.disconnect(socket)
+        await manager.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=10, help="慢客户端数量")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="慢客户端每次发送的耗时（秒）")
+    parser.add_argument("--io-delay", type=float, default=0.0005, help="正常客户端每次发送的耗时（秒）")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02, help="广播间隔（秒）")
+    parser.add_argument("--queue", type=int, default=16, help="每个连接的发送队列上限")
+    parser.add_argument("--mode", choices=["both", "sequential", "queue"], default="both")
+    args = parser.parse_args()
+
+    for mode in (["sequential", "queue"] if args.mode == "both" else [args.mode]):
+        asyncio.run(run(mode, args))
+
+
+if __name__ == "__main__":
+    main()
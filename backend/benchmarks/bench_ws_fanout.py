@@ -0,0 +1,103 @@
+"""多进程 WebSocket 广播延迟压测
+
+启动本地 Redis 替身和多个独立的后端进程（共用同一个 SQLite 数据库），订阅者均匀连接到
+各个进程并打开同一条笔记，发布者连接第一个进程持续发送 note_update，统计每条更新
+到达各进程订阅者的延迟和送达率。使用 --backplane memory 可以看到跨进程的订阅者收不到更新。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ws_fanout --workers 3 --subscribers 20 --messages 200
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import websockets
+
+from benchmarks._harness import create_user_token, percentile, run_app, run_fake_redis, summarize
+
+
+async def run_load(base_urls: list[str], token: str, subscribers: int, messages: int, interval: float):
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_urls[0], timeout=30) as client:
+        note = (await client.post("/api/notes", json={"title": "广播", "content": "<p>广播</p>"}, headers=headers)).json()
+
+    sent: dict[str, float] = {}
+    latencies: dict[int, list[float]] = {worker: [] for worker in range(len(base_urls))}
+    ws_urls = [url.replace("http://", "ws://") + f"/ws?note_id={note['id']}&token={token}" for url in base_urls]
+
+    async def subscriber(worker: int, ready: asyncio.Event, done: asyncio.Event):
+        async with websockets.connect(ws_urls[worker], max_size=None) as ws:
+            ready.set()
+            while not done.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                message = json.loads(raw)
+                # note_update 以增量的形式广播，标题变化时带上新标题
+                if message.get("type") == "note_patch":
+                    seq = message["payload"].get("title")
+                    if seq in sent:
+                        latencies[worker].append(time.perf_counter() - sent[seq])
+
+    done = asyncio.Event()
+    readies, tasks = [], []
+    for i in range(subscribers):
+        ready = asyncio.Event()
+        readies.append(ready)
+        tasks.append(asyncio.create_task(subscriber(i % len(base_urls), ready, done)))
+    await asyncio.gather(*(ready.wait() for ready in readies))
+    await asyncio.sleep(0.5)  # 等待各进程完成总线订阅
+
+    async with websockets.connect(ws_urls[0], max_size=None) as publisher:
+        for seq in range(messages):
+            key = str(seq)
+            sent[key] = time.perf_counter()
+            await publisher.send(json.dumps({"type": "note_update", "payload": {"id": note["id"], "title": key}}))
+            await asyncio.sleep(interval)
+        await asyncio.sleep(1.0)
+    done.set()
+    await asyncio.gather(*tasks)
+
+    per_worker = [subscribers // len(base_urls) + (1 if w < subscribers % len(base_urls) else 0)
+                  for w in range(len(base_urls))]
+    for worker, values in latencies.items():
+        expected = per_worker[worker] * messages
+        label = "同进程" if worker == 0 else f"进程{worker}"
+        print(f"  {label}: 送达 {len(values)}/{expected}")
+        if values:
+            print("    " + summarize("延迟", values))
+    everything = [v for values in latencies.values() for v in values]
+    print(f"  总体 p50={percentile(everything, 50) * 1000:.1f}ms p99={percentile(everything, 99) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3, help="后端进程数")
+    parser.add_argument("--subscribers", type=int, default=30, help="订阅者总数，均分到各进程")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="发布间隔（秒）")
+    parser.add_argument("--backplane", choices=["redis", "memory"], default="redis")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        env = {
+            "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+            "WS_BACKPLANE": args.backplane,
+        }
+        if args.backplane == "redis":
+            env["WS_BACKPLANE_URL"] = stack.enter_context(run_fake_redis())
+        base_urls = [stack.enter_context(run_app(env)) for _ in range(args.workers)]
+        token = create_user_token(base_urls[0])
+        print(f"[{args.backplane}] {args.workers} 个进程，{args.subscribers} 个订阅者，{args.messages} 条更新")
+        asyncio.run(run_load(base_urls, token, args.subscribers, args.messages, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""按用户投递的开销压测：事件开销与连接总数无关
+
+在进程内模拟 N 个 WebSocket 连接（默认 100 / 1000 / 10000），分散在许多用户名下，
+其中目标用户开着少量标签页（默认 3 个）。对目标用户连续发送若干事件，统计每个事件
+在广播方花费的时间。对照组是改造前按笔记 / 全体连接遍历的实现：每个事件都要扫描全部连接。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_ws_user_fanout --connections 100 1000 10000 --events 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.websocket.backplane import MemoryBackplane  # noqa: E402
+from app.websocket.handlers import ConnectionManager  # noqa: E402
+
+from benchmarks._harness import summarize  # noqa: E402
+
+
+class FakeWebSocket:
+    """只计数的假连接"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, text: str):
+        self.received += 1
+
+
+def scan_all(manager: ConnectionManager, user_id: str, text: str):
+    """改造前的做法：遍历全部连接，逐个判断是否应该收到"""
+    for client in manager.clients.values():
+        if client.user_id == user_id:
+            client.enqueue(text)
+
+
+async def run(total: int, args):
+    manager = ConnectionManager(backplane=MemoryBackplane(hub=f"bench-{total}"), max_pending=args.events * 2)
+    await manager.start()
+    target_sockets = [FakeWebSocket() for _ in range(args.tabs)]
+    for socket in target_sockets:
+        await manager.connect(socket, "target")
+    for i in range(total - args.tabs):
+        await manager.connect(FakeWebSocket(), f"user-{i % args.users}")
+
+    payload = {"id": "note", "title": "按用户投递", "content": "<p>" + "内容" * 50 + "</p>"}
+    results = {}
+    for mode in ("scan", "user"):
+        times = []
+        for seq in range(args.events):
+            message = {"type": "note_update", "payload": {**payload, "seq": seq}}
+            start = time.perf_counter()
+            if mode == "user":
+                await manager.broadcast_to_user("target", message)
+            else:
+                scan_all(manager, "target", json.dumps(message, ensure_ascii=False))
+            times.append(time.perf_counter() - start)
+            if seq % 100 == 99:
+                # 让发送任务把队列清空
+                await asyncio.sleep(0)
+        results[mode] = times
+        expected = args.events * (2 if mode == "user" else 1)
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline and any(s.received < expected for s in target_sockets):
+            await asyncio.sleep(0.01)
+
+    print(f"连接总数 {total}（目标用户 {args.tabs} 个连接）")
+    for mode, label in (("scan", "遍历全部连接"), ("user", "按用户索引")):
+        print("  " + summarize(label, results[mode], unit="µs", scale=1e6))
+    print(f"  目标用户收到 {sum(s.received for s in target_sockets)}/{args.tabs * args.events * 2}")
+
+    for socket in list(manager.clients):
+        await manager.disconnect(socket)
+    await manager.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--users", type=int, default=2000, help="其他连接分散到的用户数")
+    parser.add_argument("--tabs", type=int, default=3, help="目标用户的连接数")
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+
+    for total in args.connections:
+        asyncio.run(run(total, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""本地模拟的 OpenAI 兼容服务，用于压测
+
+只实现 POST /v1/chat/completions 的流式响应：把最后一条用户消息原样切成若干
+token 逐个返回，可配置首 token 延迟、token 间隔和每个 token 的字符数。
+max_tokens 按字符数近似截断。
+
+启动:
+    python -m benchmarks.fake_openai --port 9100 --first-token-delay 0.2 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+FIRST_TOKEN_DELAY = float(os.getenv("FAKE_FIRST_TOKEN_DELAY", "0.2"))
+TOKEN_DELAY = float(os.getenv("FAKE_TOKEN_DELAY", "0.01"))
+TOKEN_CHARS = int(os.getenv("FAKE_TOKEN_CHARS", "4"))
+
+stats = {"requests": 0, "active": 0, "peak_active": 0}
+
+
+def _chunk(completion_id: str, model: str, content: str | None, finish_reason: str | None = None) -> str:
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"content": content} if content is not None else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    messages = body.get("messages") or [{"content": ""}]
+    text = messages[-1].get("content", "")
+    max_tokens = int(body.get("max_tokens") or 0)
+    if max_tokens:
+        text = text[:max_tokens * TOKEN_CHARS]
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    stats["requests"] += 1
+
+    async def stream():
+        stats["active"] += 1
+        stats["peak_active"] = max(stats["peak_active"], stats["active"])
+        try:
+            await asyncio.sleep(FIRST_TOKEN_DELAY)
+            yield _chunk(completion_id, model, "")
+            for i in range(0, len(text), TOKEN_CHARS):
+                yield _chunk(completion_id, model, text[i:i + TOKEN_CHARS])
+                await asyncio.sleep(TOKEN_DELAY)
+            yield _chunk(completion_id, model, None, "stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    if not body.get("stream"):
+        return JSONResponse({"error": {"message": "only stream=true is supported"}}, status_code=400)
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def get_stats(request: Request):
+    return JSONResponse(stats)
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/stats", get_stats),
+])
+
+
+def main():
+    import uvicorn
+
+    global FIRST_TOKEN_DELAY, TOKEN_DELAY, TOKEN_CHARS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-token-delay", type=float, default=FIRST_TOKEN_DELAY)
+    parser.add_argument("--token-delay", type=float, default=TOKEN_DELAY)
+    parser.add_argument("--token-chars", type=int, default=TOKEN_CHARS)
+    args = parser.parse_args()
+
+    FIRST_TOKEN_DELAY = args.first_token_delay
+    TOKEN_DELAY = args.token_delay
+    TOKEN_CHARS = args.token_chars
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
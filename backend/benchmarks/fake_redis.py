@@ -0,0 +1,70 @@
+"""本地 Redis 替身：只实现 PING / PUBLISH / SUBSCRIBE / UNSUBSCRIBE
+
+用于在没有 Redis 的环境中验证 RedisBackplane 以及多进程广播压测。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.fake_redis --port 6390
+"""
+import argparse
+import asyncio
+
+from app.websocket.backplane import _read_reply
+
+subscribers: dict[bytes, set[asyncio.StreamWriter]] = {}
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    channels: set[bytes] = set()
+    try:
+        while True:
+            command = await _read_reply(reader)
+            name = command[0].upper()
+            if name == b"PING":
+                writer.write(b"+PONG\r\n")
+            elif name == b"AUTH":
+                writer.write(b"+OK\r\n")
+            elif name == b"PUBLISH":
+                channel, data = command[1], command[2]
+                targets = list(subscribers.get(channel, ()))
+                message = _encode([b"message", channel, data])
+                for target in targets:
+                    target.write(message)
+                writer.write(_encode(len(targets)))
+            elif name in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                for channel in command[1:]:
+                    if name == b"SUBSCRIBE":
+                        channels.add(channel)
+                        subscribers.setdefault(channel, set()).add(writer)
+                    else:
+                        channels.discard(channel)
+                        subscribers.get(channel, set()).discard(writer)
+                    writer.write(_encode([name.lower(), channel, len(channels)]))
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, IndexError):
+        pass
+    finally:
+        for channel in channels:
+            subscribers.get(channel, set()).discard(writer)
+        writer.close()
+
+
+async def main(port: int):
+    server = await asyncio.start_server(handle, "127.0.0.1", port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6390)
+    asyncio.run(main(parser.parse_args().port))
@@ -0,0 +1,49 @@
+"""测试环境：临时数据库、关闭 AI 响应缓存；需要在导入 app 之前设置环境变量"""
+import os
+import tempfile
+import uuid
+
+_DATA_DIR = tempfile.mkdtemp(prefix="ai-notebook-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DATA_DIR, 'test.db')}"
+os.environ["AI_CACHE_ENABLED"] = "false"
+os.environ["IMAGE_VARIANTS_ENABLED"] = "false"
+
+import httpx
+import pytest
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user
+from app.database import async_engine, engine
+from app.main import app
+from app.models import User
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def user() -> User:
+    """每个测试一个新用户，互不影响限流和数据"""
+    with Session(engine, expire_on_commit=False) as db:
+        user = User(username=f"test_{uuid.uuid4().hex[:8]}", password_hash="-")
+        db.add(user)
+        db.commit()
+        db.expunge(user)
+    return user
+
+
+@pytest.fixture
+async def client(user):
+    """以 user 身份调用接口的客户端（不经过 lifespan，WebSocket 相关的后台任务不会启动）"""
+    app.dependency_overrides[get_current_user] = lambda: user
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        # 连接池里的连接属于本测试的事件循环
+        await async_engine.dispose()
@@ -0,0 +1,18 @@
+from app.services.ai_cache import make_cache_key, normalize_text
+
+
+def key(text: str) -> str:
+    return make_cache_key("model", "prompt", text, 0.7)
+
+
+def test_line_endings_and_trailing_whitespace_share_a_key():
+    assert key("第一行  \r\n第二行\t\r\n") == key("第一行\n第二行")
+    assert key("\n\n正文\n\n") == key("正文")
+    assert key("caf\u0065\u0301") == key("caf\u00e9")
+
+
+def test_indentation_and_inner_spaces_are_significant():
+    code = "```python\ndef f():\n    return 1\n```"
+    assert key(code) != key(code.replace("    return", "  return"))
+    assert key("| a  | b |") != key("| a | b |")
+    assert normalize_text("  - 缩进的列表项") == "  - 缩进的列表项"
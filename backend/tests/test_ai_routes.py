@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+from app.routes.ai import parse_event_id
+from app.services.ai_cache import response_cache
+from app.services.ai_scheduler import SchedulerRejected, ai_scheduler
+from app.services.ai_service import ai_service
+from app.services.single_flight import single_flight
+
+pytestmark = pytest.mark.anyio
+
+CHUNKS = ["第一段", "内容，", "第二段", "内容。"]
+
+
+def parse_events(body: str) -> list[tuple[str | None, str]]:
+    """把 SSE 响应体解析成 (id, data) 列表"""
+    events = []
+    for block in body.split("\n\n"):
+        event_id = data = None
+        for line in block.split("\n"):
+            if line.startswith("id: "):
+                event_id = line[4:]
+            elif line.startswith("data: "):
+                data = line[6:]
+        if data is not None:
+            events.append((event_id, data))
+    return events
+
+
+def content_of(events) -> str:
+    return "".join(json.loads(data).get("content", "") for _, data in events if data != "[DONE]")
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """替换上游调用：产出第一个 chunk 后等待 release，记录调用次数"""
+    state = {"calls": 0, "started": asyncio.Event(), "release": asyncio.Event()}
+
+    async def fake_stream(text, note_id=None):
+        state["calls"] += 1
+        yield CHUNKS[0]
+        state["started"].set()
+        await state["release"].wait()
+        for chunk in CHUNKS[1:]:
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    monkeypatch.setattr(ai_service, "process_text_stream", fake_stream)
+    return state
+
+
+async def test_concurrent_identical_requests_share_one_upstream_call(client, upstream):
+    body = {"text": "合并测试 join"}
+    first = asyncio.create_task(client.post("/api/ai/process", json=body))
+    await upstream["started"].wait()
+    joined_before = single_flight.joined
+    second = asyncio.create_task(client.post("/api/ai/process", json=body))
+    await asyncio.sleep(0.05)
+    upstream["release"].set()
+    responses = await asyncio.gather(first, second)
+
+    assert [response.status_code for response in responses] == [200, 200]
+    for response in responses:
+        events = parse_events(response.text)
+        assert events[-1][1] == "[DONE]"
+        assert content_of(events) == "".join(CHUNKS)
+    assert upstream["calls"] == 1
+    assert single_flight.joined == joined_before + 1
+
+
+async def test_resume_with_last_event_id(client, upstream):
+    body = {"text": "续传测试 resume"}
+    upstream["release"].set()
+    response = await client.post("/api/ai/process", json=body)
+    assert response.status_code == 200
+    events = [event for event in parse_events(response.text) if event[0]]
+    first_id = events[0][0]
+    flight_id, index = parse_event_id(first_id)
+
+    resumed = await client.post("/api/ai/process", json=body, headers={"Last-Event-ID": first_id})
+    assert resumed.status_code == 200
+    resumed_events = parse_events(resumed.text)
+    assert resumed_events[-1][1] == "[DONE]"
+    assert content_of(resumed_events) == "".join(CHUNKS[index + 1:])
+    # 续传的是同一次调用，没有重新请求上游
+    assert all(parse_event_id(event_id)[0] == flight_id for event_id, _ in resumed_events if event_id)
+    assert upstream["calls"] == 1
+
+
+async def test_resume_with_compression(client, upstream, monkeypatch):
+    monkeypatch.setattr("app.routes.ai.SSE_ENCODINGS", ["gzip"])
+    body = {"text": "续传测试 gzip"}
+    upstream["release"].set()
+    response = await client.post("/api/ai/process", json=body, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    first_id = next(event_id for event_id, _ in parse_events(response.text) if event_id)
+
+    resumed = await client.post(
+        "/api/ai/process", json=body, headers={"Accept-Encoding": "gzip", "Last-Event-ID": first_id}
+    )
+    assert resumed.status_code == 200
+    assert resumed.headers["content-encoding"] == "gzip"
+    assert parse_events(resumed.text)[-1][1] == "[DONE]"
+
+
+@pytest.fixture
+def scheduler_rejects(monkeypatch):
+    """让准入调度拒绝所有新的生成，用来验证哪些请求不经过准入"""
+    def reject(*args):
+        raise SchedulerRejected("rate", "请求过于频繁", 1)
+
+    monkeypatch.setattr(ai_scheduler, "check", reject)
+    monkeypatch.setattr(ai_scheduler, "submit", reject)
+
+
+async def test_cache_hit_and_expired_resume_skip_admission(client, upstream, scheduler_rejects, monkeypatch):
+    monkeypatch.setattr(response_cache, "enabled", True)
+    body = {"text": "缓存测试 replay"}
+    assert (await client.post("/api/ai/process", json=body)).status_code == 429
+
+    await response_cache.set(ai_service.cache_key(body["text"]), CHUNKS, 1.0)
+    for headers in ({}, {"Last-Event-ID": "expired-3"}):
+        response = await client.post("/api/ai/process", json=body, headers=headers)
+        assert response.status_code == 200
+        events = parse_events(response.text)
+        assert events[-1][1] == "[DONE]"
+        assert content_of(events) == "".join(CHUNKS)
+    assert upstream["calls"] == 0
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from app.services.ai_scheduler import AIScheduler, SchedulerRejected, TokenBucket, estimate_tokens
+
+
+def make_scheduler(**overrides) -> AIScheduler:
+    options = {"max_active": 1, "max_queue": 100, "user_max_active": 5, "user_max_queue": 100}
+    options.update(overrides)
+    return AIScheduler(**options)
+
+
+def rejected_reason(scheduler: AIScheduler, user_id: str, tokens: int = 1) -> str:
+    with pytest.raises(SchedulerRejected) as info:
+        scheduler.submit(user_id, user_id, tokens)
+    return info.value.reason
+
+
+def test_estimate_tokens_counts_utf8_bytes():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("中文") == 2
+
+
+def test_weighted_round_robin_order():
+    scheduler = make_scheduler(weights={"a": 2})
+    running = scheduler.submit("a", "a", 1)
+    assert running.granted
+    tickets = {name: scheduler.submit(name[0], name[0], 1) for name in ("a2", "a3", "a4")}
+    tickets.update({name: scheduler.submit(name[0], name[0], 1) for name in ("b1", "b2")})
+    assert {name: ticket.position for name, ticket in tickets.items()} == {
+        "a2": 1, "a3": 2, "b1": 3, "a4": 4, "b2": 5,
+    }
+
+    order = []
+    while scheduler.queued:
+        scheduler.release(running)
+        running = next(ticket for ticket in tickets.values() if ticket.granted and not ticket.finished)
+        order.append(next(name for name, ticket in tickets.items() if ticket is running))
+    # a 的权重为 2：连续拿到两个名额后轮到 b
+    assert order == ["a2", "a3", "b1", "a4", "b2"]
+    assert scheduler.stats()["waitingUsers"] == 0
+
+
+def test_heavy_user_queue_does_not_delay_other_users():
+    scheduler = make_scheduler()
+    scheduler.submit("heavy", "heavy", 1)
+    heavy = [scheduler.submit("heavy", "heavy", 1) for _ in range(5)]
+    light = scheduler.submit("light", "light", 1)
+    # 轻度用户排在重度用户队列的第一个请求之后，而不是整个队列之后
+    assert light.position == 2
+    assert [ticket.position for ticket in heavy] == [1, 3, 4, 5, 6]
+
+
+def test_per_user_active_cap_and_dispatch_skips_busy_user():
+    scheduler = make_scheduler(max_active=2, user_max_active=1)
+    a1 = scheduler.submit("a", "a", 1)
+    a2 = scheduler.submit("a", "a", 1)
+    b1 = scheduler.submit("b", "b", 1)
+    assert a1.granted and not a2.granted and b1.granted
+
+    # a 仍有一个生成在进行，空出的名额不能给 a2
+    scheduler.release(b1)
+    assert not a2.granted
+    assert scheduler.active == 1
+
+    scheduler.release(a1)
+    assert a2.granted
+    assert scheduler.stats()["queued"] == 0
+
+
+def test_queue_limits():
+    scheduler = make_scheduler(max_active=1, max_queue=2, user_max_active=1, user_max_queue=1)
+    scheduler.submit("a", "a", 1)
+    scheduler.submit("a", "a", 1)
+    assert rejected_reason(scheduler, "a") == "user_queue"
+    scheduler.submit("b", "b", 1)
+    assert rejected_reason(scheduler, "c") == "queue"
+    assert scheduler.stats()["rejected"] == 2
+
+
+def test_release_while_queued_updates_positions():
+    scheduler = make_scheduler()
+    scheduler.submit("a", "a", 1)
+    first = scheduler.submit("b", "b", 1)
+    second = scheduler.submit("c", "c", 1)
+    assert (first.position, second.position) == (1, 2)
+    scheduler.release(first)
+    assert second.position == 1
+    assert scheduler.queued == 1
+    # 重复释放没有影响
+    scheduler.release(first)
+    assert scheduler.queued == 1
+
+
+def test_request_rate_limit():
+    scheduler = make_scheduler(max_active=10, requests_per_minute=2)
+    for _ in range(2):
+        scheduler.release(scheduler.submit("a", "a", 1))
+    with pytest.raises(SchedulerRejected) as info:
+        scheduler.check("a", "a", 1)
+    assert info.value.reason == "rate"
+    assert 25 <= info.value.retry_after <= 30
+    # 其他用户不受影响
+    scheduler.check("b", "b", 1)
+
+
+def test_token_budget_reserve_and_settlement():
+    scheduler = make_scheduler(max_active=10, tokens_per_hour=1000)
+    ticket = scheduler.submit("a", "a", 600)
+    # 预扣了 600，剩余额度不够再预扣 600
+    with pytest.raises(SchedulerRejected) as info:
+        scheduler.check("a", "a", 600)
+    assert info.value.reason == "budget"
+    assert info.value.retry_after == pytest.approx(200 * 3.6, abs=2)
+
+    # 实际只用了 100，退回 500
+    scheduler.release(ticket, 100)
+    scheduler.check("a", "a", 600)
+
+    # 实际用量超出预扣时按实际扣除
+    ticket = scheduler.submit("a", "a", 100)
+    scheduler.release(ticket, 800)
+    assert scheduler._users["a"].budget.tokens == pytest.approx(100, abs=1)
+
+
+def test_queued_request_released_without_running_refunds_budget():
+    scheduler = make_scheduler(tokens_per_hour=1000)
+    scheduler.submit("a", "a", 100)
+    queued = scheduler.submit("a", "a", 500)
+    scheduler.release(queued)
+    assert scheduler._users["a"].budget.tokens == pytest.approx(900, abs=1)
+
+
+def test_token_bucket_allows_oversized_request_when_full():
+    bucket = TokenBucket(capacity=10, rate=1)
+    assert bucket.retry_after(50) == 0
+    bucket.take(50)
+    assert bucket.retry_after(1) == pytest.approx(41, abs=0.1)
+
+
+@pytest.mark.anyio
+async def test_wait_reports_positions_until_granted():
+    scheduler = make_scheduler()
+    running = scheduler.submit("a", "a", 1)
+    ahead = scheduler.submit("b", "b", 1)
+    ticket = scheduler.submit("c", "c", 1)
+    positions = []
+
+    async def waiter():
+        async for position in scheduler.wait(ticket):
+            positions.append(position)
+
+    task = asyncio.create_task(waiter())
+    await asyncio.sleep(0)
+    scheduler.release(running)
+    await asyncio.sleep(0)
+    assert ahead.granted and not task.done()
+    scheduler.release(ahead)
+    await asyncio.wait_for(task, 1)
+    assert positions == [2, 1]
+    assert ticket.granted
@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+from app.websocket.backplane import MemoryBackplane, RedisBackplane
+from app.websocket import handlers
+from app.websocket.handlers import ConnectionManager, user_channel
+from benchmarks import fake_redis
+
+pytestmark = pytest.mark.anyio
+
+
+async def start_server(handler) -> tuple[asyncio.AbstractServer, str]:
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"redis://127.0.0.1:{port}/0"
+
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def test_publish_pipelines_through_redis():
+    server, url = await start_server(fake_redis.handle)
+    received = []
+
+    async def on_message(channel, data):
+        received.append((channel, data))
+
+    publisher, subscriber = RedisBackplane(url, timeout=1), RedisBackplane(url, timeout=1)
+    await publisher.start(on_message)
+    await subscriber.start(on_message)
+    try:
+        await subscriber.subscribe("user:1")
+        await asyncio.sleep(0.05)
+        for i in range(200):
+            await publisher.publish("user:1", f"消息 {i}")
+        await wait_until(lambda: len(received) == 200)
+        assert received == [("user:1", f"消息 {i}") for i in range(200)]
+        await wait_until(lambda: publisher.stats()["published"] == 200)
+    finally:
+        await publisher.stop()
+        await subscriber.stop()
+        server.close()
+        await server.wait_closed()
+
+
+async def test_publish_does_not_wait_for_unresponsive_redis():
+    async def silent(reader, writer):
+        # 接受连接但从不回复
+        await reader.read()
+
+    server, url = await start_server(silent)
+    backplane = RedisBackplane(url, timeout=0.1)
+    backplane._publisher = asyncio.create_task(backplane._publish_loop())
+    try:
+        start = asyncio.get_running_loop().time()
+        for _ in range(50):
+            await backplane.publish("user:1", "x")
+        assert asyncio.get_running_loop().time() - start < 0.05
+        await wait_until(lambda: backplane.dropped == 50)
+        assert backplane.published == 0
+    finally:
+        await backplane.stop()
+        server.close()
+        await server.wait_closed()
+
+
+async def test_error_replies_are_logged_not_raised():
+    async def rejecting(reader, writer):
+        while await reader.readline():
+            # 每条命令 7 行：*3 以及三个参数各两行
+            for _ in range(6):
+                await reader.readline()
+            writer.write(b"-ERR read only replica\r\n")
+            await writer.drain()
+
+    server, url = await start_server(rejecting)
+    backplane = RedisBackplane(url, timeout=1)
+    backplane._publisher = asyncio.create_task(backplane._publish_loop())
+    try:
+        await backplane.publish("user:1", "a")
+        await backplane.publish("user:1", "b")
+        await wait_until(lambda: backplane.dropped == 2)
+        assert not backplane._publisher.done()
+    finally:
+        await backplane.stop()
+        server.close()
+        await server.wait_closed()
+
+
+class FakeClient:
+    def __init__(self):
+        self.websocket = object()
+        self.queued = []
+
+    def enqueue(self, text, conflate_key=None):
+        self.queued.append((text, conflate_key))
+
+
+class CapturingBackplane(MemoryBackplane):
+    def __init__(self):
+        super().__init__("capture")
+        self.frames = []
+
+    async def publish(self, channel: str, data: str):
+        self.frames.append((channel, data))
+
+
+async def test_frame_keeps_conflate_keys_with_spaces(monkeypatch):
+    sender = ConnectionManager(CapturingBackplane())
+    receiver = ConnectionManager(MemoryBackplane("frame-test"))
+    client = FakeClient()
+    receiver.user_connections["u1"] = {client}
+
+    message = {"type": "import_progress", "payload": {"text": "a b\nc"}}
+    await sender.broadcast_to_user("u1", message, conflate_key="import: a b\nc")
+    await sender.broadcast_to_user("u1", {"type": "ping"})
+    # 模拟另一个进程收到这些消息
+    monkeypatch.setattr(handlers, "PROCESS_ID", "other-process")
+    for channel, data in sender.backplane.frames:
+        assert channel == user_channel("u1")
+        await receiver._on_backplane_message(channel, data)
+    assert client.queued == [
+        (json.dumps(message, ensure_ascii=False), "import: a b\nc"),
+        (json.dumps({"type": "ping"}), None),
+    ]
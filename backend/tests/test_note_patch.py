@@ -0,0 +1,56 @@
+import pytest
+
+from app.services.note_patch import PatchError, apply_ops, diff_ops
+
+
+def test_ops_apply_in_order():
+    ops = [
+        {"pos": 0, "delete": 5, "insert": "Hi"},
+        # 位置相对于前一个操作之后的文本
+        {"pos": 2, "insert": ","},
+        {"pos": 9, "delete": 0, "insert": "!"},
+    ]
+    assert apply_ops("Hello world", ops) == "Hi, world!"
+
+
+def test_positions_count_unicode_characters():
+    assert apply_ops("笔记😀内容", [{"pos": 3, "delete": 2, "insert": "正文"}]) == "笔记😀正文"
+
+
+def test_empty_ops_keep_content():
+    assert apply_ops("abc", []) == "abc"
+
+
+def test_delete_to_end():
+    assert apply_ops("abc", [{"pos": 1, "delete": 2}]) == "a"
+
+
+@pytest.mark.parametrize("ops", [
+    [{"pos": 4, "insert": "x"}],
+    [{"pos": 1, "delete": 3}],
+    [{"pos": -1}],
+    [{"pos": 0, "delete": -1}],
+    [{"pos": "0"}],
+    [{"insert": "x"}],
+    [{"pos": 0, "insert": 1}],
+    ["not an op"],
+    {"pos": 0},
+])
+def test_invalid_ops_raise(ops):
+    with pytest.raises(PatchError):
+        apply_ops("abc", ops)
+
+
+@pytest.mark.parametrize("old,new", [
+    ("abc", "abc"),
+    ("", "新内容"),
+    ("删除全部", ""),
+    ("Hello world", "Hello, world!"),
+    ("笔记😀内容", "笔记😀正文内容"),
+    ("aaaa", "aa"),
+])
+def test_diff_ops_round_trip(old, new):
+    ops = diff_ops(old, new)
+    assert apply_ops(old, ops) == new
+    assert len(ops) <= 1
+    assert (ops == []) == (old == new)
@@ -0,0 +1,120 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.models import Base, Note, User
+from app.services.note_search import html_to_text, init_search_index
+
+pytestmark = pytest.mark.anyio
+
+
+async def search(client, q: str) -> list[dict]:
+    response = await client.get("/api/notes/search", params={"q": q})
+    assert response.status_code == 200
+    return response.json()["items"]
+
+
+def add_note(user_id: str, title: str, content: str) -> str:
+    with Session(engine) as db:
+        note = Note(user_id=user_id, title=title, content=content)
+        db.add(note)
+        db.commit()
+        return note.id
+
+
+async def test_search_only_returns_own_notes(client, user):
+    other = User(username=f"other_{user.id[:8]}", password_hash="-")
+    with Session(engine, expire_on_commit=False) as db:
+        db.add(other)
+        db.commit()
+    add_note(other.id, "别人的 quokka", "<p>别人的 quokka 笔记</p>")
+    mine = add_note(user.id, "我的 quokka", "<p>我的 <b>quokka</b> 笔记</p>")
+
+    items = await search(client, "quokka")
+    assert [item["id"] for item in items] == [mine]
+    assert items[0]["titleHighlight"] == "我的 <mark>quokka</mark>"
+    # 少于3个字符的词不走 trigram 匹配，同样只在自己的笔记里查找
+    assert [item["id"] for item in await search(client, "我的")] == [mine]
+    assert await search(client, "别人") == []
+
+
+async def test_index_follows_updates_and_deletes(client):
+    note_id = (await client.post("/api/notes", json={"title": "索引", "content": "<p>wombat</p>"})).json()["id"]
+    assert [item["id"] for item in await search(client, "wombat")] == [note_id]
+
+    await client.put(f"/api/notes/{note_id}", json={"content": "<p>numbat</p>"})
+    assert await search(client, "wombat") == []
+    assert [item["id"] for item in await search(client, "numbat")] == [note_id]
+
+    assert (await client.delete(f"/api/notes/{note_id}")).status_code == 204
+    assert await search(client, "numbat") == []
+
+
+def sqlite_engine(path):
+    sync_engine = create_engine(f"sqlite:///{path}")
+    event.listen(sync_engine, "connect", lambda conn, _: conn.create_function(
+        "notes_plain_text", 1, html_to_text, deterministic=True))
+    Base.metadata.create_all(sync_engine)
+    return sync_engine
+
+
+def fts_matches(conn, query: str) -> list[str]:
+    return conn.execute(text(
+        "SELECT notes.id FROM notes_fts JOIN notes ON notes.id = notes_fts.note_id "
+        "WHERE notes_fts MATCH :q ORDER BY notes.id"
+    ), {"q": query}).scalars().all()
+
+
+def test_migrates_legacy_index(tmp_path):
+    legacy = sqlite_engine(tmp_path / "legacy.db")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE VIRTUAL TABLE notes_fts USING fts5(note_id, user_id, title, body, tokenize = 'trigram')"))
+        conn.execute(text(
+            "CREATE TRIGGER notes_fts_after_insert AFTER INSERT ON notes BEGIN "
+            "INSERT INTO notes_fts (note_id, user_id, title, body) VALUES (new.id, new.user_id, new.title, new.content); END"
+        ))
+        conn.execute(User.__table__.insert().values(id="u1", username="legacy", password_hash="-"))
+        conn.execute(Note.__table__.insert().values(id="n1", user_id="u1", title="旧笔记", content="<p>pangolin</p>"))
+
+    init_search_index(legacy)
+    with legacy.begin() as conn:
+        columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(notes_fts)")]
+        assert columns == ["note_id", "title", "body"]
+        assert fts_matches(conn, "pangolin") == ["n1"]
+        # 新的触发器按 rowid 维护索引
+        conn.execute(text("DELETE FROM notes WHERE id = 'n1'"))
+        assert conn.execute(text("SELECT count(*) FROM notes_fts")).scalar() == 0
+    legacy.dispose()
+
+
+def test_index_survives_vacuum(tmp_path):
+    db = sqlite_engine(tmp_path / "vacuum.db")
+    init_search_index(db)
+    with db.begin() as conn:
+        conn.execute(User.__table__.insert().values(id="u1", username="vacuum", password_hash="-"))
+        for i in range(1, 4):
+            conn.execute(Note.__table__.insert().values(id=f"n{i}", user_id="u1", title="笔记", content="<p>capybara</p>"))
+        conn.execute(text("DELETE FROM notes WHERE id = 'n1'"))
+    # VACUUM 可能重新编号没有 INTEGER PRIMARY KEY 的表的隐式 rowid，索引键不能依赖它们；
+    # VACUUM 是否真的重新编号取决于 SQLite 版本，这里再直接改写 rowid 模拟这种情况
+    with db.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    with db.begin() as conn:
+        conn.execute(text("UPDATE notes SET rowid = rowid - 1"))
+        conn.execute(text("UPDATE users SET rowid = rowid + 7"))
+    with db.begin() as conn:
+        conn.execute(text("UPDATE notes SET content = '<p>tapir</p>' WHERE id = 'n3'"))
+        conn.execute(text("DELETE FROM notes WHERE id = 'n2'"))
+        conn.execute(Note.__table__.insert().values(id="n4", user_id="u1", title="笔记", content="<p>capybara</p>"))
+        assert fts_matches(conn, "capybara") == ["n4"]
+        assert fts_matches(conn, "tapir") == ["n3"]
+        assert conn.execute(text("SELECT count(*) FROM notes_fts")).scalar() == 2
+    db.dispose()
+
+
+async def test_ranks_title_and_repeated_matches_first(client, user):
+    body_once = add_note(user.id, "普通", "<p>正文里提到一次 axolotl</p>")
+    body_twice = add_note(user.id, "普通", "<p>axolotl 和 Axolotl 各一次</p>")
+    in_title = add_note(user.id, "Axolotl 饲养", "<p>没有关键词</p>")
+    assert [item["id"] for item in await search(client, "axolotl")] == [in_title, body_twice, body_once]
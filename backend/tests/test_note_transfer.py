@@ -0,0 +1,65 @@
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+
+from app.services import note_transfer
+from app.services.note_transfer import EXPORT_UPLOADS_PREFIX, referenced_uploads
+
+LEGACY = "0123456789abcdef0123456789abcdef.png"
+
+
+def make_archive(files: dict[str, bytes]) -> zipfile.ZipFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(EXPORT_UPLOADS_PREFIX + name, data)
+    return zipfile.ZipFile(buffer)
+
+
+def restore(archive: zipfile.ZipFile, name: str) -> bool:
+    return note_transfer._restore_upload(archive, archive.getinfo(EXPORT_UPLOADS_PREFIX + name))
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(note_transfer, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_referenced_uploads_accepts_hashed_and_legacy_names():
+    hashed = "a" * 64 + ".jpg"
+    content = (
+        f'<img src="/static/uploads/{hashed}"><img src="/static/uploads/{LEGACY}">'
+        '<img src="/static/uploads/abc.png"><img src="/static/uploads/../secret.png">'
+    )
+    assert list(referenced_uploads(content)) == [hashed, LEGACY]
+
+
+def test_restore_checks_hash_of_hashed_names(upload_dir):
+    data = b"image bytes"
+    good = hashlib.sha256(data).hexdigest() + ".png"
+    bad = "b" * 64 + ".png"
+    archive = make_archive({good: data, bad: data})
+    assert restore(archive, good)
+    assert not restore(archive, bad)
+    assert sorted(os.listdir(upload_dir)) == [good]
+
+
+def test_restore_keeps_legacy_names_without_hash_check(upload_dir):
+    archive = make_archive({LEGACY: b"legacy image"})
+    assert restore(archive, LEGACY)
+    assert (upload_dir / LEGACY).read_bytes() == b"legacy image"
+
+    # 已有的同名文件不会被导入包覆盖
+    assert restore(make_archive({LEGACY: b"other"}), LEGACY)
+    assert (upload_dir / LEGACY).read_bytes() == b"legacy image"
+
+
+def test_restore_rejects_other_names(upload_dir):
+    archive = make_archive({"abc.png": b"x", "../escape.png": b"x"})
+    assert not restore(archive, "abc.png")
+    assert not restore(archive, "../escape.png")
+    assert os.listdir(upload_dir) == []
@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.database import engine
+from app.models import Note, NoteTombstone, SyncCounter
+from app.services.change_feed import TOMBSTONE_HORIZON
+from app.routes import notes as notes_routes
+from app.websocket.handlers import manager
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_notes(client, count: int) -> list[str]:
+    ids = []
+    for i in range(count):
+        response = await client.post("/api/notes", json={"title": f"笔记 {i}", "content": f"<p>内容 {i}</p>"})
+        assert response.status_code == 201
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def test_summaries_keyset_pagination(client, user):
+    ids = await create_notes(client, 7)
+    # 一部分笔记的更新时间相同，靠 id 区分先后
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    with engine.begin() as conn:
+        for i, note_id in enumerate(ids):
+            conn.execute(update(Note).where(Note.id == note_id).values(updated_at=base + timedelta(minutes=i // 3)))
+        expected = list(conn.execute(
+            select(Note.id).where(Note.user_id == user.id).order_by(Note.updated_at.desc(), Note.id.desc())
+        ).scalars())
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/api/notes/summaries", params=params)).json()
+        assert len(page["items"]) <= 3
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+async def test_summaries_rejects_invalid_cursor(client):
+    response = await client.get("/api/notes/summaries", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+async def test_change_feed_cursor_and_tombstones(client):
+    ids = await create_notes(client, 3)
+    page = (await client.get("/api/notes/changes", params={"since": "0"})).json()
+    assert [change["id"] for change in page["changes"]] == ids
+    assert not page["hasMore"] and not page["resetRequired"]
+    seqs = [change["seq"] for change in page["changes"]]
+    assert seqs == sorted(seqs) and page["cursor"] == str(seqs[-1])
+    cursor = page["cursor"]
+
+    # 游标之后没有变更
+    page = (await client.get("/api/notes/changes", params={"since": cursor})).json()
+    assert page == {"changes": [], "cursor": cursor, "hasMore": False, "resetRequired": False}
+
+    await client.put(f"/api/notes/{ids[0]}", json={"content": "<p>改过</p>"})
+    assert (await client.delete(f"/api/notes/{ids[1]}")).status_code == 204
+    page = (await client.get("/api/notes/changes", params={"since": cursor})).json()
+    changes = page["changes"]
+    assert [(change["id"], change["deleted"]) for change in changes] == [(ids[0], False), (ids[1], True)]
+    assert changes[0]["version"] == 2
+    assert changes[1]["version"] is None
+    assert int(page["cursor"]) == changes[-1]["seq"] > int(cursor)
+
+    # 分页：hasMore 为真时从返回的游标继续
+    first = (await client.get("/api/notes/changes", params={"since": "0", "limit": 2})).json()
+    assert first["hasMore"] and len(first["changes"]) == 2
+    rest = (await client.get("/api/notes/changes", params={"since": first["cursor"], "limit": 10})).json()
+    assert not rest["hasMore"]
+    assert [c["id"] for c in first["changes"] + rest["changes"]] == [ids[2], ids[0], ids[1]]
+
+
+async def test_change_feed_batch_delete_writes_tombstones(client, user):
+    ids = await create_notes(client, 3)
+    cursor = (await client.get("/api/notes/changes", params={"since": "0"})).json()["cursor"]
+    response = await client.post("/api/notes/batch/delete", json={"ids": ids[:2] + ["missing"]})
+    assert [item["status"] for item in response.json()["items"]] == [204, 204, 404]
+
+    page = (await client.get("/api/notes/changes", params={"since": cursor})).json()
+    assert sorted(change["id"] for change in page["changes"]) == sorted(ids[:2])
+    assert all(change["deleted"] for change in page["changes"])
+    with engine.connect() as conn:
+        tombstones = set(conn.execute(select(NoteTombstone.note_id).where(NoteTombstone.user_id == user.id)).scalars())
+    assert tombstones == set(ids[:2])
+
+
+async def test_change_feed_requires_reset_after_purged_tombstones(client):
+    await create_notes(client, 1)
+    with engine.begin() as conn:
+        horizon = conn.execute(select(SyncCounter.value).where(SyncCounter.name == TOMBSTONE_HORIZON)).scalar_one()
+        conn.execute(update(SyncCounter).where(SyncCounter.name == TOMBSTONE_HORIZON).values(value=horizon + 10**9))
+    try:
+        page = (await client.get("/api/notes/changes", params={"since": "0"})).json()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(update(SyncCounter).where(SyncCounter.name == TOMBSTONE_HORIZON).values(value=horizon))
+    assert page["resetRequired"]
+    assert page["changes"] == []
+
+
+async def test_changes_rejects_invalid_cursor(client):
+    assert (await client.get("/api/notes/changes", params={"since": "abc"})).status_code == 400
+
+
+async def test_rest_patch_broadcasts_delta(client, user, monkeypatch):
+    note_id = (await create_notes(client, 1))[0]
+    sent = []
+
+    async def capture(user_id, message, exclude=None, conflate_key=None):
+        sent.append((user_id, message))
+
+    monkeypatch.setattr(manager, "broadcast_to_user", capture)
+    ops = [{"pos": 3, "delete": 0, "insert": "新"}]
+    response = await client.patch(f"/api/notes/{note_id}", json={"baseVersion": 1, "ops": ops})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+
+    assert len(sent) == 1
+    user_id, message = sent[0]
+    assert user_id == user.id
+    assert message["type"] == "note_patch"
+    delta = message["payload"]
+    assert (delta["id"], delta["baseVersion"], delta["version"]) == (note_id, 1, 2)
+    assert delta["ops"] == ops and "title" not in delta
+
+    # 版本冲突的补丁不广播
+    response = await client.patch(f"/api/notes/{note_id}", json={"baseVersion": 1, "ops": ops})
+    assert response.status_code == 409
+    assert len(sent) == 1
+
+
+async def test_listing_etag_and_cursor_track_change_seq(client):
+    ids = await create_notes(client, 2)
+    listing = await client.get("/api/notes")
+    etag = listing.headers["etag"]
+    cursor = (await client.get("/api/notes/changes", params={"since": "0"})).json()["cursor"]
+    assert listing.headers["x-change-cursor"] == cursor
+    assert (await client.get("/api/notes", headers={"If-None-Match": etag})).status_code == 304
+
+    # 数量、版本号之和与最新更新时间都不变，只有变更序号不同
+    with engine.begin() as conn:
+        conn.execute(update(Note).where(Note.id == ids[0]).values(change_seq=Note.change_seq + 100))
+    listing = await client.get("/api/notes", headers={"If-None-Match": etag})
+    assert listing.status_code == 200
+    assert listing.headers["etag"] != etag
+
+    # 删除记录的序号也计入游标，之后的增量同步不会再返回这次删除
+    assert (await client.delete(f"/api/notes/{ids[0]}")).status_code == 204
+    listing = await client.get("/api/notes")
+    cursor = (await client.get("/api/notes/changes", params={"since": "0"})).json()["cursor"]
+    assert listing.headers["x-change-cursor"] == cursor
+    page = (await client.get("/api/notes/changes", params={"since": cursor})).json()
+    assert page["changes"] == []
+
+
+async def test_import_id_is_validated(client):
+    body = '{"title": "导入", "content": "<p>x</p>"}\n'
+    headers = {"Content-Type": "application/x-ndjson"}
+    for bad in ["a b", "x" * 65, "进度", "a:b"]:
+        response = await client.post("/api/notes/import", params={"import_id": bad}, content=body, headers=headers)
+        assert response.status_code == 422
+    response = await client.post("/api/notes/import", params={"import_id": "tab-1_A"}, content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["importId"] == "tab-1_A"
+
+
+async def test_put_broadcasts_delta(client, user, monkeypatch):
+    note_id = (await create_notes(client, 1))[0]
+    sent = []
+
+    async def capture(user_id, message, exclude=None, conflate_key=None):
+        sent.append(message)
+
+    monkeypatch.setattr(manager, "broadcast_to_user", capture)
+    response = await client.put(f"/api/notes/{note_id}", json={"content": "<p>内容 0 补充</p>"})
+    assert response.status_code == 200 and response.json()["version"] == 2
+    delta = sent[0]["payload"]
+    assert sent[0]["type"] == "note_patch"
+    assert (delta["baseVersion"], delta["version"]) == (1, 2)
+    assert delta["ops"] == [{"pos": 7, "delete": 0, "insert": " 补充"}]
+    assert "title" not in delta
+
+    # 内容没有变化时不写入也不广播
+    response = await client.put(f"/api/notes/{note_id}", json={"content": "<p>内容 0 补充</p>"})
+    assert response.json()["version"] == 2
+    assert len(sent) == 1
+
+
+async def test_put_and_delete_conflict_with_concurrent_write(client, monkeypatch):
+    note_id = (await create_notes(client, 1))[0]
+    load = notes_routes.get_user_note
+
+    async def load_then_conflict(db, note_id, user_id):
+        note = await load(db, note_id, user_id)
+        # 读取之后、提交之前笔记被其他请求修改
+        with engine.begin() as conn:
+            conn.execute(update(Note).where(Note.id == note_id).values(version=Note.version + 1))
+        return note
+
+    monkeypatch.setattr(notes_routes, "get_user_note", load_then_conflict)
+    response = await client.put(f"/api/notes/{note_id}", json={"title": "冲突"})
+    assert response.status_code == 409
+    assert response.json()["version"] == 2
+    response = await client.delete(f"/api/notes/{note_id}")
+    assert response.status_code == 409
+    assert response.json()["version"] == 3
+    monkeypatch.undo()
+    assert (await client.get(f"/api/notes/{note_id}")).json()["title"] == "笔记 0"
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.password_hasher import HasherBusy, PasswordHasher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cancelled_waiter_keeps_slot_until_worker_finishes():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    release = threading.Event()
+    waiter = asyncio.create_task(hasher._run(release.wait))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    # 工作线程仍在计算，名额不能因为等待者被取消而提前释放
+    assert hasher.pending == 1
+    with pytest.raises(HasherBusy):
+        await hasher._run(release.wait)
+
+    release.set()
+    for _ in range(100):
+        if hasher.pending == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert hasher.pending == 0
+    assert hasher.completed == 1
+    assert await hasher._run(lambda: "ok") == "ok"
+    hasher.shutdown()
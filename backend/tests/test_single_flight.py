@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+def upstream(chunks, delay=0.0, calls=None):
+    """按顺序产出 chunks 的上游调用，delay 为每个 chunk 之前的等待"""
+    async def factory():
+        if calls is not None:
+            calls.append(1)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+    return factory
+
+
+async def collect(stream) -> list:
+    return [item async for item in stream]
+
+
+async def test_join_shares_one_upstream_call():
+    flights = SingleFlight()
+    calls = []
+    factory = upstream(["a", "b", "c"], delay=0.01, calls=calls)
+    first = flights.join("key", factory)
+    await asyncio.sleep(0.015)
+    second = flights.join("key", factory)
+    assert second is first
+    assert flights.in_flight("key")
+
+    results = await asyncio.gather(collect(flights.subscribe(first)), collect(flights.subscribe(second)))
+    # 后加入的订阅者先收到已经产出的 chunk
+    assert results == [[(0, "a"), (1, "b"), (2, "c")]] * 2
+    assert len(calls) == 1
+    assert not flights.in_flight("key")
+    assert flights.stats()["joined"] == 1
+
+
+async def test_resume_after_completion():
+    flights = SingleFlight(retain_seconds=60, max_retained=10)
+    flight = flights.join("key", upstream(["a", "b", "c"]))
+    await collect(flights.subscribe(flight))
+
+    assert flights.resume(flight.id, "other") is None
+    assert flights.resume("missing", "key") is None
+    resumed = flights.resume(flight.id, "key")
+    assert resumed is flight
+    assert await collect(flights.subscribe(resumed, start=2)) == [(2, "c")]
+    assert flights.stats()["resumed"] == 1
+
+
+async def test_finished_flights_are_not_retained_without_retain_seconds():
+    flights = SingleFlight()
+    flight = flights.join("key", upstream(["a"]))
+    await collect(flights.subscribe(flight))
+    assert flights.resume(flight.id, "key") is None
+
+
+async def test_abandoned_flight_is_cancelled_after_grace():
+    flights = SingleFlight(grace_seconds=0.05, retain_seconds=60, max_retained=10)
+    flight = flights.join("key", upstream(["a"] * 100, delay=0.01))
+    stream = flights.subscribe(flight)
+    assert await anext(stream) == (0, "a")
+    await stream.aclose()
+    assert not flight.task.done()
+
+    await asyncio.sleep(0.1)
+    assert flight.task.done()
+    assert flight.cancelled
+    assert not flights.in_flight("key")
+    # 被取消的调用不能续传，重新请求会启动新的调用
+    assert flights.resume(flight.id, "key") is None
+    assert flights.join("key", upstream(["b"])) is not flight
+    assert flights.stats()["abandoned"] == 1
+
+
+async def test_resubscribe_within_grace_keeps_flight():
+    flights = SingleFlight(grace_seconds=0.1, retain_seconds=60, max_retained=10)
+    flight = flights.join("key", upstream(["a"] * 20, delay=0.01))
+    stream = flights.subscribe(flight)
+    await anext(stream)
+    await stream.aclose()
+    await asyncio.sleep(0.02)
+
+    resumed = flights.resume(flight.id, "key")
+    assert resumed is flight
+    chunks = await collect(flights.subscribe(resumed, start=1))
+    assert [index for index, _ in chunks] == list(range(1, 20))
+    assert not flight.cancelled
+    assert flights.stats()["abandoned"] == 0
+
+
+async def test_subscribe_batches_coalesces_within_window():
+    flights = SingleFlight()
+    chunks = [str(i) for i in range(20)]
+    flight = flights.join("key", upstream(chunks, delay=0.005))
+    batches = await collect(flights.subscribe_batches(flight, window=0.05))
+
+    # 第一批不等待，之后按窗口合并
+    assert batches[0] == (0, ["0"])
+    assert len(batches) < len(chunks) / 2
+    assert [chunk for _, batch in batches for chunk in batch] == chunks
+    assert [last for last, _ in batches] == sorted({last for last, _ in batches})
+    assert batches[-1][0] == len(chunks) - 1
+
+
+async def test_subscribe_batches_without_window_sends_each_chunk():
+    flights = SingleFlight()
+    flight = flights.join("key", upstream(["a", "b", "c"]))
+    await asyncio.sleep(0.01)
+    # 调用已经结束，积压的 chunk 也逐个产出
+    batches = await collect(flights.subscribe_batches(flight, window=0))
+    assert batches == [(0, ["a"]), (1, ["b"]), (2, ["c"])]
+
+
+async def test_subscribe_batches_flushes_at_max_chars():
+    flights = SingleFlight()
+    flight = flights.join("key", upstream(["ab"] * 6, delay=0.005))
+    batches = await collect(flights.subscribe_batches(flight, window=10, max_chars=4))
+    # 窗口很长，只有累积到 max_chars 或调用结束时才发送
+    assert all(sum(map(len, batch)) >= 4 for _, batch in batches[1:-1])
+    assert "".join(chunk for _, batch in batches for chunk in batch) == "ab" * 6
+
+
+async def test_upstream_error_reaches_subscribers():
+    flights = SingleFlight()
+
+    async def failing():
+        yield "a"
+        raise RuntimeError("boom")
+
+    flight = flights.join("key", failing)
+    received = []
+    with pytest.raises(RuntimeError):
+        async for item in flights.subscribe(flight):
+            received.append(item)
+    assert received == [(0, "a")]
@@ -0,0 +1,36 @@
+import pytest
+
+from app.services.text_splitter import split_document
+
+HTML_DOC = "".join(
+    f"<h2>第{i}节</h2><p>{'这是一段用来测试切分的正文。' * 8}</p><ul><li>要点一</li><li>要点二</li></ul>"
+    for i in range(20)
+)
+MARKDOWN_DOC = "\n\n".join(f"## 标题 {i}\n\n" + "Some sentence here. " * 15 for i in range(15))
+# 没有任何段落边界的长句，只能按句子或硬切
+RUN_ON = "没有标点的长文本" * 500
+SENTENCES = "短句。" * 600
+
+
+@pytest.mark.parametrize("text", [HTML_DOC, MARKDOWN_DOC, RUN_ON, SENTENCES, "很短的文本"])
+@pytest.mark.parametrize("max_chars", [200, 1500])
+def test_chunks_concatenate_to_original(text, max_chars):
+    chunks = split_document(text, max_chars)
+    assert "".join(chunks) == text
+    # 很短的片段可以并入下一个片段，最多超出上限的十分之一
+    assert all(len(chunk) <= max_chars * 1.1 for chunk in chunks)
+
+
+def test_does_not_split_inside_lists():
+    items = "".join(f"<li>{'列表项内容' * 10}</li>" for i in range(10))
+    text = f"<p>{'前文' * 50}</p><ul>{items}</ul><p>{'后文' * 50}</p>"
+    chunks = split_document(text, 800)
+    assert "".join(chunks) == text
+    for chunk in chunks:
+        assert chunk.count("<ul>") == chunk.count("</ul>")
+
+
+def test_headings_start_new_chunks():
+    chunks = split_document(HTML_DOC, 1500)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("<h2>") for chunk in chunks)
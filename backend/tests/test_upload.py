@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from app.main import app
+from app.services import upload_store
+
+pytestmark = pytest.mark.anyio
+
+JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + b"\x00" * 64
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_store, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+async def upload(client, filename: str, content: bytes) -> str:
+    response = await client.post("/upload", files={"file": (filename, content)})
+    assert response.status_code == 200
+    return response.json()["url"]
+
+
+async def test_same_image_with_different_extensions_is_stored_once(client, upload_dir):
+    urls = {await upload(client, name, JPEG) for name in ("a.jpg", "b.jpeg", "c.JPG", "photo.png")}
+    assert len(urls) == 1
+    assert urls.pop().endswith(".jpg")
+    assert len(os.listdir(upload_dir)) == 1
+
+
+async def test_unrecognized_content_keeps_normalized_extension(client):
+    assert (await upload(client, "notes.HTM", b"<p>hello</p>")).endswith(".html")
+    assert (await upload(client, "data", b"plain bytes")).rpartition("/")[2].isalnum()
+
+
+def test_openapi_documents_file_field():
+    body = app.openapi()["paths"]["/upload"]["post"]["requestBody"]
+    schema = body["content"]["multipart/form-data"]["schema"]
+    assert schema["properties"]["file"] == {"type": "string", "format": "binary"}
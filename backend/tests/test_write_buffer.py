@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import update
+
+from app.database import engine
+from app.models import Note
+from app.websocket import handlers
+from app.websocket.write_buffer import note_write_buffer
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_note(client, content: str = "<p>原文</p>") -> dict:
+    response = await client.post("/api/notes", json={"title": "缓冲", "content": content})
+    assert response.status_code == 201
+    return response.json()
+
+
+async def test_read_paths_see_buffered_edits(client):
+    note = await create_note(client)
+    etag = (await client.get("/api/notes")).headers["etag"]
+
+    # WebSocket 编辑只进入内存缓冲（测试中后台写回任务没有启动）
+    await note_write_buffer.update(note["id"], content="<p>缓冲中的新内容 zebra</p>")
+
+    listing = await client.get("/api/notes", headers={"If-None-Match": etag})
+    assert listing.status_code == 200
+    assert listing.json()[0]["content"] == "<p>缓冲中的新内容 zebra</p>"
+
+    await note_write_buffer.update(note["id"], content="<p>再次修改 giraffe</p>")
+    summaries = (await client.get("/api/notes/summaries")).json()
+    assert summaries["items"][0]["preview"] == "再次修改 giraffe"
+
+    await note_write_buffer.update(note["id"], content="<p>第三次 platypus</p>")
+    results = (await client.get("/api/notes/search", params={"q": "platypus"})).json()
+    assert [item["id"] for item in results["items"]] == [note["id"]]
+
+
+async def test_flush_conflict_notifies_owner(client, monkeypatch):
+    note = await create_note(client)
+    sent = []
+
+    async def capture(user_id, message, exclude=None, conflate_key=None):
+        sent.append((user_id, message))
+
+    monkeypatch.setattr(handlers.manager, "broadcast_to_user", capture)
+    await note_write_buffer.update(note["id"], content="<p>不会被保存的修改</p>")
+    # 写回之前笔记在数据库中被修改了
+    with engine.begin() as conn:
+        conn.execute(update(Note).where(Note.id == note["id"]).values(content="<p>别处的修改</p>", version=5))
+
+    conflicts = note_write_buffer.conflicts
+    await note_write_buffer.flush_note(note["id"])
+    assert note_write_buffer.conflicts == conflicts + 1
+    assert len(sent) == 1
+    user_id, message = sent[0]
+    assert message["type"] == "note_conflict"
+    assert message["payload"]["content"] == "<p>别处的修改</p>"
+    assert message["payload"]["version"] == 5
+    assert (await client.get(f"/api/notes/{note['id']}")).json()["content"] == "<p>别处的修改</p>"
+
+
+class FakeClient:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.websocket = object()
+        self.sent = []
+
+    def send(self, message: dict):
+        self.sent.append(message)
+
+
+async def test_ws_update_broadcasts_delta(client, user, monkeypatch):
+    note = await create_note(client, "<p>原文</p>")
+    sent = []
+
+    async def capture(user_id, message, exclude=None, conflate_key=None):
+        sent.append((message, exclude))
+
+    monkeypatch.setattr(handlers.manager, "broadcast_to_user", capture)
+    ws = FakeClient(user.id)
+    payload = {"id": note["id"], "title": "缓冲", "content": "<p>原文和补充</p>"}
+    assert await handlers.handle_note_update(ws, payload) == note["id"]
+
+    message, exclude = sent[0]
+    assert exclude is ws.websocket
+    assert message["type"] == "note_patch"
+    delta = message["payload"]
+    assert (delta["baseVersion"], delta["version"]) == (1, 2)
+    # 标题没有变化，只发送内容差异
+    assert "title" not in delta and "content" not in delta
+    assert delta["ops"] == [{"pos": 5, "delete": 0, "insert": "和补充"}]
+    note_write_buffer.discard(note["id"])
+
+
+async def test_unchanged_update_is_not_an_edit(client, user, monkeypatch):
+    note = await create_note(client, "<p>原文</p>")
+    sent = []
+
+    async def capture(user_id, message, exclude=None, conflate_key=None):
+        sent.append(message)
+
+    monkeypatch.setattr(handlers.manager, "broadcast_to_user", capture)
+    # REST 保存之后客户端回传同样的内容
+    payload = {"id": note["id"], "title": note["title"], "content": note["content"]}
+    assert await handlers.handle_note_update(FakeClient(user.id), payload) is None
+    buffered = await note_write_buffer.get(note["id"])
+    assert buffered.version == 1 and not buffered.dirty
+    assert sent == []
+    note_write_buffer.discard(note["id"])
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import select
+
+from app.database import engine
+from app.models import Note
+from app.services.note_patch import VersionConflict
+from app.websocket.write_buffer import NoteWriteBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+def make_buffer(write_through: bool) -> NoteWriteBuffer:
+    return NoteWriteBuffer(flush_interval=60, max_edits=1000, max_chars=10**6, write_through=write_through)
+
+
+def stored(note_id: str) -> tuple[str, int]:
+    with engine.connect() as conn:
+        row = conn.execute(select(Note.content, Note.version).where(Note.id == note_id)).one()
+    return row.content, row.version
+
+
+async def create_note(client) -> str:
+    response = await client.post("/api/notes", json={"title": "多进程", "content": "abc"})
+    return response.json()["id"]
+
+
+async def test_separate_buffers_lose_edits_to_version_check(client):
+    """两个进程各自缓冲同一条笔记：后写回的一方被丢弃并报告冲突（说明缓冲要求单一写入者）"""
+    note_id = await create_note(client)
+    first, second = make_buffer(False), make_buffer(False)
+    await first.update(note_id, content="first")
+    await second.update(note_id, content="second")
+    await first.flush_all()
+    await second.flush_all()
+    assert stored(note_id) == ("first", 2)
+    assert (first.conflicts, second.conflicts) == (0, 1)
+
+
+async def test_write_through_buffers_do_not_overwrite_each_other(client):
+    note_id = await create_note(client)
+    first, second = make_buffer(True), make_buffer(True)
+    # 两个进程都打开了这条笔记
+    assert (await first.get(note_id)).version == 1
+    assert (await second.get(note_id)).version == 1
+
+    await first.patch(note_id, 1, [{"pos": 3, "insert": "d"}])
+    assert stored(note_id) == ("abcd", 2)
+    # 第二个进程基于数据库中的最新版本编辑
+    await second.patch(note_id, 2, [{"pos": 4, "insert": "e"}])
+    assert stored(note_id) == ("abcde", 3)
+    await first.update(note_id, title="改名")
+    assert stored(note_id) == ("abcde", 4)
+
+    # 基于旧版本的补丁被拒绝，而不是确认之后再丢弃
+    with pytest.raises(VersionConflict) as info:
+        await second.patch(note_id, 3, [{"pos": 0, "insert": "x"}])
+    assert info.value.current_version == 4
+    assert stored(note_id) == ("abcde", 4)
+    assert first.conflicts == second.conflicts == 0
+
+
+async def test_write_through_conflict_when_database_changes_between_load_and_write(client, monkeypatch):
+    note_id = await create_note(client)
+    buffer = make_buffer(True)
+    other = make_buffer(True)
+    original_write = buffer._write
+
+    async def racing_write(snapshots):
+        # 另一个进程在这次写回之前抢先写入
+        await other.update(note_id, content="other")
+        return await original_write(snapshots)
+
+    monkeypatch.setattr(buffer, "_write", racing_write)
+    with pytest.raises(VersionConflict) as info:
+        await buffer.update(note_id, content="mine")
+    assert info.value.current_version == 2
+    assert stored(note_id) == ("other", 2)
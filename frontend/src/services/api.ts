@@ -1,5 +1,13 @@
 import axios from 'axios'
-import type { Note, CreateNoteDto, UpdateNoteDto } from '@/types'
+import type {
+  Note,
+  CreateNoteDto,
+  UpdateNoteDto,
+  NoteBatchItemResult,
+  NoteChangePage,
+  NoteBatchUpdateItem,
+  NoteImportResult
+} from '@/types'
 import { API_BASE_URL } from '@/utils/config'
 
 const api = axios.create({
@@ -41,9 +49,15 @@ api.interceptors.response.use(
 )
 
 export const notesApi = {
-  // 获取所有笔记
-  getAllNotes: async (): Promise<Note[]> => {
+  // 获取所有笔记，同时返回之后增量同步使用的游标
+  getAllNotes: async (): Promise<{ notes: Note[]; cursor: string | null }> => {
     const response = await api.get<Note[]>('/notes')
+    return { notes: response.data, cursor: response.headers['x-change-cursor'] ?? null }
+  },
+
+  // 获取游标之后的变更（只有ID和版本）
+  getChanges: async (since: string, limit = 500): Promise<NoteChangePage> => {
+    const response = await api.get<NoteChangePage>('/notes/changes', { params: { since, limit } })
     return response.data
   },
 
@@ -68,6 +82,41 @@ export const notesApi = {
   // 删除笔记
   deleteNote: async (id: string): Promise<void> => {
     await api.delete(`/notes/${id}`)
+  },
+
+  // 批量获取笔记，结果按传入顺序逐项返回
+  batchGetNotes: async (ids: string[]): Promise<NoteBatchItemResult[]> => {
+    const response = await api.post<{ items: NoteBatchItemResult[] }>('/notes/batch/get', { ids })
+    return response.data.items
+  },
+
+  // 批量更新笔记（同一个事务）
+  batchUpdateNotes: async (items: NoteBatchUpdateItem[]): Promise<NoteBatchItemResult[]> => {
+    const response = await api.post<{ items: NoteBatchItemResult[] }>('/notes/batch/update', { items })
+    return response.data.items
+  },
+
+  // 批量删除笔记（同一个事务）
+  batchDeleteNotes: async (ids: string[]): Promise<NoteBatchItemResult[]> => {
+    const response = await api.post<{ items: NoteBatchItemResult[] }>('/notes/batch/delete', { ids })
+    return response.data.items
+  },
+
+  // 批量导入（.ndjson 或 .zip），进度通过 WebSocket 的 import_progress 消息推送
+  importNotes: async (file: File, importId?: string): Promise<NoteImportResult> => {
+    const isZip = file.name.toLowerCase().endsWith('.zip')
+    const response = await api.post<NoteImportResult>('/notes/import', file, {
+      params: importId ? { import_id: importId } : undefined,
+      headers: { 'Content-Type': isZip ? 'application/zip' : 'application/x-ndjson' },
+      timeout: 0
+    })
+    return response.data
+  },
+
+  // 导出全部笔记，zip 中包含笔记引用的图片
+  exportNotes: async (format: 'zip' | 'ndjson' = 'zip'): Promise<Blob> => {
+    const response = await api.get('/notes/export', { params: { format }, responseType: 'blob', timeout: 0 })
+    return response.data
   }
 }
 
@@ -100,69 +149,131 @@ export const authApi = {
   }
 }
 
+// 流式处理断线后的重连次数和间隔
+const AI_STREAM_MAX_RETRIES = 3
+const AI_STREAM_RETRY_DELAY_MS = 1000
+
+export interface AIStreamOptions {
+  // 中止时关闭连接，服务端随后取消上游调用
+  signal?: AbortSignal
+  // 续传失败、服务端重新生成时调用，调用方应丢弃已收到的内容
+  onReset?: () => void
+  // 服务端排队时调用，position 为前面还有几个请求（1 表示下一个）
+  onQueued?: (position: number) => void
+}
+
 export const aiApi = {
-  // 处理文本（流式）
+  // 处理文本（流式），网络中断时带 Last-Event-ID 重连续传
   processText: async function* (
     text: string,
-    noteId?: string
+    noteId?: string,
+    options: AIStreamOptions = {}
   ): AsyncGenerator<string, void, unknown> {
-    const token = localStorage.getItem('token')
-    const headers: HeadersInit = {
-      'Content-Type': 'application/json'
-    }
-    if (token) {
-      headers.Authorization = `Bearer ${token}`
-    }
+    const { signal, onReset, onQueued } = options
+    // 事件 id 为 <flight id>-<序号>
+    let lastEventId: string | null = null
+    let retries = 0
 
-    const response = await fetch(`${API_BASE_URL}/api/ai/process`, {
-      method: 'POST',
-      headers,
-      body: JSON.stringify({ text, note_id: noteId })
-    })
+    while (true) {
+      const token = localStorage.getItem('token')
+      const headers: Record<string, string> = {
+        'Content-Type': 'application/json'
+      }
+      if (token) {
+        headers.Authorization = `Bearer ${token}`
+      }
+      if (lastEventId) {
+        headers['Last-Event-ID'] = lastEventId
+      }
 
-    if (!response.body) {
-      throw new Error('Response body is null')
-    }
+      let reader: ReadableStreamDefaultReader<Uint8Array> | null = null
+      try {
+        const response = await fetch(`${API_BASE_URL}/api/ai/process`, {
+          method: 'POST',
+          headers,
+          body: JSON.stringify({ text, note_id: noteId }),
+          signal
+        })
+        if (!response.ok) {
+          // 429 表示超出频率、用量或排队上限，detail 中有提示，Retry-After 为建议的等待秒数
+          const body = await response.json().catch(() => null)
+          const retryAfter = response.headers.get('Retry-After')
+          const message = body?.detail || `AI处理失败（HTTP ${response.status}）`
+          throw new Error(response.status === 429 && retryAfter ? `${message}（${retryAfter}秒后可重试）` : message)
+        }
+        if (!response.body) {
+          throw new Error('Response body is null')
+        }
 
-    const reader = response.body.getReader()
-    const decoder = new TextDecoder()
+        reader = response.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ''
 
-    try {
-      while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
+        while (true) {
+          const { done, value } = await reader.read()
+          if (done) break
 
-        const chunk = decoder.decode(value, { stream: true })
-        const lines = chunk.split('\n')
+          buffer += decoder.decode(value, { stream: true })
+          // 事件之间以空行分隔，最后一段可能不完整，留到下次
+          const events = buffer.split('\n\n')
+          buffer = events.pop() ?? ''
 
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const data = line.slice(6)
+          for (const event of events) {
+            let id: string | null = null
+            let data: string | null = null
+            for (const line of event.split('\n')) {
+              if (line.startsWith('id: ')) {
+                id = line.slice(4)
+              } else if (line.startsWith('data: ')) {
+                data = line.slice(6)
+              }
+            }
+            if (data === null) continue
             if (data === '[DONE]') {
               return
             }
+
+            let parsed: { content?: string; error?: string; queue?: { position: number } }
             try {
-              const parsed = JSON.parse(data)
-              if (parsed.content) {
-                yield parsed.content
-              } else if (parsed.error) {
-                // 处理错误信息
-                throw new Error(parsed.error)
-              }
-            } catch (parseError) {
-              // 如果是错误信息，抛出异常
-              if (parseError instanceof Error) {
-                throw parseError
-              }
-              // 其他解析错误忽略
+              parsed = JSON.parse(data)
+            } catch {
               console.warn('解析SSE数据失败:', data)
+              continue
+            }
+            if (parsed.error) {
+              throw new Error(parsed.error)
+            }
+            if (parsed.queue) {
+              onQueued?.(parsed.queue.position)
+              continue
+            }
+            if (id) {
+              // 服务端找不到原来的生成时会重新开始，flight id 随之改变
+              if (lastEventId && id.split('-')[0] !== lastEventId.split('-')[0]) {
+                onReset?.()
+              }
+              lastEventId = id
+              retries = 0
+            }
+            if (parsed.content) {
+              yield parsed.content
             }
           }
         }
+        // 连接在 [DONE] 之前结束，按断线处理
+        throw new TypeError('AI响应流意外结束')
+      } catch (err) {
+        // 只有网络错误才重连；服务端返回的错误和主动中止直接抛出
+        if (signal?.aborted || !(err instanceof TypeError) || retries >= AI_STREAM_MAX_RETRIES) {
+          throw err
+        }
+        retries += 1
+        await new Promise((resolve) => setTimeout(resolve, AI_STREAM_RETRY_DELAY_MS))
+      } finally {
+        // 提前退出（调用方 break 或出错）时关闭响应流，服务端会检测到断开
+        reader?.cancel().catch(() => {})
+        reader?.releaseLock()
       }
-    } finally {
-      reader.releaseLock()
     }
   }
 }
-
@@ -12,8 +12,9 @@ export const uploadApi = {
   async uploadImage(file: File): Promise<string> {
     const formData = new FormData()
     formData.append('file', file)
-    const resp = await uploadClient.post<{ url: string }>('/upload', formData)
-    return resp.data.url
+    const resp = await uploadClient.post<{ url: string; variants?: Record<string, string> }>('/upload', formData)
+    // 编辑器内嵌使用压缩后的中等尺寸图，原图仍可通过 url 访问
+    return resp.data.variants?.medium ?? resp.data.url
   }
 }
 
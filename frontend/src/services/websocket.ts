@@ -8,16 +8,31 @@ class WebSocketService {
   private reconnectDelay = 1000
   private listeners: Map<string, Set<(data: unknown) => void>> = new Map()
   private heartbeatInterval: number | null = null
+  private noteId?: string
+  private closedByClient = false
 
   connect(noteId?: string): void {
     if (this.ws?.readyState === WebSocket.OPEN) {
       return
     }
+    if (noteId !== undefined) {
+      this.noteId = noteId
+    }
+
+    // 服务端按用户鉴权和推送，未登录时不建立连接
+    const token = localStorage.getItem('token')
+    if (!token) {
+      return
+    }
 
     try {
-      // 如果提供了noteId，添加到查询参数
-      const url = noteId ? `${WS_URL}?note_id=${noteId}` : WS_URL
-      this.ws = new WebSocket(url)
+      // 浏览器的 WebSocket 不能设置请求头，token 通过查询参数传递
+      const params = new URLSearchParams({ token })
+      if (this.noteId) {
+        params.set('note_id', this.noteId)
+      }
+      this.closedByClient = false
+      this.ws = new WebSocket(`${WS_URL}?${params.toString()}`)
 
       this.ws.onopen = () => {
         console.log('WebSocket connected')
@@ -44,7 +59,9 @@ class WebSocketService {
         console.log('WebSocket disconnected')
         this.stopHeartbeat()
         this.emit('disconnected', {})
-        this.attemptReconnect()
+        if (!this.closedByClient) {
+          this.attemptReconnect()
+        }
       }
     } catch (error) {
       console.error('Failed to create WebSocket connection:', error)
@@ -52,6 +69,18 @@ class WebSocketService {
     }
   }
 
+  // 登录、退出后用新的 token 重新连接（没有 token 时只断开）
+  reconnect(): void {
+    this.stopHeartbeat()
+    if (this.ws) {
+      this.closedByClient = true
+      this.ws.close()
+      this.ws = null
+    }
+    this.reconnectAttempts = 0
+    this.connect()
+  }
+
   private attemptReconnect(): void {
     if (this.reconnectAttempts >= this.maxReconnectAttempts) {
       console.error('Max reconnection attempts reached')
@@ -114,6 +143,7 @@ class WebSocketService {
   disconnect(): void {
     this.stopHeartbeat()
     if (this.ws) {
+      this.closedByClient = true
       this.ws.close()
       this.ws = null
     }
@@ -3,6 +3,7 @@ import notesModule from './modules/notes'
 import aiModule from './modules/ai'
 import authModule from './modules/auth'
 import { wsService } from '@/services/websocket'
+import type { NotePatchEvent } from '@/types'
 
 const store = createStore({
   modules: {
@@ -18,6 +19,17 @@ wsService.on('note_update', (data) => {
   store.commit('notes/UPDATE_NOTE', note)
 })
 
+// 其他编辑器（其他标签页、REST 补丁）的修改只广播增量
+wsService.on('note_patch', (data) => {
+  store.dispatch('notes/applyRemotePatch', data as NotePatchEvent)
+})
+
+// 服务端暂存的编辑没能保存（笔记已在别处被修改），用服务端保存的内容替换本地显示的内容
+wsService.on('note_conflict', (data) => {
+  const note = data as { id: string; title: string; content: string; createdAt: string; updatedAt: string }
+  store.commit('notes/UPDATE_NOTE', note)
+})
+
 wsService.on('note_create', (data) => {
   const note = data as { id: string; title: string; content: string; createdAt: string; updatedAt: string }
   store.commit('notes/ADD_NOTE', note)
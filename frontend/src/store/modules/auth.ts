@@ -1,5 +1,6 @@
 import { Module } from 'vuex'
 import { authApi } from '@/services/api'
+import { wsService } from '@/services/websocket'
 
 interface User {
   id: string
@@ -42,6 +43,7 @@ const authModule: Module<AuthState, unknown> = {
       } else {
         localStorage.removeItem('token')
       }
+      wsService.reconnect()
     },
 
     SET_USER(state: AuthState, user: User | null) {
@@ -54,6 +56,7 @@ const authModule: Module<AuthState, unknown> = {
       state.token = null
       state.isAuthenticated = false
       localStorage.removeItem('token')
+      wsService.reconnect()
     }
   },
 
@@ -121,6 +124,9 @@ const authModule: Module<AuthState, unknown> = {
 
     logout({ commit }: { commit: any }) {
       commit('LOGOUT')
+      // 清掉上一个用户的笔记和同步游标
+      commit('notes/SET_NOTES', [], { root: true })
+      commit('notes/SET_CHANGE_CURSOR', null, { root: true })
     }
   },
 
@@ -1,15 +1,21 @@
 import { Module } from 'vuex'
-import type { Note, CreateNoteDto, UpdateNoteDto } from '@/types'
+import type { Note, CreateNoteDto, UpdateNoteDto, NotePatchEvent } from '@/types'
 import { notesApi } from '@/services/api'
 import { wsService } from '@/services/websocket'
+import { applyOps } from '@/utils/textOps'
 
 interface NotesState {
   notes: Note[]
   currentNote: Note | null
   loading: boolean
   error: string | null
+  // 增量同步游标，为空时需要全量获取
+  changeCursor: string | null
 }
 
+// 每次批量获取的笔记数，与后端 notes_batch_max_items 一致
+const BATCH_GET_SIZE = 500
+
 const notesModule: Module<NotesState, unknown> = {
   namespaced: true,
 
@@ -17,7 +23,8 @@ const notesModule: Module<NotesState, unknown> = {
     notes: [],
     currentNote: null,
     loading: false,
-    error: null
+    error: null,
+    changeCursor: null
   }),
 
   mutations: {
@@ -56,6 +63,10 @@ const notesModule: Module<NotesState, unknown> = {
 
     SET_CURRENT_NOTE(state: NotesState, note: Note | null) {
       state.currentNote = note
+    },
+
+    SET_CHANGE_CURSOR(state: NotesState, cursor: string | null) {
+      state.changeCursor = cursor
     }
   },
 
@@ -64,8 +75,9 @@ const notesModule: Module<NotesState, unknown> = {
       commit('SET_LOADING', true)
       commit('SET_ERROR', null)
       try {
-        const notes = await notesApi.getAllNotes()
+        const { notes, cursor } = await notesApi.getAllNotes()
         commit('SET_NOTES', notes)
+        commit('SET_CHANGE_CURSOR', cursor)
       } catch (error) {
         const message = error instanceof Error ? error.message : '获取笔记失败'
         commit('SET_ERROR', message)
@@ -112,16 +124,8 @@ const notesModule: Module<NotesState, unknown> = {
       commit('SET_ERROR', null)
       try {
         const note = await notesApi.updateNote(id, data)
+        // 服务端保存后会把修改以 note_patch 广播给其他标签页，不需要再通过 WebSocket 回传
         commit('UPDATE_NOTE', note)
-        
-        // 通过WebSocket同步更新
-        if (wsService.isConnected()) {
-          wsService.send({
-            type: 'note_update',
-            payload: note
-          })
-        }
-        
         return note
       } catch (error) {
         const message = error instanceof Error ? error.message : '更新笔记失败'
@@ -132,6 +136,114 @@ const notesModule: Module<NotesState, unknown> = {
       }
     },
 
+    // 增量同步：只获取上次同步之后变化的笔记，没有游标或游标过旧时退回全量获取
+    async syncChanges({ state, commit, dispatch }: { state: NotesState; commit: any; dispatch: any }) {
+      if (state.changeCursor === null) {
+        return dispatch('fetchNotes')
+      }
+      let cursor = state.changeCursor
+      const changed = new Map<string, number | null>()
+      let hasMore = true
+      while (hasMore) {
+        const page = await notesApi.getChanges(cursor)
+        if (page.resetRequired) {
+          return dispatch('fetchNotes')
+        }
+        for (const change of page.changes) {
+          if (change.deleted) {
+            changed.delete(change.id)
+            commit('DELETE_NOTE', change.id)
+          } else {
+            changed.set(change.id, change.version)
+          }
+        }
+        cursor = page.cursor
+        hasMore = page.hasMore
+      }
+
+      // 本地已经是同一版本的笔记（例如自己刚保存的）不必重新获取
+      const ids = [...changed.entries()]
+        .filter(([id, version]) => state.notes.find((n) => n.id === id)?.version !== version)
+        .map(([id]) => id)
+      for (let i = 0; i < ids.length; i += BATCH_GET_SIZE) {
+        const results = await notesApi.batchGetNotes(ids.slice(i, i + BATCH_GET_SIZE))
+        for (const result of results) {
+          if (result.status !== 200 || !result.note) continue
+          if (state.notes.some((n) => n.id === result.id)) {
+            commit('UPDATE_NOTE', result.note)
+          } else {
+            commit('ADD_NOTE', result.note)
+          }
+        }
+      }
+      commit('SET_CHANGE_CURSOR', cursor)
+    },
+
+    // 其他编辑器的修改以增量广播：本地正好是 baseVersion 时直接应用，否则重新获取这条笔记
+    async applyRemotePatch(
+      { state, commit, dispatch }: { state: NotesState; commit: any; dispatch: any },
+      patch: NotePatchEvent
+    ) {
+      const note = state.notes.find((n) => n.id === patch.id) ??
+        (state.currentNote?.id === patch.id ? state.currentNote : null)
+      if (!note || (note.version !== undefined && note.version >= patch.version)) return
+      if (note.version === patch.baseVersion) {
+        try {
+          commit('UPDATE_NOTE', {
+            ...note,
+            content: applyOps(note.content, patch.ops),
+            title: patch.title ?? note.title,
+            version: patch.version,
+            updatedAt: patch.updatedAt
+          })
+          return
+        } catch (error) {
+          console.warn('应用远程补丁失败，重新获取笔记:', error)
+        }
+      }
+      await dispatch('refreshNotes', [patch.id])
+    },
+
+    // 一次请求刷新多条笔记（例如同步多个打开的标签页）
+    async refreshNotes({ commit }: { commit: any }, ids: string[]) {
+      if (ids.length === 0) return []
+      const results = await notesApi.batchGetNotes(ids)
+      for (const result of results) {
+        if (result.status === 200 && result.note) {
+          commit('UPDATE_NOTE', result.note)
+        } else if (result.status === 404) {
+          commit('DELETE_NOTE', result.id)
+        }
+      }
+      return results
+    },
+
+    async deleteNotes({ commit }: { commit: any }, ids: string[]) {
+      commit('SET_LOADING', true)
+      commit('SET_ERROR', null)
+      try {
+        const results = await notesApi.batchDeleteNotes(ids)
+        for (const result of results) {
+          if (result.status === 204 || result.status === 404) {
+            commit('DELETE_NOTE', result.id)
+            if (result.status === 204 && wsService.isConnected()) {
+              wsService.send({
+                type: 'note_delete',
+                payload: { id: result.id }
+              })
+            }
+          }
+        }
+        return results
+      } catch (error) {
+        const message = error instanceof Error ? error.message : '删除笔记失败'
+        commit('SET_ERROR', message)
+        throw error
+      } finally {
+        commit('SET_LOADING', false)
+      }
+    },
+
     async deleteNote({ commit }: { commit: any }, id: string) {
       commit('SET_LOADING', true)
       commit('SET_ERROR', null)
@@ -160,7 +272,8 @@ const notesModule: Module<NotesState, unknown> = {
     notes: (state: NotesState) => state.notes,
     currentNote: (state: NotesState) => state.currentNote,
     loading: (state: NotesState) => state.loading,
-    error: (state: NotesState) => state.error
+    error: (state: NotesState) => state.error,
+    changeCursor: (state: NotesState) => state.changeCursor
   }
 }
 
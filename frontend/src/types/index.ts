@@ -4,6 +4,23 @@ export interface Note {
   content: string
   createdAt: string
   updatedAt: string
+  version?: number
+}
+
+export interface TextOp {
+  pos: number
+  delete?: number
+  insert?: string
+}
+
+// WebSocket note_patch：在 baseVersion 版本上应用 ops 得到 version 版本
+export interface NotePatchEvent {
+  id: string
+  baseVersion: number
+  version: number
+  ops: TextOp[]
+  updatedAt: string
+  title?: string
 }
 
 export interface CreateNoteDto {
@@ -16,6 +33,42 @@ export interface UpdateNoteDto {
   content?: string
 }
 
+export interface NoteChange {
+  id: string
+  seq: number
+  version: number | null
+  updatedAt: string | null
+  deleted: boolean
+}
+
+export interface NoteChangePage {
+  changes: NoteChange[]
+  cursor: string
+  hasMore: boolean
+  resetRequired: boolean
+}
+
+export interface NoteBatchItemResult {
+  id: string
+  status: number
+  note?: Note | null
+  detail?: string | null
+  version?: number | null
+}
+
+export interface NoteBatchUpdateItem extends UpdateNoteDto {
+  id: string
+  baseVersion?: number
+}
+
+export interface NoteImportResult {
+  importId: string
+  imported: number
+  failed: number
+  uploads: number
+  errors: { at: string; detail: string }[]
+}
+
 export interface AIProcessRequest {
   text: string
   noteId?: string
@@ -26,7 +79,7 @@ export interface AIProcessResponse {
 }
 
 export interface WebSocketMessage {
-  type: 'note_update' | 'note_create' | 'note_delete' | 'collaboration' | 'ping'
+  type: 'note_update' | 'note_patch' | 'note_conflict' | 'note_create' | 'note_delete' | 'import_progress' | 'collaboration' | 'ping'
   payload: unknown
 }
 
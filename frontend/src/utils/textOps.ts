@@ -0,0 +1,15 @@
+import type { TextOp } from '@/types'
+
+// 按顺序应用文本操作，与后端 apply_ops 一致：位置按 Unicode 字符（码点）计算，
+// 且相对于前面的操作应用之后的文本
+export function applyOps(content: string, ops: TextOp[]): string {
+  let chars = Array.from(content)
+  for (const op of ops) {
+    const remove = op.delete ?? 0
+    if (op.pos < 0 || remove < 0 || op.pos + remove > chars.length) {
+      throw new RangeError(`补丁操作超出文本范围: pos=${op.pos}, delete=${remove}, 长度=${chars.length}`)
+    }
+    chars = [...chars.slice(0, op.pos), ...Array.from(op.insert ?? ''), ...chars.slice(op.pos + remove)]
+  }
+  return chars.join('')
+}